@@ -1,9 +1,10 @@
+import asyncio
 from logging.config import fileConfig
 from alembic import context
 # from sqlalchemy import engine_from_config
 # from sqlalchemy import pool
 
-from project.db.models import Base
+from project.db.models import Base, USER_SEARCH_FTS
 from project.db.database import engine
 
 
@@ -42,7 +43,7 @@ def run_migrations_offline() -> None:
     """
     # url = config.get_main_option("sqlalchemy.url")
     context.configure(
-        url=engine.url,
+        url=engine.url.render_as_string(hide_password=False),
         target_metadata=target_metadata,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
@@ -64,14 +65,43 @@ def run_migrations_online() -> None:
     #     prefix="sqlalchemy.",
     #     poolclass=pool.NullPool,
     # )
-    connectable = engine
-    with connectable.connect() as connection:
-        context.configure(
-            connection=connection, target_metadata=target_metadata
-        )
+    asyncio.run(run_async_migrations())
+
+
+def include_object_for(dialect_name: str):
+    """اشیای مخصوص دیتابیس دیگر (ddl_if) و جدول‌های FTS5 در مقایسه autogenerate نادیده گرفته می‌شوند"""
+    def include_object(obj, name, type_, reflected, compare_to):
+        if type_ == "table" and reflected and name.startswith(USER_SEARCH_FTS):
+            # جدول مجازی FTS5 و جدول‌های سایه آن خارج از مدل‌ها ساخته می‌شوند
+            return False
+        ddl_if = getattr(obj, "_ddl_if", None)
+        if ddl_if is not None and ddl_if.dialect is not None:
+            dialects = (ddl_if.dialect,) if isinstance(ddl_if.dialect, str) else ddl_if.dialect
+            return dialect_name in dialects
+        return True
+    return include_object
+
 
-        with context.begin_transaction():
-            context.run_migrations()
+def do_run_migrations(connection) -> None:
+    context.configure(
+        connection=connection,
+        target_metadata=target_metadata,
+        include_object=include_object_for(connection.dialect.name),
+    )
+
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+async def run_async_migrations() -> None:
+    """engine پروژه async است؛ مهاجرت‌ها داخل run_sync اجرا می‌شوند"""
+    connectable = engine
+    try:
+        async with connectable.connect() as connection:
+            await connection.run_sync(do_run_migrations)
+    finally:
+        # بدون dispose، خطای مهاجرت پروسه را در انتظار اتصال‌های aiosqlite نگه می‌دارد
+        await connectable.dispose()
 
 
 if context.is_offline_mode():
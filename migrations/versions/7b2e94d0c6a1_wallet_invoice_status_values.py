@@ -0,0 +1,48 @@
+"""wallet invoice status values
+
+Revision ID: 7b2e94d0c6a1
+Revises: d643f8b5cc41
+Create Date: 2026-10-18 12:20:07.554913
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7b2e94d0c6a1'
+down_revision: Union[str, Sequence[str], None] = 'd643f8b5cc41'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# ستون status از نام اعضای enum به مقدار آن‌ها (مثل 'waiting') تغییر می‌کند
+STATUS_VALUES = {
+    'PRE_FACTURE': 'pre_factore',
+    'WAITING': 'waiting',
+    'CONFIRMED': 'confirmed',
+    'REJECTED': 'rejected',
+    'PAY_WALLET': 'pay_wallet',
+    'CONFIGURATION_DIRECTE': 'configuration_directe',
+}
+
+
+def _rename(mapping: dict) -> None:
+    bind = op.get_bind()
+    for old, new in mapping.items():
+        if bind.dialect.name == 'postgresql':
+            op.execute(f"ALTER TYPE walletinvoicestatuschoices RENAME VALUE '{old}' TO '{new}'")
+        else:
+            op.execute(f"UPDATE wallet_recharge_invoices SET status = '{new}' WHERE status = '{old}'")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    _rename(STATUS_VALUES)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    _rename({new: old for old, new in STATUS_VALUES.items()})
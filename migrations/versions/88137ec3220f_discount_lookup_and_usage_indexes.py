@@ -0,0 +1,54 @@
+"""discount lookup and usage indexes
+
+Revision ID: 88137ec3220f
+Revises: 888fac794955
+Create Date: 2026-10-18 11:57:28.840036
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '88137ec3220f'
+down_revision: Union[str, Sequence[str], None] = '888fac794955'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # ردیف‌های تکراری استفاده هر کاربر از یک کد قبل از ساخت ایندکس یکتا در یک ردیف جمع می‌شوند
+    op.execute("UPDATE user_discount SET count_uses = 0 WHERE count_uses IS NULL")
+    op.execute(
+        "UPDATE user_discount SET count_uses = ("
+        "SELECT SUM(d.count_uses) FROM user_discount d "
+        "WHERE d.user_id = user_discount.user_id AND d.discount_id = user_discount.discount_id "
+        "AND d.user_type = user_discount.user_type"
+        ") WHERE id IN (SELECT MIN(id) FROM user_discount GROUP BY user_id, discount_id, user_type)"
+    )
+    op.execute(
+        "DELETE FROM user_discount WHERE id NOT IN ("
+        "SELECT keep_id FROM (SELECT MIN(id) AS keep_id FROM user_discount GROUP BY user_id, discount_id, user_type) keep"
+        ")"
+    )
+    op.create_index('ix_discount_seller_code', 'discount', ['seller_user_id', 'code'], unique=True)
+    with op.batch_alter_table('user_discount') as batch_op:
+        batch_op.alter_column('count_uses',
+               existing_type=sa.INTEGER(),
+               nullable=False,
+               server_default=sa.text('0'))
+    op.create_index('ix_user_discount_user_discount_type', 'user_discount', ['user_id', 'discount_id', 'user_type'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_user_discount_user_discount_type', table_name='user_discount')
+    with op.batch_alter_table('user_discount') as batch_op:
+        batch_op.alter_column('count_uses',
+               existing_type=sa.INTEGER(),
+               nullable=True,
+               server_default=None)
+    op.drop_index('ix_discount_seller_code', table_name='discount')
@@ -0,0 +1,64 @@
+"""user search
+
+Revision ID: a4eb35d86ede
+Revises: eb0352505e71
+Create Date: 2026-10-18 16:02:11.518204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from project.core.app_user.search import build_document
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a4eb35d86ede'
+down_revision: Union[str, Sequence[str], None] = 'eb0352505e71'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.create_table('user_search',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('document', sa.Text(), nullable=False),
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user_core.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id')
+    )
+    if dialect == 'postgresql':
+        op.create_index('ix_user_search_document_trgm', 'user_search', ['document'], unique=False, postgresql_using='gin', postgresql_ops={'document': 'gin_trgm_ops'})
+    elif dialect == 'sqlite':
+        op.execute("CREATE VIRTUAL TABLE user_search_fts USING fts5(document, tokenize='trigram')")
+
+    # ساخت سند جستجوی کاربران موجود با همان یکسان‌سازی مخزن
+    bind = op.get_bind()
+    rows = bind.execute(sa.text(
+        "SELECT u.id, u.first_name, u.last_name, r.phone_number, u.tel_chat_id, u.tel_user_id "
+        "FROM user_core u LEFT OUTER JOIN representatives_core r ON r.user_core = u.id"
+    )).all()
+    documents = [
+        {"user_id": row[0], "document": build_document(*row[1:])}
+        for row in rows
+    ]
+    if documents:
+        bind.execute(sa.text("INSERT INTO user_search (user_id, document) VALUES (:user_id, :document)"), documents)
+        if dialect == 'sqlite':
+            bind.execute(sa.text("INSERT INTO user_search_fts (rowid, document) VALUES (:user_id, :document)"), documents)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.drop_index('ix_user_search_document_trgm', table_name='user_search', postgresql_using='gin', postgresql_ops={'document': 'gin_trgm_ops'})
+    elif dialect == 'sqlite':
+        op.execute("DROP TABLE IF EXISTS user_search_fts")
+    op.drop_table('user_search')
@@ -0,0 +1,37 @@
+"""configuration panel
+
+Revision ID: baca42f67c51
+Revises: a4eb35d86ede
+Create Date: 2026-10-18 12:29:46.846457
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'baca42f67c51'
+down_revision: Union[str, Sequence[str], None] = 'a4eb35d86ede'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # sqlite افزودن کلید خارجی را فقط با بازسازی جدول (batch) پشتیبانی می‌کند
+    with op.batch_alter_table('configurations') as batch_op:
+        batch_op.add_column(sa.Column('panel_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key(
+            'fk_configurations_panel_id', 'configuration_panel_core', ['panel_id'], ['id'], ondelete='SET NULL'
+        )
+    op.create_index('ix_conf_panel_name', 'configurations', ['panel_id', 'name'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_conf_panel_name', table_name='configurations')
+    with op.batch_alter_table('configurations') as batch_op:
+        batch_op.drop_constraint('fk_configurations_panel_id', type_='foreignkey')
+        batch_op.drop_column('panel_id')
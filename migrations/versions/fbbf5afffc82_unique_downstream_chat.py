@@ -0,0 +1,41 @@
+"""unique downstream chat
+
+Revision ID: fbbf5afffc82
+Revises: b9b7d2effed4
+Create Date: 2026-10-18 12:33:47.558589
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'fbbf5afffc82'
+down_revision: Union[str, Sequence[str], None] = 'b9b7d2effed4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # کاربران تکراری را نمی‌توان خودکار ادغام کرد؛ باید قبل از مهاجرت دستی رفع شوند
+    duplicates = op.get_bind().execute(sa.text(
+        "SELECT upstream_id, tel_chat_id, COUNT(*) FROM user_core "
+        "WHERE upstream_id IS NOT NULL AND tel_chat_id IS NOT NULL "
+        "GROUP BY upstream_id, tel_chat_id HAVING COUNT(*) > 1"
+    )).all()
+    if duplicates:
+        raise RuntimeError(
+            "user_core has duplicate (upstream_id, tel_chat_id) pairs; resolve them before upgrading: "
+            + ", ".join(f"({upstream_id}, {tel_chat_id!r}) x{count}" for upstream_id, tel_chat_id, count in duplicates)
+        )
+    op.drop_index('ix_user_upstream_chat', table_name='user_core')
+    op.create_index('ix_user_upstream_chat', 'user_core', ['upstream_id', 'tel_chat_id'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_user_upstream_chat', table_name='user_core')
+    op.create_index('ix_user_upstream_chat', 'user_core', ['upstream_id', 'tel_chat_id'], unique=False)
@@ -1,12 +1,19 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+from typing import List
+
+from fastapi import APIRouter, Depends, Header
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from project.db.database import get_session
-from project.db.models import UserCoreModel
-from project.core.auth.dependencies import get_current_user
-from project.db.crud.user import create_user, completion_repres_user
-from project.db.crud.wallet import create_wallet_invoice, accept_wallet_invoice
-from project.db.crud.config import create_config_invoice
+from project.db.models import UserCoreModel, WalletRechargeInvoiceModel, ConfigurationInvoiceModel
+from project.core.app_config.schema import ConfigInvoiceCreateSchemas
+from project.core.repositories.configuration import ConfigInvoiceRepository
+from project.core.repositories.user import UserCoreRepository
+from project.core.repositories.wallet import WalletInvoiceRepository
+from project.core.services.config_service import ConfigInvoiceService
+from project.core.services.user_service import RepresentativesCoreService
+from project.core.services.wallet_service import WalletInvoiceService
+from project.core.auth.dependencies import get_current_user, get_current_principal
+from project.core.auth.principals import Principal
 
 from .schema import (
     UserCreateSchema,
@@ -14,48 +21,96 @@ from .schema import (
     UserReadSchema,
     WalletInvoiceCreateSchemas,
     WalletInvoiceReadSchemas,
-    ConfigInvoiceCreateSchemas,
+    WalletInvoiceBatchAcceptSchemas,
+    WalletInvoiceBatchResultSchemas,
     ConfigInvoiceReadSchemas,
+    ConfigQuoteReadSchemas,
 )
 
 
 router = APIRouter(prefix="/bot")
+# endpointها فقط Principal کش شده را می‌گیرند؛ get_current_user (یک کوئری) فقط جایی است که خود مدل کاربر لازم است
 # TODO: فعلا برای شناسایی کاربر از user عادی استفاده میکنیم تا بعدا سیسیتم احراز هویت ربات درخواست ارسال کننده را پیدا کنیم.
 
 # ---------------------------------------------------
 @router.post("/user/creat", response_model=UserReadSchema)
-def create_user_api(data: UserCreateSchema, db: Session=Depends(get_session), user: UserCoreModel=Depends(get_current_user)):
-    user_created = create_user(data, db, user)
+async def create_user_api(data: UserCreateSchema, db: AsyncSession=Depends(get_session), user: UserCoreModel=Depends(get_current_user)):
+    # کاربر جدید به مدل بالادستی وصل می‌شود و unique_id از شناسه چت آن ساخته می‌شود
+    user_service = RepresentativesCoreService(UserCoreRepository(UserCoreModel, db))
+    user_created = await user_service.create_downstream_user(user, data.tel_chat_id, data.first_name, data.last_name)
     return user_created
 
 # ---------------------------------------------------
 @router.post("/user/completion-repres", response_model=UserReadSchema)
-def create_user_api(data: UserCompletionSchema, db: Session=Depends(get_session), user: UserCoreModel=Depends(get_current_user)):
-    user_repres = completion_repres_user(data, db, user)
-    return user_repres
+async def completion_repres_user_api(data: UserCompletionSchema, db: AsyncSession=Depends(get_session), user: Principal=Depends(get_current_principal)):
+    user_service = RepresentativesCoreService(UserCoreRepository(UserCoreModel, db))
+    user_repres, representative = await user_service.complete_repres_user(
+        user, data.tel_chat_id, data.phone_number, data.first_name, data.last_name
+    )
+    return UserReadSchema(
+        phone_number=representative.phone_number,
+        first_name=user_repres.first_name,
+        last_name=user_repres.last_name,
+    )
 
 # ---------------------------------------------------
 @router.post("/wallet", response_model=WalletInvoiceReadSchemas)
-def wallet_charge_api(data: WalletInvoiceCreateSchemas, db: Session=Depends(get_session), user: UserCoreModel=Depends(get_current_user)):
-    wallet_invoice_obj = create_wallet_invoice(db, data, user)
+async def wallet_charge_api(
+    data: WalletInvoiceCreateSchemas, 
+    db: AsyncSession=Depends(get_session), 
+    user: Principal=Depends(get_current_principal), 
+    idempotency_key: str | None=Header(default=None, max_length=128)
+    ):
+    wallet_service = WalletInvoiceService(WalletInvoiceRepository(WalletRechargeInvoiceModel, db))
+    wallet_invoice_obj = await wallet_service.create_wallet_invoice(
+        downstream_user_obj=user,
+        charge_amount=data.charge_amount,
+        get_config=data.get_config,
+        descriptions=data.descriptions,
+        idempotency_key=idempotency_key,
+    )
     return wallet_invoice_obj
 
 # ---------------------------------------------------
 @router.get("/wallet/{invoice_id}/accept/{accepted}", response_model=WalletInvoiceReadSchemas)
-def wallet_charge_accept_api(invoice_id: int, accepted: bool, db: Session=Depends(get_session), user: UserCoreModel=Depends(get_current_user)):
-    wallet_invoice_obj = accept_wallet_invoice(db, invoice_id, user, accepted)
+async def wallet_charge_accept_api(
+    invoice_id: int, 
+    accepted: bool, 
+    db: AsyncSession=Depends(get_session), 
+    user: Principal=Depends(get_current_principal), 
+    idempotency_key: str | None=Header(default=None, max_length=128)
+    ):
+    wallet_service = WalletInvoiceService(WalletInvoiceRepository(WalletRechargeInvoiceModel, db))
+    wallet_invoice_obj = await wallet_service.accept_wallet_invoice(invoice_id, user, accepted, idempotency_key)
     return wallet_invoice_obj
 
+# ---------------------------------------------------
+@router.post("/wallet/accept", response_model=List[WalletInvoiceBatchResultSchemas])
+async def wallet_charge_batch_accept_api(data: WalletInvoiceBatchAcceptSchemas, db: AsyncSession=Depends(get_session), user: Principal=Depends(get_current_principal)):
+    wallet_service = WalletInvoiceService(WalletInvoiceRepository(WalletRechargeInvoiceModel, db))
+    return await wallet_service.accept_wallet_invoices(data.invoice_ids, user, data.accepted)
+
 # ---------------------------------------------------
 @router.post("/config", response_model=ConfigInvoiceReadSchemas)
-def create_config_api(data: ConfigInvoiceCreateSchemas, db: Session=Depends(get_session), user: UserCoreModel=Depends(get_current_user)):
-    config_invoice_obj = create_config_invoice(db, data, user)
+async def create_config_api(
+    data: ConfigInvoiceCreateSchemas, 
+    db: AsyncSession=Depends(get_session), 
+    user: Principal=Depends(get_current_principal), 
+    idempotency_key: str | None=Header(default=None, max_length=128)
+    ):
+    config_service = ConfigInvoiceService(ConfigInvoiceRepository(ConfigurationInvoiceModel, db))
+    config_invoice_obj = await config_service.create_config_invoice(
+        buyer_user_obj=user,
+        volume=data.volume,
+        descriptions=data.descriptions,
+        idempotency_key=idempotency_key,
+        discount_codes=data.discount_codes,
+    )
     return config_invoice_obj
 
-
-
-
-
-
-
-
+# ---------------------------------------------------
+@router.post("/config/quote", response_model=ConfigQuoteReadSchemas)
+async def config_quote_api(data: ConfigInvoiceCreateSchemas, db: AsyncSession=Depends(get_session), user: Principal=Depends(get_current_principal)):
+    # قیمت‌گذاری فقط شناسه، بالادستی و نقش کاربر را لازم دارد
+    config_service = ConfigInvoiceService(ConfigInvoiceRepository(ConfigurationInvoiceModel, db))
+    return await config_service.quote(user, data.volume, data.discount_codes)
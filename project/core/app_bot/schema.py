@@ -1,5 +1,5 @@
 import enum
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 
 from pydantic import BaseModel, Field, field_validator, ConfigDict
@@ -38,22 +38,36 @@ class UserCompletionSchema(BaseModel):
     
 # ---------------------------------------------------------------------
 class UserReadSchema(BaseModel):
-    phone_number: str = Field(..., max_length=11, min_length=11)
+    # شماره تلفن فقط برای نماینده‌ها ثبت می‌شود
+    phone_number: Optional[str] = Field(default=None, max_length=11, min_length=11)
     first_name: str = Field(..., max_length=16)
     last_name: str = Field(..., max_length=16)
+
+    model_config = ConfigDict(from_attributes=True)
     
 # ---------------------------------------------------
 class WalletInvoiceCreateSchemas(BaseModel):
-    charge_amount: str = Field(..., max_length=16)
+    charge_amount: int = Field(..., gt=0, lt=10**16)
     get_config: bool = Field(default=False)
     descriptions: Optional[str] = Field(default=None)
 
 # ---------------------------------------------------
 class WalletInvoiceReadSchemas(BaseModel):
-    charge_amount: str = Field(..., max_length=16)
+    charge_amount: int
     get_config: bool = Field(default=False)
     descriptions: Optional[str] = Field(default=None)
     
+# ---------------------------------------------------
+class WalletInvoiceBatchAcceptSchemas(BaseModel):
+    invoice_ids: List[int] = Field(..., min_length=1, max_length=500)
+    accepted: bool = Field(default=True)
+
+# ---------------------------------------------------
+class WalletInvoiceBatchResultSchemas(BaseModel):
+    invoice_id: int
+    status_code: int
+    detail: Optional[str] = Field(default=None)
+
 # ---------------------------------------------------
 class ConfigInvoiceCreateSchemas(BaseModel):
     volume: str = Field(..., max_length=16)
@@ -62,6 +76,13 @@ class ConfigInvoiceCreateSchemas(BaseModel):
     total_price: str = Field(..., max_length=16)
     descriptions: Optional[str] = Field(default=None)
     
+# ---------------------------------------------------
+class ConfigQuoteReadSchemas(BaseModel):
+    volume: int
+    base_price: int
+    discount_amount: int
+    total_price: int
+
 # ---------------------------------------------------
 class WalletInvoiceStatusChoices(enum.Enum):
     """
@@ -73,13 +94,9 @@ class WalletInvoiceStatusChoices(enum.Enum):
     PAY_WALLET = "pay_wallet" # پرداخت شده به کیف پول
 
 class ConfigInvoiceReadSchemas(BaseModel):
-    charge_amount: str = Field(..., max_length=16)
-    get_config: bool
+    volume: int
+    base_price: int
+    discount_amount: int = Field(default=0)
+    total_price: int
     created_at: datetime
-    status: WalletInvoiceStatusChoices
     descriptions: Optional[str] = Field(default=None)
-
-    model_config = ConfigDict(use_enum_values=True)
-    
-    
-    
\ No newline at end of file
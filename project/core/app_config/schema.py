@@ -1,11 +1,12 @@
-from typing import Optional
+from typing import List, Optional
 
 from pydantic import BaseModel, Field, ConfigDict
 
 
 # ---------------------------------------------------
 class ConfigInvoiceCreateSchemas(BaseModel):
-    volume: str = Field(..., max_length=16)
+    volume: int = Field(..., gt=0, lt=10**16)
     descriptions: Optional[str] = Field(default=None)
+    discount_codes: List[str] = Field(default_factory=list, max_length=5)
 
     model_config = ConfigDict(use_enum_values=True)
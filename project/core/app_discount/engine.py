@@ -0,0 +1,130 @@
+# engine.py
+from __future__ import annotations
+
+import asyncio
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, FrozenSet, List, Optional, Sequence
+
+from fastapi import status
+from fastapi.exceptions import HTTPException
+
+from project.core.config import settings
+
+
+@dataclass(frozen=True)
+class DiscountRule:
+    """نسخه کامپایل شده یک کد تخفیف؛ ارزیابی آن به دیتابیس نیاز ندارد"""
+    id: int
+    seller_user_id: int
+    code: str
+    percent: int
+    expires_at: datetime
+    usage_ceiling: Optional[int] = None
+    maximum_discount_amount: int = 0 # صفر یعنی بدون سقف
+    minimum_purchase_amount: int = 0
+    number_uses_per_user: Optional[int] = None
+    refund: bool = False
+    stackable: bool = False # synchronicity
+    authorized_user_ids: Optional[FrozenSet[int]] = None # None یعنی همه کاربران مجازند
+
+    def check(self, buyer_user_id: int, amount: int, now: datetime) -> None:
+        if now >= self.expires_at:
+            raise HTTPException(status_code=status.HTTP_406_NOT_ACCEPTABLE, detail=f"Discount code {self.code} has expired")
+        if amount < self.minimum_purchase_amount:
+            raise HTTPException(
+                status_code=status.HTTP_406_NOT_ACCEPTABLE,
+                detail=f"Discount code {self.code} requires a minimum purchase of {self.minimum_purchase_amount}"
+            )
+        if self.authorized_user_ids is not None and buyer_user_id not in self.authorized_user_ids:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=f"Discount code {self.code} is not available to you")
+
+    def amount_for(self, amount: int) -> int:
+        discount = amount * self.percent // 100
+        if self.maximum_discount_amount:
+            discount = min(discount, self.maximum_discount_amount)
+        return discount
+
+
+@dataclass
+class DiscountEvaluation:
+    amount: int
+    discount_amount: int = 0
+    rules: List[DiscountRule] = field(default_factory=list)
+
+    @property
+    def total(self) -> int:
+        return self.amount - self.discount_amount
+
+
+@dataclass
+class SellerDiscounts:
+    rules: Dict[str, DiscountRule] = field(default_factory=dict) # کد -> قانون
+    fetched_at: float = field(default_factory=time.time)
+
+
+DiscountLoader = Callable[[], Awaitable[SellerDiscounts]]
+
+
+def evaluate(
+    seller_discounts: SellerDiscounts,
+    codes: Sequence[str],
+    buyer_user_id: int,
+    amount: int,
+    now: Optional[datetime] = None
+) -> DiscountEvaluation:
+    """
+    ارزیابی یک یا چند کد روی مبلغ خرید. چند کد فقط وقتی با هم اعمال می‌شوند که همه synchronicity داشته باشند؛
+    هر کد روی مبلغ باقی‌مانده بعد از کد قبلی اعمال می‌شود.
+    """
+    now = now or datetime.now(timezone.utc)
+    evaluation = DiscountEvaluation(amount=amount)
+    codes = list(dict.fromkeys(codes))
+    for code in codes:
+        rule = seller_discounts.rules.get(code)
+        if rule is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Discount code {code} not found")
+        if len(codes) > 1 and not rule.stackable:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Discount code {code} cannot be combined with other codes"
+            )
+        rule.check(buyer_user_id, amount, now)
+        evaluation.discount_amount += rule.amount_for(evaluation.total)
+        evaluation.rules.append(rule)
+    return evaluation
+
+
+class DiscountRuleCache:
+    """کش قوانین کامپایل شده کدهای فعال هر فروشنده با TTL و باطل‌سازی دستی"""
+
+    def __init__(self, ttl: Optional[float] = None):
+        self.ttl = settings.DISCOUNT_RULES_TTL if ttl is None else ttl
+        self._items: Dict[int, SellerDiscounts] = {}
+        self._locks: Dict[int, asyncio.Lock] = {}
+
+    def peek(self, seller_user_id: int) -> Optional[SellerDiscounts]:
+        discounts = self._items.get(seller_user_id)
+        if discounts and time.time() - discounts.fetched_at < self.ttl:
+            return discounts
+        return None
+
+    async def get(self, seller_user_id: int, loader: DiscountLoader) -> SellerDiscounts:
+        discounts = self.peek(seller_user_id)
+        if discounts:
+            return discounts
+        lock = self._locks.setdefault(seller_user_id, asyncio.Lock())
+        async with lock:
+            discounts = self.peek(seller_user_id)
+            if discounts:
+                return discounts
+            discounts = await loader()
+            self._items[seller_user_id] = discounts
+            return discounts
+
+    def invalidate(self, seller_user_id: int) -> None:
+        self._items.pop(seller_user_id, None)
+
+
+discount_rules = DiscountRuleCache()
@@ -0,0 +1,49 @@
+# redemption.py
+from __future__ import annotations
+
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List, Sequence
+
+from fastapi import status
+from fastapi.exceptions import HTTPException
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from project.core.repositories.discount import DiscountRepository
+from project.db.database import async_session
+from project.db.models import DiscountModel
+
+from .engine import DiscountRule
+
+
+class DiscountRedemptionCounter:
+    """
+    شمارنده سقف استفاده کل کدهای تخفیف.
+    رزرو در تراکنش کوتاه و جداگانه انجام می‌شود و اگر تراکنش فاکتور شکست بخورد آزاد می‌شود.
+    """
+
+    def __init__(self, session_factory: async_sessionmaker = async_session):
+        self.session_factory = session_factory
+
+    @asynccontextmanager
+    async def reserve(self, rules: Sequence[DiscountRule]) -> AsyncIterator[List[DiscountRule]]:
+        reserved: List[DiscountRule] = []
+        async with self.session_factory() as session:
+            discount_repo = DiscountRepository(DiscountModel, session)
+            try:
+                for rule in rules:
+                    if await discount_repo.reserve_usage(rule.id) is None:
+                        raise HTTPException(
+                            status_code=status.HTTP_406_NOT_ACCEPTABLE,
+                            detail=f"Discount code {rule.code} has reached its usage limit"
+                        )
+                    reserved.append(rule)
+                yield reserved
+            except BaseException:
+                # آزادسازی رزروها؛ تراکنش فاکتور rollback شده یا اصلا شروع نشده است
+                await session.rollback()
+                for rule in reserved:
+                    await discount_repo.release_usage(rule.id)
+                raise
+
+
+redemption_counter = DiscountRedemptionCounter()
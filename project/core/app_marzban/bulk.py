@@ -0,0 +1,149 @@
+# bulk.py
+from __future__ import annotations
+
+import asyncio
+from collections import defaultdict
+from typing import Dict, List, Optional, Sequence
+
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from project.core.config import settings
+from project.core.repositories.configuration import ConfigurationRepository
+from project.db.database import async_session
+from project.db.models import ConfigurationsModel
+
+from .client import MarzbanClientPool, clients
+from .scheduler import PanelScheduler, panel_scheduler
+from .schema import ProvisionRequest, ProvisionResult
+
+
+async def _gather_settled(aws) -> list:
+    """
+    مانند gather ولی با لغو شدن تا پایان کار همه آیتم‌ها (آزادسازی رزروها) صبر می‌کند؛
+    gather معمولی با اولین آیتم لغو شده برمی‌گردد و بقیه هنوز در حال آزادسازی‌اند.
+    """
+    results = await asyncio.gather(*aws, return_exceptions=True)
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    return results
+
+
+async def _record_configs(
+    session_factory: async_sessionmaker,
+    items: List[tuple[int, ProvisionRequest]],
+    results: List[ProvisionResult],
+) -> None:
+    """ثبت کانفیگ آیتم‌های موفق با panel_id پنل؛ یک INSERT گروهی برای هر پنل"""
+    requests = dict(items)
+    recorded = [r for r in results if r.ok and requests[r.index].buyer_user_id is not None]
+    if not recorded:
+        return
+    rows = [
+        {
+            "panel_id": r.panel_id,
+            "name": r.username,
+            "buyer_user_id": requests[r.index].buyer_user_id,
+            "seller_user_id": requests[r.index].seller_id,
+            "volume": requests[r.index].volume,
+        }
+        for r in recorded
+    ]
+    try:
+        async with session_factory() as session:
+            await ConfigurationRepository(ConfigurationsModel, session).add_provisioned(rows)
+    except Exception as e:
+        # کاربر روی پنل ساخته شده ولی کانفیگ ثبت نشده؛ خطا کنار user برگردانده می‌شود
+        for r in recorded:
+            r.error = f"created on panel but not recorded: {e}"
+
+
+async def _provision_panel(
+    pool: MarzbanClientPool,
+    scheduler: PanelScheduler,
+    session_factory: async_sessionmaker,
+    panel: dict,
+    items: List[tuple[int, ProvisionRequest]],
+    concurrency: int,
+) -> List[ProvisionResult]:
+    client = pool.get(panel)
+
+    async def _release(item: ProvisionRequest) -> None:
+        # حجم فقط برای آیتم‌هایی رزرو شده که پنلشان را زمان‌بند انتخاب کرده
+        if (item.panel is None or item.panel["id"] != client.panel_id) and item.volume:
+            await scheduler.release(client.panel_id, item.volume)
+
+    try:
+        token = await client.token()
+        meta = await client.metadata()
+    except BaseException as e:
+        for _, item in items:
+            await _release(item)
+        if not isinstance(e, Exception):
+            raise
+        return [
+            ProvisionResult(index=i, panel_id=client.panel_id, username=item.payload.username, error=str(e))
+            for i, item in items
+        ]
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def _one(index: int, item: ProvisionRequest) -> ProvisionResult:
+        result = ProvisionResult(index=index, panel_id=client.panel_id, username=item.payload.username)
+        try:
+            async with semaphore:
+                result.user = await client.create_user(item.payload, item.is_test, meta=meta, token=token)
+        except Exception as e:
+            result.error = str(e)
+        finally:
+            # لغو شدن (CancelledError) هم مثل خطا حجم رزرو شده را آزاد می‌کند
+            if result.user is None:
+                await _release(item)
+        return result
+
+    results = await _gather_settled(_one(i, item) for i, item in items)
+    await _record_configs(session_factory, items, results)
+    return results
+
+
+async def provision_users(
+    items: Sequence[ProvisionRequest],
+    concurrency_per_panel: Optional[int] = None,
+    pool: MarzbanClientPool = clients,
+    scheduler: PanelScheduler = panel_scheduler,
+    session_factory: async_sessionmaker = async_session,
+) -> List[ProvisionResult]:
+    """
+    ساخت گروهی کاربر روی یک یا چند پنل.
+    آیتم‌های بدون panel با رزرو ظرفیت توسط زمان‌بند روی پنل‌های نماینده صاحب آن (owner_id) قرار می‌گیرند.
+    نتیجه هر آیتم (موفق یا خطا) به همان ترتیب ورودی برگردانده می‌شود.
+    آیتم‌های دارای buyer_user_id بعد از ساخت در جدول configurations با panel_id پنل ثبت می‌شوند.
+    """
+    concurrency = concurrency_per_panel or settings.MARZBAN_BULK_CONCURRENCY
+    by_panel: Dict[int, List[tuple[int, ProvisionRequest]]] = defaultdict(list)
+    panels: Dict[int, dict] = {}
+    failed: List[ProvisionResult] = []
+    explicit = [item.panel for item in items if item.panel is not None]
+    healthy_ids = {panel["id"] for panel in scheduler.health.healthy(explicit)}
+    for index, item in enumerate(items):
+        panel = item.panel
+        if panel is not None and panel["id"] not in healthy_ids and item.owner_id is not None:
+            # مدار پنل خواسته شده باز است؛ آیتم روی پنل سالم دیگری از همان نماینده قرار می‌گیرد
+            panel = None
+        if panel is None:
+            try:
+                # رزرو پشت سر هم انجام می‌شود تا هر آیتم ظرفیت باقی‌مانده بعد از آیتم‌های قبلی را ببیند
+                panel = await scheduler.reserve(item.volume, item.owner_id)
+            except Exception as e:
+                failed.append(ProvisionResult(index=index, username=item.payload.username, error=str(e)))
+                continue
+        by_panel[panel["id"]].append((index, item))
+        panels.setdefault(panel["id"], panel)
+
+    grouped = await _gather_settled(
+        _provision_panel(pool, scheduler, session_factory, panels[panel_id], panel_items, concurrency)
+        for panel_id, panel_items in by_panel.items()
+    )
+    results = failed + [result for panel_results in grouped for result in panel_results]
+    results.sort(key=lambda r: r.index)
+    return results
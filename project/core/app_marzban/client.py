@@ -0,0 +1,304 @@
+# client.py
+from __future__ import annotations
+
+import json
+import time
+from typing import AsyncIterator, Dict, List, Optional
+
+import httpx
+
+from project.core.config import settings
+
+from .schema import (
+    AdminTokenResponse, UserCreateRequest, UserModifyRequest,
+    GroupCreateRequest, SystemStats, UserResponse, UsersResponse, GroupResponse
+)
+from .health import PanelHealthRegistry, health_registry
+from .metadata import PanelMetadata, PanelMetadataCache, metadata_cache
+from .token import PanelTokenManager, token_manager
+
+
+# پاسخ‌هایی که نشان می‌دهند اینباند یا گروه ذخیره شده در متادیتا دیگر روی پنل نیست؛
+# 409 (نام تکراری) و 422 (اعتبارسنجی) ربطی به متادیتا ندارند
+STALE_METADATA_STATUSES = frozenset({httpx.codes.BAD_REQUEST, httpx.codes.NOT_FOUND})
+
+
+def _default_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=settings.MARZBAN_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.MARZBAN_MAX_KEEPALIVE,
+        keepalive_expiry=settings.MARZBAN_KEEPALIVE_EXPIRY,
+    )
+
+
+def _json_field(value):
+    # فیلدهای proxies و inbounds پنل ممکن است به صورت رشته JSON ذخیره شده باشند
+    return json.loads(value) if isinstance(value, str) else value
+
+
+class MarzbanClient:
+    """کلاینت async یک پنل مرزبان با استخر اتصال keep-alive اختصاصی"""
+
+    def __init__(
+        self,
+        panel: dict,
+        limits: Optional[httpx.Limits] = None,
+        timeout: Optional[float] = None,
+        tokens: Optional[PanelTokenManager] = None,
+        metadata: Optional[PanelMetadataCache] = None,
+        health: Optional[PanelHealthRegistry] = None,
+    ):
+        self.panel = panel
+        self.panel_id = panel["id"]
+        self._http = httpx.AsyncClient(
+            base_url=panel["url_panel"].rstrip("/"),
+            headers={"Accept": "application/json"},
+            limits=limits or _default_limits(),
+            timeout=timeout or settings.MARZBAN_TIMEOUT,
+        )
+        self._tokens = tokens or token_manager
+        self._metadata = metadata or metadata_cache
+        self._health = health or health_registry
+        self._health.set_probe(self.panel_id, self._probe)
+
+    async def aclose(self) -> None:
+        await self._http.aclose()
+
+    # ────── AUTH ──────
+    async def _login(self) -> AdminTokenResponse:
+        payload = {"username": self.panel["username_panel"], "password": self.panel["password_panel"]}
+        resp = await self._send("POST", "/api/admin/token", data=payload)
+        resp.raise_for_status()
+        return AdminTokenResponse(**resp.json())
+
+    async def token(self) -> AdminTokenResponse:
+        return await self._tokens.get(self.panel_id, self._login)
+
+    async def auth_headers(self) -> Dict[str, str]:
+        token = await self.token()
+        return {"Authorization": f"Bearer {token.access_token}"}
+
+    async def _request(
+        self, method: str, path: str, token: Optional[AdminTokenResponse] = None, **kwargs
+    ) -> httpx.Response:
+        extra_headers = kwargs.pop("headers", {})
+        token = token or await self.token()
+        headers = {"Authorization": f"Bearer {token.access_token}", **extra_headers}
+        resp = await self._send(method, path, headers=headers, **kwargs)
+        if resp.status_code == httpx.codes.UNAUTHORIZED:
+            # توکن سمت پنل باطل شده؛ یک بار با توکن جدید تلاش می‌شود
+            self._tokens.invalidate(self.panel_id, token)
+            token = await self.token()
+            headers["Authorization"] = f"Bearer {token.access_token}"
+            resp = await self._send(method, path, headers=headers, **kwargs)
+        resp.raise_for_status()
+        return resp
+
+    async def _send(self, method: str, path: str, **kwargs) -> httpx.Response:
+        # اگر مدار پنل باز باشد بدون انتظار برای timeout خطا برمی‌گردد
+        started = self._health.before_call(self.panel_id)
+        healthy = None
+        try:
+            resp = await self._http.request(method, path, **kwargs)
+            healthy = resp.status_code < 500
+            return resp
+        except httpx.TransportError:
+            healthy = False
+            raise
+        finally:
+            # جای درخواست در جریان همیشه آزاد می‌شود؛ لغو یا خطای غیرشبکه‌ای خرابی پنل حساب نمی‌شود
+            if healthy is None:
+                self._health.release(self.panel_id)
+            elif healthy:
+                self._health.record_success(self.panel_id, started)
+            else:
+                self._health.record_failure(self.panel_id, started)
+
+    async def _probe(self) -> None:
+        # هر پاسخی کمتر از 500 (حتی 401) یعنی پنل در دسترس است
+        resp = await self._http.get("/api/system")
+        if resp.status_code >= 500:
+            resp.raise_for_status()
+
+    # ────── USERS ──────
+    async def get_user(self, username: str) -> UserResponse:
+        resp = await self._request("GET", f"/api/user/{username}")
+        return UserResponse(**resp.json())
+
+    async def get_users(self, offset: int = 0, limit: int = 100) -> UsersResponse:
+        resp = await self._request("GET", "/api/users", params={"offset": offset, "limit": limit})
+        return UsersResponse(**resp.json())
+
+    async def iter_users(self, page_size: int = 100) -> AsyncIterator[List[UserResponse]]:
+        offset = 0
+        while True:
+            page = await self.get_users(offset=offset, limit=page_size)
+            if not page.users:
+                return
+            yield page.users
+            offset += len(page.users)
+            if offset >= page.total:
+                return
+
+    async def reset_user_data_usage(self, username: str) -> dict:
+        resp = await self._request("POST", f"/api/user/{username}/reset")
+        return resp.json()
+
+    def build_user_payload(self, username: str, expire: int, data_limit: int) -> UserCreateRequest:
+        base_payload = {
+            "username": username,
+            "proxies": _json_field(self.panel.get("proxies")) or {},
+            "data_limit": data_limit if data_limit > 0 else None,
+        }
+        if self.panel.get("inbounds") and self.panel["inbounds"] not in ("null", ""):
+            base_payload["inbounds"] = _json_field(self.panel["inbounds"])
+
+        payload = UserCreateRequest(**base_payload)
+
+        if expire > 0 and self.panel.get("onholdstatus") == "ononhold":
+            payload.expire = None
+            payload.status = "on_hold"
+            payload.on_hold_expire_duration = expire - int(time.time())
+        else:
+            payload.expire = expire if expire > 0 else None
+        return payload
+
+    async def add_user(self, username: str, expire: int, data_limit: int, is_test: bool = False) -> UserResponse:
+        payload = self.build_user_payload(username, expire, data_limit)
+        return await self.create_user(payload, is_test)
+
+    async def create_user(
+        self,
+        payload: UserCreateRequest,
+        is_test: bool = False,
+        meta: Optional[PanelMetadata] = None,
+        token: Optional[AdminTokenResponse] = None,
+    ) -> UserResponse:
+        # در عملیات گروهی meta و token یک بار گرفته و برای همه آیتم‌ها استفاده می‌شوند
+        meta = meta or await self.metadata()
+        if meta.above_084 and not payload.group_ids:
+            group_id = meta.group_id("mirza_test" if is_test else "mirza_paid")
+            if group_id:
+                payload = payload.model_copy(update={"group_ids": [group_id]})
+
+        try:
+            resp = await self._request("POST", "/api/user", token=token, json=payload.model_dump(exclude_none=True))
+        except httpx.HTTPStatusError as e:
+            # ممکن است گروه‌ها یا اینباندهای پنل تغییر کرده باشد
+            if e.response.status_code in STALE_METADATA_STATUSES:
+                self._metadata.invalidate(self.panel_id)
+            raise
+        return UserResponse(**resp.json())
+
+    async def modify_user(self, username: str, data: dict) -> dict:
+        payload = UserModifyRequest(**data)
+        resp = await self._request("PUT", f"/api/user/{username}", json=payload.model_dump(exclude_none=True))
+        return resp.json()
+
+    async def remove_user(self, username: str) -> dict:
+        resp = await self._request("DELETE", f"/api/user/{username}")
+        return resp.json()
+
+    async def revoke_subscription(self, username: str) -> dict:
+        resp = await self._request("POST", f"/api/user/{username}/revoke_sub")
+        return resp.json()
+
+    # ────── SYSTEM ──────
+    async def get_system_stats(self) -> SystemStats:
+        resp = await self._request("GET", "/api/system")
+        return SystemStats(**resp.json())
+
+    async def is_version_above_084(self) -> bool:
+        return (await self.metadata()).above_084
+
+    async def metadata(self) -> PanelMetadata:
+        return await self._metadata.get(self.panel_id, self._load_metadata)
+
+    def invalidate_metadata(self) -> None:
+        self._metadata.invalidate(self.panel_id)
+
+    async def _load_metadata(self) -> PanelMetadata:
+        stats = await self.get_system_stats()
+        meta = PanelMetadata(version=stats.version)
+        if not meta.above_084:
+            return meta
+        meta.groups = {g.name.lower(): g.id for g in await self.get_groups()}
+        meta.inbound_tags = await self.get_inbound_tags()
+        missing = {"mirza_paid", "mirza_test"} - meta.groups.keys()
+        for name in missing:
+            await self._create_group(name, meta.inbound_tags)
+        if missing:
+            meta.groups = {g.name.lower(): g.id for g in await self.get_groups()}
+        return meta
+
+    # ────── GROUPS ──────
+    async def get_groups(self) -> List[GroupResponse]:
+        resp = await self._request("GET", "/api/groups")
+        data = resp.json()
+        groups = data.get("groups") or [] if isinstance(data, dict) else data
+        return [GroupResponse(**g) for g in groups]
+
+    async def get_group_id_by_name(self, name: str) -> Optional[int]:
+        return (await self.metadata()).group_id(name)
+
+    async def create_group(self, name: str, inbound_tags: Optional[List[str]] = None) -> dict:
+        data = await self._create_group(name, inbound_tags)
+        self._metadata.invalidate(self.panel_id)
+        return data
+
+    async def _create_group(self, name: str, inbound_tags: Optional[List[str]] = None) -> dict:
+        payload = GroupCreateRequest(name=name, inbound_tags=inbound_tags or [])
+        resp = await self._request("POST", "/api/group", json=payload.model_dump())
+        return resp.json()
+
+    async def get_inbound_tags(self) -> List[str]:
+        # روش جدید
+        try:
+            resp = await self._request("GET", "/api/cores")
+            data = resp.json()
+            tags = {i.get("tag") for c in data.get("cores", []) for i in c.get("config", {}).get("inbounds", []) if i.get("tag")}
+            if tags:
+                return list(tags)
+        except (httpx.HTTPError, ValueError, AttributeError):
+            pass
+
+        # روش قدیمی
+        resp = await self._request("GET", "/api/inbounds")
+        return [i["tag"] for i in resp.json() if i.get("tag")]
+
+    async def ensure_default_groups(self) -> None:
+        # گروه‌های پیش‌فرض هنگام بارگذاری metadata ساخته می‌شوند
+        await self.metadata()
+
+
+class MarzbanClientPool:
+    """نگهداری یک کلاینت (و یک استخر اتصال) برای هر پنل"""
+
+    def __init__(self, limits: Optional[httpx.Limits] = None, timeout: Optional[float] = None):
+        self._limits = limits
+        self._timeout = timeout
+        self._clients: Dict[int, MarzbanClient] = {}
+
+    def get(self, panel: dict) -> MarzbanClient:
+        client = self._clients.get(panel["id"])
+        if client is None:
+            client = MarzbanClient(panel, limits=self._limits, timeout=self._timeout)
+            self._clients[panel["id"]] = client
+        return client
+
+    # بعد از تغییر آدرس یا اطلاعات ورود پنل باید صدا زده شود
+    async def discard(self, panel_id: int) -> None:
+        client = self._clients.pop(panel_id, None)
+        if client is not None:
+            client._tokens.discard(panel_id)
+            client.invalidate_metadata()
+            client._health.forget(panel_id)
+            await client.aclose()
+
+    async def aclose(self) -> None:
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            await client.aclose()
+
+
+clients = MarzbanClientPool()
@@ -1,202 +1,123 @@
 # marzban_api.py
 from __future__ import annotations
 
-import time
-import re
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 
-import requests
-from project.core.schemas.admin.marzban import (
-    AdminTokenResponse, UserCreateRequest, UserModifyRequest,
-    GroupCreateRequest, SystemStats, UserResponse, GroupResponse
-)
+from project.core.repositories.configuration import ConfigurationRepository
+from project.db.database import async_session
+from project.db.models import ConfigurationsModel
 
-session = requests.Session()
-session.headers.update({"Accept": "application/json"})
+from .client import clients
+from .scheduler import Strategy, panel_scheduler
+from .schema import AdminTokenResponse, SystemStats, UserResponse, GroupResponse
 
-_TOKEN_CACHE: Dict[int, dict] = {}
 
+async def _get_panel(location: str, owner_id: Optional[int] = None) -> Dict:
+    # location نام (یا شناسه) پنل است؛ پنل‌ها از حافظه زمان‌بند و در صورت نبودن از دیتابیس خوانده می‌شوند
+    # نام پنل فقط برای هر نماینده یکتاست، پس با owner_id (شناسه نماینده صاحب پنل) جستجو می‌شود
+    return await panel_scheduler.resolve(location, owner_id)
 
-def _get_panel(location: str) -> Dict:
-    raise NotImplementedError("باید _get_panel را پیاده‌سازی کنید")
-
-
-def token_panel(panel: dict) -> AdminTokenResponse | dict:
-    panel_id = panel["id"]
-    if panel_id in _TOKEN_CACHE:
-        cached = _TOKEN_CACHE[panel_id]
-        if time.time() - cached["timestamp"] < 3600:
-            return cached["token_data"]
-
-    url = f"{panel['url_panel'].rstrip('/')}/api/admin/token"
-    payload = {"username": panel["username_panel"], "password": panel["password_panel"]}
 
+async def token_panel(panel: dict) -> AdminTokenResponse | dict:
     try:
-        resp = session.post(url, data=payload, timeout=10)
-        resp.raise_for_status()
-        data = AdminTokenResponse(**resp.json())
-        _TOKEN_CACHE[panel_id] = {"timestamp": time.time(), "token_data": data}
-        return data
+        return await clients.get(panel).token()
     except Exception as e:
         return {"error": str(e)}
 
 
-def _auth_headers(location: str):
-    panel = _get_panel(location)
-    token = token_panel(panel)
-    access_token = token.get("access_token") if isinstance(token, dict) else token.access_token
-    return {"Authorization": f"Bearer {access_token}"}
+async def _auth_headers(location: str, owner_id: Optional[int] = None):
+    return await clients.get(await _get_panel(location, owner_id)).auth_headers()
 
 
-def get_user(username: str, location: str) -> UserResponse | dict:
-    panel = _get_panel(location)
-    url = f"{panel['url_panel'].rstrip('/')}/api/user/{username}"
-    resp = session.get(url, headers=_auth_headers(location), timeout=10)
-    resp.raise_for_status()
-    return UserResponse(**resp.json())
+async def get_user(username: str, location: str, owner_id: Optional[int] = None) -> UserResponse | dict:
+    return await clients.get(await _get_panel(location, owner_id)).get_user(username)
 
 
-def reset_user_data_usage(username: str, location: str) -> dict:
-    panel = _get_panel(location)
-    url = f"{panel['url_panel'].rstrip('/')}/api/user/{username}/reset"
-    resp = session.post(url, headers=_auth_headers(location), timeout=10)
-    resp.raise_for_status()
-    return resp.json()
+async def reset_user_data_usage(username: str, location: str, owner_id: Optional[int] = None) -> dict:
+    return await clients.get(await _get_panel(location, owner_id)).reset_user_data_usage(username)
 
 
-def add_user(
+async def add_user(
     username: str,
     expire: int,
     data_limit: int,
     location: str,
-    is_test: bool = False
+    is_test: bool = False,
+    owner_id: Optional[int] = None,
 ) -> UserResponse | dict:
-    panel = _get_panel(location)
-    ensure_default_groups(location)
-
-    base_payload = {
-        "username": username,
-        "proxies": panel.get("proxies", "{}"),
-        "data_limit": data_limit if data_limit > 0 else None,
-    }
-    if panel.get("inbounds") and panel["inbounds"] not in ("null", ""):
-        base_payload["inbounds"] = panel["inbounds"]
-
-    payload = UserCreateRequest(**base_payload)
-
-    if expire > 0 and panel.get("onholdstatus") == "ononhold":
-        payload.expire = None
-        payload.status = "on_hold"
-        payload.on_hold_expire_duration = expire - int(time.time())
-    else:
-        payload.expire = expire if expire > 0 else None
-
-    if is_marzban_version_above_084(location):
-        group_name = "mirza_test" if is_test else "mirza_paid"
-        group_id = get_group_id_by_name(location, group_name)
-        if group_id:
-            payload.group_ids = [group_id]
-
-    url = f"{panel['url_panel'].rstrip('/')}/api/user"
-    headers = {**_auth_headers(location), "Content-Type": "application/json"}
-    resp = session.post(url, json=payload.model_dump(exclude_none=True), headers=headers, timeout=10)
-    resp.raise_for_status()
-    return UserResponse(**resp.json())
-
-
-def modify_user(location: str, username: str, data: dict) -> dict:
-    payload = UserModifyRequest(**data)
-    panel = _get_panel(location)
-    url = f"{panel['url_panel'].rstrip('/')}/api/user/{username}"
-    headers = {**_auth_headers(location), "Content-Type": "application/json"}
-    resp = session.put(url, json=payload.model_dump(exclude_none=True), headers=headers, timeout=10)
-    resp.raise_for_status()
-    return resp.json()
-
-
-def remove_user(location: str, username: str) -> dict:
-    panel = _get_panel(location)
-    url = f"{panel['url_panel'].rstrip('/')}/api/user/{username}"
-    resp = session.delete(url, headers=_auth_headers(location), timeout=10)
-    resp.raise_for_status()
-    return resp.json()
-
-
-def revoke_subscription(username: str, location: str) -> dict:
-    panel = _get_panel(location)
-    url = f"{panel['url_panel'].rstrip('/')}/api/user/{username}/revoke_sub"
-    resp = session.post(url, headers=_auth_headers(location), timeout=10)
-    resp.raise_for_status()
-    return resp.json()
-
-
-def get_system_stats(location: str) -> SystemStats:
-    panel = _get_panel(location)
-    url = f"{panel['url_panel'].rstrip('/')}/api/system"
-    resp = session.get(url, headers=_auth_headers(location), timeout=10)
-    resp.raise_for_status()
-    return SystemStats(**resp.json())
-
-
-def is_marzban_version_above_084(location: str) -> bool:
-    stats = get_system_stats(location)
-    match = re.search(r"(\d+\.\d+\.\d+)", stats.version)
-    return tuple(map(int, match.group(1).split("."))) > (0, 8, 4) if match else False
-
-
-def get_groups(location: str) -> List[GroupResponse]:
-    panel = _get_panel(location)
-    url = f"{panel['url_panel'].rstrip('/')}/api/groups"
-    resp = session.get(url, headers=_auth_headers(location), timeout=10)
-    resp.raise_for_status()
-    data = resp.json()
-    groups = data.get("groups") or data if isinstance(data, list) else []
-    return [GroupResponse(**g) for g in groups]
-
-
-def get_group_id_by_name(location: str, name: str) -> Optional[int]:
-    for group in get_groups(location):
-        if group.name.lower() == name.lower():
-            return group.id
-    return None
-
-
-def create_group(location: str, name: str, inbound_tags: Optional[List[str]] = None) -> dict:
-    payload = GroupCreateRequest(name=name, inbound_tags=inbound_tags or [])
-    panel = _get_panel(location)
-    url = f"{panel['url_panel'].rstrip('/')}/api/group"
-    headers = {**_auth_headers(location), "Content-Type": "application/json"}
-    resp = session.post(url, json=payload.model_dump(), headers=headers, timeout=10)
-    resp.raise_for_status()
-    return resp.json()
-
-
-def get_inbound_tags(location: str) -> List[str]:
-    panel = _get_panel(location)
-    # روش جدید
+    return await clients.get(await _get_panel(location, owner_id)).add_user(username, expire, data_limit, is_test)
+
+
+async def modify_user(location: str, username: str, data: dict, owner_id: Optional[int] = None) -> dict:
+    return await clients.get(await _get_panel(location, owner_id)).modify_user(username, data)
+
+
+async def remove_user(location: str, username: str, owner_id: Optional[int] = None) -> dict:
+    return await clients.get(await _get_panel(location, owner_id)).remove_user(username)
+
+
+async def revoke_subscription(username: str, location: str, owner_id: Optional[int] = None) -> dict:
+    return await clients.get(await _get_panel(location, owner_id)).revoke_subscription(username)
+
+
+async def get_system_stats(location: str, owner_id: Optional[int] = None) -> SystemStats:
+    return await clients.get(await _get_panel(location, owner_id)).get_system_stats()
+
+
+async def is_marzban_version_above_084(location: str, owner_id: Optional[int] = None) -> bool:
+    return await clients.get(await _get_panel(location, owner_id)).is_version_above_084()
+
+
+async def get_groups(location: str, owner_id: Optional[int] = None) -> List[GroupResponse]:
+    return await clients.get(await _get_panel(location, owner_id)).get_groups()
+
+
+async def get_group_id_by_name(location: str, name: str, owner_id: Optional[int] = None) -> Optional[int]:
+    return await clients.get(await _get_panel(location, owner_id)).get_group_id_by_name(name)
+
+
+async def create_group(location: str, name: str, inbound_tags: Optional[List[str]] = None, owner_id: Optional[int] = None) -> dict:
+    return await clients.get(await _get_panel(location, owner_id)).create_group(name, inbound_tags)
+
+
+async def get_inbound_tags(location: str, owner_id: Optional[int] = None) -> List[str]:
+    return await clients.get(await _get_panel(location, owner_id)).get_inbound_tags()
+
+
+async def ensure_default_groups(location: str, owner_id: Optional[int] = None) -> None:
+    await clients.get(await _get_panel(location, owner_id)).ensure_default_groups()
+
+
+async def provision_user(
+    username: str,
+    expire: int,
+    data_limit: int,
+    volume: int,
+    owner_id: Optional[int] = None,
+    is_test: bool = False,
+    strategy: Strategy = "least_utilization",
+    key: Optional[str] = None,
+    buyer_user_id: Optional[int] = None,
+    seller_user_id: Optional[int] = None,
+) -> Tuple[Dict, UserResponse]:
+    """
+    ساخت کاربر روی پنل انتخاب شده توسط زمان‌بند.
+    volume (گیگابایت) قبل از ساخت روی پنل رزرو و در صورت خطا برگردانده می‌شود.
+    با buyer_user_id کانفیگ با panel_id همان پنل ثبت می‌شود تا همگام‌سازی مصرف پیدایش کند.
+    """
+    panel = await panel_scheduler.reserve(volume, owner_id, strategy, key)
     try:
-        url = f"{panel['url_panel'].rstrip('/')}/api/cores"
-        resp = session.get(url, headers=_auth_headers(location), timeout=10)
-        resp.raise_for_status()
-        data = resp.json()
-        tags = {i.get("tag") for c in data.get("cores", []) for i in c.get("config", {}).get("inbounds", []) if i.get("tag")}
-        if tags:
-            return list(tags)
-    except:
-        pass
-
-    # روش قدیمی
-    url = f"{panel['url_panel'].rstrip('/')}/api/inbounds"
-    resp = session.get(url, headers=_auth_headers(location), timeout=10)
-    resp.raise_for_status()
-    return [i["tag"] for i in resp.json() if i.get("tag")]
-
-
-def ensure_default_groups(location: str) -> None:
-    if not is_marzban_version_above_084(location):
-        return
-    existing = {g.name.lower() for g in get_groups(location)}
-    required = {"mirza_paid", "mirza_test"}
-    tags = get_inbound_tags(location)
-    for name in required - existing:
-        create_group(location, name, tags)
\ No newline at end of file
+        user = await clients.get(panel).add_user(username, expire, data_limit, is_test)
+    except BaseException:
+        await panel_scheduler.release(panel["id"], volume)
+        raise
+    if buyer_user_id is not None:
+        async with async_session() as session:
+            await ConfigurationRepository(ConfigurationsModel, session).add_provisioned([{
+                "panel_id": panel["id"],
+                "name": user.username,
+                "buyer_user_id": buyer_user_id,
+                "seller_user_id": seller_user_id if seller_user_id is not None else owner_id,
+                "volume": volume,
+            }])
+    return panel, user
@@ -0,0 +1,213 @@
+# health.py
+from __future__ import annotations
+
+import asyncio
+import enum
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Deque, Dict, Iterable, List, Optional
+
+from project.core.config import settings
+from project.core.errors import PanelUnavailableError
+
+
+class CircuitState(enum.Enum):
+    CLOSED = "closed" # سالم
+    OPEN = "open" # قطع؛ درخواست‌ها فورا رد می‌شوند
+    HALF_OPEN = "half_open" # در حال آزمایش
+
+
+@dataclass
+class PanelHealth:
+    panel_id: int
+    state: CircuitState = CircuitState.CLOSED
+    consecutive_failures: int = 0
+    opened_at: float = 0.0
+    latency_ewma: Optional[float] = None # ثانیه
+    in_flight: int = 0
+    outcomes: Deque[bool] = field(default_factory=lambda: deque(maxlen=settings.PANEL_HEALTH_WINDOW))
+
+    @property
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+    @property
+    def available(self) -> bool:
+        return self.state is CircuitState.CLOSED
+
+
+ProbeFunc = Callable[[], Awaitable[object]]
+
+
+class PanelHealthRegistry:
+    """
+    ثبت تاخیر و خطای هر پنل و مدار قطع‌کن (circuit breaker).
+    بعد از failure_threshold خطای پشت سر هم مدار باز می‌شود و پس از open_timeout
+    یک درخواست آزمایشی در پس‌زمینه ارسال می‌شود تا پنل دوباره فعال شود.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: Optional[int] = None,
+        open_timeout: Optional[float] = None,
+        ewma_alpha: float = 0.2,
+    ):
+        self.failure_threshold = failure_threshold or settings.PANEL_FAILURE_THRESHOLD
+        self.open_timeout = open_timeout or settings.PANEL_OPEN_TIMEOUT
+        self.ewma_alpha = ewma_alpha
+        self._panels: Dict[int, PanelHealth] = {}
+        self._probes: Dict[int, ProbeFunc] = {}
+        self._probe_tasks: Dict[int, asyncio.Task] = {}
+
+    def get(self, panel_id: int) -> PanelHealth:
+        health = self._panels.get(panel_id)
+        if health is None:
+            health = self._panels[panel_id] = PanelHealth(panel_id=panel_id)
+        return health
+
+    def snapshot(self) -> List[PanelHealth]:
+        return list(self._panels.values())
+
+    def set_probe(self, panel_id: int, probe: ProbeFunc) -> None:
+        self._probes[panel_id] = probe
+
+    def forget(self, panel_id: int) -> None:
+        self._panels.pop(panel_id, None)
+        self._probes.pop(panel_id, None)
+        task = self._probe_tasks.pop(panel_id, None)
+        if task:
+            task.cancel()
+
+    def is_available(self, panel_id: int) -> bool:
+        health = self._panels.get(panel_id)
+        return health is None or health.available
+
+    # ────── CALL TRACKING ──────
+    def before_call(self, panel_id: int) -> float:
+        health = self.get(panel_id)
+        if health.state is not CircuitState.CLOSED:
+            self._maybe_probe(health)
+            raise PanelUnavailableError(panel_id, f"circuit {health.state.value}")
+        health.in_flight += 1
+        return time.monotonic()
+
+    def release(self, panel_id: int) -> None:
+        """آزاد کردن جای درخواست در جریان بدون ثبت نتیجه (مثلا درخواست لغو شده)"""
+        health = self.get(panel_id)
+        health.in_flight = max(health.in_flight - 1, 0)
+
+    def record_success(self, panel_id: int, started: float) -> None:
+        health = self.get(panel_id)
+        health.in_flight = max(health.in_flight - 1, 0)
+        self._observe_latency(health, time.monotonic() - started)
+        health.outcomes.append(True)
+        health.consecutive_failures = 0
+
+    def record_failure(self, panel_id: int, started: float) -> None:
+        health = self.get(panel_id)
+        health.in_flight = max(health.in_flight - 1, 0)
+        self._observe_latency(health, time.monotonic() - started)
+        health.outcomes.append(False)
+        health.consecutive_failures += 1
+        if health.consecutive_failures >= self.failure_threshold:
+            self._open(health)
+
+    def _observe_latency(self, health: PanelHealth, elapsed: float) -> None:
+        if health.latency_ewma is None:
+            health.latency_ewma = elapsed
+        else:
+            health.latency_ewma += self.ewma_alpha * (elapsed - health.latency_ewma)
+
+    # ────── CIRCUIT ──────
+    def _open(self, health: PanelHealth) -> None:
+        health.state = CircuitState.OPEN
+        health.opened_at = time.monotonic()
+
+    def _close(self, health: PanelHealth) -> None:
+        health.state = CircuitState.CLOSED
+        health.consecutive_failures = 0
+        health.outcomes.clear()
+
+    def _maybe_probe(self, health: PanelHealth) -> None:
+        if health.state is not CircuitState.OPEN:
+            return
+        if time.monotonic() - health.opened_at < self.open_timeout:
+            return
+        probe = self._probes.get(health.panel_id)
+        task = self._probe_tasks.get(health.panel_id)
+        if probe is None or (task and not task.done()):
+            return
+        health.state = CircuitState.HALF_OPEN
+        self._probe_tasks[health.panel_id] = asyncio.create_task(self._probe(health, probe))
+
+    async def _probe(self, health: PanelHealth, probe: ProbeFunc) -> None:
+        started = time.monotonic()
+        try:
+            await probe()
+        except Exception:
+            self._open(health)
+            return
+        self._observe_latency(health, time.monotonic() - started)
+        self._close(health)
+
+    async def probe_open_panels(self) -> None:
+        """برای اجرای دوره‌ای؛ پنل‌هایی که مدتشان گذشته را آزمایش می‌کند"""
+        for health in self.snapshot():
+            self._maybe_probe(health)
+        tasks = [t for t in self._probe_tasks.values() if not t.done()]
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def run_prober(self, stop_event: Optional[asyncio.Event] = None) -> None:
+        stop_event = stop_event or asyncio.Event()
+        while not stop_event.is_set():
+            await self.probe_open_panels()
+            try:
+                await asyncio.wait_for(stop_event.wait(), timeout=self.open_timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    # ────── SELECTION ──────
+    def healthy(self, panels: Iterable[dict]) -> List[dict]:
+        return [panel for panel in panels if self.is_available(panel["id"])]
+
+    def pick_least_loaded(
+        self, panels: Iterable[dict], utilization: Optional[Callable[[dict], float]] = None
+    ) -> dict:
+        """
+        انتخاب پنل فعال و سالم با کمترین نسبت used_volume به max_volume (یا تابع utilization داده شده)؛
+        در صورت برابری، پنل با درخواست‌های در جریان و تاخیر کمتر.
+        """
+        utilization = utilization or _utilization
+        candidates = [
+            panel for panel in self.healthy(panels)
+            if panel.get("is_active", True) and _free_volume(panel) > 0
+        ]
+        if not candidates:
+            raise PanelUnavailableError(None, "no healthy panel with free capacity")
+
+        def _key(panel: dict):
+            health = self.get(panel["id"])
+            return (utilization(panel), health.in_flight, health.latency_ewma or 0.0)
+
+        return min(candidates, key=_key)
+
+
+def _free_volume(panel: dict) -> float:
+    max_volume = panel.get("max_volume")
+    if not max_volume:
+        return float("inf")
+    return max_volume - (panel.get("used_volume") or 0)
+
+
+def _utilization(panel: dict) -> float:
+    max_volume = panel.get("max_volume")
+    if not max_volume:
+        return 0.0
+    return (panel.get("used_volume") or 0) / max_volume
+
+
+health_registry = PanelHealthRegistry()
@@ -0,0 +1,67 @@
+# metadata.py
+from __future__ import annotations
+
+import asyncio
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from project.core.config import settings
+
+
+def version_above_084(version: str) -> bool:
+    match = re.search(r"(\d+\.\d+\.\d+)", version)
+    return tuple(map(int, match.group(1).split("."))) > (0, 8, 4) if match else False
+
+
+@dataclass
+class PanelMetadata:
+    version: str
+    groups: Dict[str, int] = field(default_factory=dict) # نام گروه (حروف کوچک) -> شناسه
+    inbound_tags: List[str] = field(default_factory=list)
+    fetched_at: float = field(default_factory=time.time)
+
+    @property
+    def above_084(self) -> bool:
+        return version_above_084(self.version)
+
+    def group_id(self, name: str) -> Optional[int]:
+        return self.groups.get(name.lower())
+
+
+MetadataLoader = Callable[[], Awaitable[PanelMetadata]]
+
+
+class PanelMetadataCache:
+    """کش نسخه، گروه‌ها و تگ‌های inbound هر پنل با TTL و امکان باطل‌سازی دستی"""
+
+    def __init__(self, ttl: Optional[float] = None):
+        self.ttl = settings.MARZBAN_METADATA_TTL if ttl is None else ttl
+        self._items: Dict[int, PanelMetadata] = {}
+        self._locks: Dict[int, asyncio.Lock] = {}
+
+    def peek(self, panel_id: int) -> Optional[PanelMetadata]:
+        meta = self._items.get(panel_id)
+        if meta and time.time() - meta.fetched_at < self.ttl:
+            return meta
+        return None
+
+    async def get(self, panel_id: int, loader: MetadataLoader) -> PanelMetadata:
+        meta = self.peek(panel_id)
+        if meta:
+            return meta
+        lock = self._locks.setdefault(panel_id, asyncio.Lock())
+        async with lock:
+            meta = self.peek(panel_id)
+            if meta:
+                return meta
+            meta = await loader()
+            self._items[panel_id] = meta
+            return meta
+
+    def invalidate(self, panel_id: int) -> None:
+        self._items.pop(panel_id, None)
+
+
+metadata_cache = PanelMetadataCache()
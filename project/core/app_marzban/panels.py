@@ -0,0 +1,21 @@
+# panels.py
+from __future__ import annotations
+
+from typing import Dict
+
+from project.db.models import ConfigurationPanelModel
+
+
+def panel_from_model(panel_obj: ConfigurationPanelModel) -> Dict:
+    """تبدیل ردیف پنل دیتابیس به دیکشنری مورد استفاده کلاینت مرزبان"""
+    return {
+        "id": panel_obj.id,
+        "user_core": panel_obj.user_core,
+        "name": panel_obj.name,
+        "url_panel": panel_obj.url_address,
+        "username_panel": panel_obj.username,
+        "password_panel": panel_obj.password,
+        "max_volume": panel_obj.max_volume,
+        "used_volume": panel_obj.used_volume,
+        "is_active": panel_obj.is_active,
+    }
@@ -0,0 +1,318 @@
+# scheduler.py
+from __future__ import annotations
+
+import asyncio
+import bisect
+import hashlib
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Literal, Optional, Set, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import Session
+
+from project.core.config import settings
+from project.core.errors import PanelUnavailableError
+from project.core.repositories.configuration import ConfigurationPanelRepository
+from project.db.database import async_session
+from project.db.models import ConfigurationPanelModel
+
+from .health import PanelHealthRegistry, health_registry
+from .panels import panel_from_model
+
+
+Strategy = Literal["least_utilization", "consistent_hash"]
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+@dataclass
+class PanelCapacity:
+    panel: dict
+    max_volume: Optional[int]
+    is_active: bool = True
+    weight: float = 1.0
+
+    @property
+    def panel_id(self) -> int:
+        return self.panel["id"]
+
+    # حجم رزرو شده در همان دیکشنری پنل نگه‌داری می‌شود تا انتخاب سلامت‌محور (pick_least_loaded) مقدار به‌روز را ببیند
+    @property
+    def used_volume(self) -> int:
+        return self.panel.get("used_volume") or 0
+
+    @used_volume.setter
+    def used_volume(self, value: int) -> None:
+        self.panel["used_volume"] = value
+
+    @property
+    def owner_id(self) -> int:
+        return self.panel["user_core"]
+
+    def fits(self, volume: int) -> bool:
+        return not self.max_volume or self.used_volume + volume <= self.max_volume
+
+    def score(self, volume: int) -> float:
+        if not self.max_volume:
+            return 0.0
+        return (self.used_volume + volume) / self.max_volume / self.weight
+
+
+class PanelScheduler:
+    """
+    انتخاب پنل برای کانفیگ جدید.
+    ظرفیت پنل‌ها در اولین استفاده از دیتابیس خوانده و در حافظه نگه‌داری می‌شود و با هر رزرو به‌روز می‌شود.
+    بعد از تغییر پنل‌ها یا گذشت refresh_interval دوباره از دیتابیس خوانده می‌شود.
+    """
+
+    def __init__(
+        self,
+        health: PanelHealthRegistry = health_registry,
+        virtual_nodes: int = 64,
+        session_factory: async_sessionmaker = async_session,
+        refresh_interval: Optional[float] = None,
+    ):
+        self.health = health
+        self.virtual_nodes = virtual_nodes
+        self.session_factory = session_factory
+        self.refresh_interval = refresh_interval or settings.PANEL_SCHEDULER_REFRESH
+        self._panels: Dict[int, PanelCapacity] = {}
+        self._names: Dict[str, Dict[int, int]] = {} # نام پنل -> {شناسه مالک: شناسه پنل}
+        self._ring: List[Tuple[int, int]] = []
+        self._weights: Dict[int, float] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+
+    # ────── STATE ──────
+    async def load(self, session: AsyncSession, weights: Optional[Dict[int, float]] = None) -> None:
+        panel_objs = await ConfigurationPanelRepository(ConfigurationPanelModel, session).all_panels()
+        self.replace(panel_objs, weights)
+
+    @property
+    def is_fresh(self) -> bool:
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at < self.refresh_interval
+
+    async def ensure_loaded(self) -> None:
+        """بارگذاری پنل‌ها از دیتابیس اگر هنوز خوانده نشده یا کهنه شده باشند (single-flight)"""
+        if self.is_fresh:
+            return
+        async with self._lock:
+            if self.is_fresh:
+                return
+            async with self.session_factory() as session:
+                await self.load(session, self._weights)
+
+    def invalidate(self) -> None:
+        # داده فعلی تا بارگذاری بعدی قابل استفاده می‌ماند
+        self._loaded_at = None
+
+    def replace(self, panel_objs: Iterable[ConfigurationPanelModel], weights: Optional[Dict[int, float]] = None) -> None:
+        weights = self._weights = weights or {}
+        panels = {}
+        for panel_obj in panel_objs:
+            panels[panel_obj.id] = PanelCapacity(
+                panel=panel_from_model(panel_obj),
+                max_volume=panel_obj.max_volume,
+                is_active=bool(panel_obj.is_active),
+                weight=weights.get(panel_obj.id, 1.0),
+            )
+        self._panels = panels
+        # نام پنل فقط برای هر مالک یکتاست
+        names: Dict[str, Dict[int, int]] = {}
+        for panel_id, capacity in panels.items():
+            if capacity.panel.get("name"):
+                names.setdefault(capacity.panel["name"], {})[capacity.owner_id] = panel_id
+        self._names = names
+        self._build_ring()
+        self._loaded_at = time.monotonic()
+
+    def _build_ring(self) -> None:
+        ring = []
+        for panel_id, capacity in self._panels.items():
+            for i in range(max(int(self.virtual_nodes * capacity.weight), 1)):
+                ring.append((_hash(f"{panel_id}:{i}"), panel_id))
+        ring.sort()
+        self._ring = ring
+
+    def _find(self, location: str | int, owner_id: Optional[int] = None) -> Optional[PanelCapacity]:
+        if isinstance(location, int) or location.isdigit():
+            capacity = self._panels.get(int(location))
+        else:
+            owners = self._names.get(location, {})
+            if owner_id is None and len(owners) > 1:
+                raise PanelUnavailableError(None, f"panel name {location!r} is ambiguous; owner_id is required")
+            panel_id = owners.get(owner_id) if owner_id is not None else next(iter(owners.values()), None)
+            capacity = self._panels.get(panel_id)
+        if capacity is not None and owner_id is not None and capacity.owner_id != owner_id:
+            return None
+        return capacity
+
+    def get_panel(self, location: str | int, owner_id: Optional[int] = None) -> dict:
+        """location نام یا شناسه پنل است؛ با owner_id فقط پنل‌های همان نماینده جستجو می‌شوند"""
+        capacity = self._find(location, owner_id)
+        if capacity is None:
+            raise PanelUnavailableError(None, f"unknown panel {location!r}")
+        return capacity.panel
+
+    async def resolve(self, location: str | int, owner_id: Optional[int] = None) -> dict:
+        """مانند get_panel ولی در صورت نبودن پنل در حافظه، یک بار از دیتابیس می‌خواند"""
+        await self.ensure_loaded()
+        if self._find(location, owner_id) is None:
+            # ممکن است پنل بعد از آخرین بارگذاری (یا در پروسه دیگری) ساخته شده باشد
+            self.invalidate()
+            await self.ensure_loaded()
+        return self.get_panel(location, owner_id)
+
+    # ────── SELECTION ──────
+    def _eligible(self, capacity: PanelCapacity, volume: int, owner_id: Optional[int] = None) -> bool:
+        return (
+            (owner_id is None or capacity.owner_id == owner_id)
+            and capacity.is_active
+            and capacity.fits(volume)
+            and self.health.is_available(capacity.panel_id)
+        )
+
+    def pick(
+        self,
+        volume: int = 0,
+        strategy: Strategy = "least_utilization",
+        key: Optional[str] = None,
+        owner_id: Optional[int] = None,
+    ) -> dict:
+        capacity = self._select(volume, strategy, key, owner_id)
+        if capacity is None:
+            raise PanelUnavailableError(None, "no healthy panel with free capacity")
+        return capacity.panel
+
+    def _select(
+        self,
+        volume: int,
+        strategy: Strategy,
+        key: Optional[str],
+        owner_id: Optional[int],
+        excluded: Set[int] = frozenset(),
+    ) -> Optional[PanelCapacity]:
+        if strategy == "consistent_hash":
+            if key is None:
+                raise ValueError("consistent_hash strategy needs a key (user unique_id)")
+            return self._pick_hashed(key, volume, owner_id, excluded)
+        return self._pick_least_utilized(volume, owner_id, excluded)
+
+    def _pick_least_utilized(
+        self, volume: int, owner_id: Optional[int], excluded: Set[int]
+    ) -> Optional[PanelCapacity]:
+        candidates = [
+            c.panel for c in self._panels.values()
+            if c.panel_id not in excluded and self._eligible(c, volume, owner_id)
+        ]
+        if not candidates:
+            return None
+        # بین پنل‌های سالم، کمترین نسبت وزن‌دار و سپس کمترین درخواست در جریان و تاخیر
+        panel = self.health.pick_least_loaded(candidates, lambda p: self._panels[p["id"]].score(volume))
+        return self._panels[panel["id"]]
+
+    def _pick_hashed(
+        self, key: str, volume: int, owner_id: Optional[int], excluded: Set[int]
+    ) -> Optional[PanelCapacity]:
+        if not self._ring:
+            return None
+        start = bisect.bisect(self._ring, (_hash(key), -1))
+        seen = set()
+        # در صورت پر یا ناسالم بودن پنل (یا تعلق آن به نماینده دیگر)، پنل بعدی روی حلقه انتخاب می‌شود
+        for offset in range(len(self._ring)):
+            panel_id = self._ring[(start + offset) % len(self._ring)][1]
+            if panel_id in seen:
+                continue
+            seen.add(panel_id)
+            capacity = self._panels[panel_id]
+            if panel_id not in excluded and self._eligible(capacity, volume, owner_id):
+                return capacity
+            if len(seen) == len(self._panels):
+                break
+        return None
+
+    # ────── RESERVATION ──────
+    async def reserve(
+        self,
+        volume: int,
+        owner_id: Optional[int] = None,
+        strategy: Strategy = "least_utilization",
+        key: Optional[str] = None,
+    ) -> dict:
+        """
+        انتخاب پنل و رزرو حجم روی آن.
+        رزرو ابتدا در حافظه ثبت می‌شود (بین انتخاب و افزایش await وجود ندارد) و سپس با UPDATE محافظت شده
+        در دیتابیس؛ اگر پنل در این فاصله توسط پروسه دیگری پر شده باشد پنل بعدی امتحان می‌شود.
+        """
+        await self.ensure_loaded()
+        excluded: Set[int] = set()
+        while True:
+            capacity = self._select(volume, strategy, key, owner_id, excluded)
+            if capacity is None:
+                raise PanelUnavailableError(None, "no healthy panel with free capacity")
+            capacity.used_volume += volume
+            try:
+                async with self.session_factory() as session:
+                    used_volume = await ConfigurationPanelRepository(ConfigurationPanelModel, session).reserve_volume(
+                        capacity.panel_id, volume
+                    )
+            except BaseException:
+                capacity.used_volume = max(capacity.used_volume - volume, 0)
+                raise
+            if used_volume is not None:
+                return capacity.panel
+            capacity.used_volume = max(capacity.used_volume - volume, 0)
+            excluded.add(capacity.panel_id)
+            # ظرفیت حافظه با دیتابیس یکی نیست؛ در استفاده بعدی دوباره خوانده می‌شود
+            self.invalidate()
+
+    async def release(self, panel_id: int, volume: int) -> None:
+        """برگرداندن حجم رزرو شده (مثلا وقتی ساخت کاربر روی پنل ناموفق بود)"""
+        capacity = self._panels.get(panel_id)
+        if capacity is not None:
+            capacity.used_volume = max(capacity.used_volume - volume, 0)
+        async with self.session_factory() as session:
+            await ConfigurationPanelRepository(ConfigurationPanelModel, session).release_volume(panel_id, volume)
+
+
+panel_scheduler = PanelScheduler()
+
+
+# ────── ORM events ──────
+# ساخت، ویرایش یا حذف پنل بعد از commit باعث بارگذاری دوباره زمان‌بند می‌شود
+_CHANGED_KEY = "changed_configuration_panels"
+
+
+def _mark_changed(mapper, connection, target: ConfigurationPanelModel) -> None:
+    session = Session.object_session(target)
+    if session is not None:
+        session.info[_CHANGED_KEY] = True
+
+
+for _event_name in ("after_insert", "after_update", "after_delete"):
+    event.listen(ConfigurationPanelModel, _event_name, _mark_changed)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _mark_bulk_deleted(orm_execute_state) -> None:
+    # UPDATE گروهی فقط used_volume را تغییر می‌دهد که زمان‌بند خودش نگه می‌دارد؛ DELETE گروهی پنل حذف می‌کند
+    if orm_execute_state.is_delete and (
+        orm_execute_state.bind_mapper is not None
+        and orm_execute_state.bind_mapper.class_ is ConfigurationPanelModel
+    ):
+        orm_execute_state.session.info[_CHANGED_KEY] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_changed(session: Session) -> None:
+    if session.info.pop(_CHANGED_KEY, False):
+        panel_scheduler.invalidate()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_changed(session: Session) -> None:
+    session.info.pop(_CHANGED_KEY, None)
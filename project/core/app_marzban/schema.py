@@ -83,7 +83,40 @@ class UserResponse(BaseModel):
     group_ids: Optional[List[int]] = None
 
 
+class UsersResponse(BaseModel):
+    users: List[UserResponse] = []
+    total: int = 0
+
+
 class GroupResponse(BaseModel):
     id: int
     name: str
-    inbound_tags: Optional[List[str]] = None
\ No newline at end of file
+    inbound_tags: Optional[List[str]] = None
+
+
+class ProvisionRequest(BaseModel):
+    # بدون panel، پنل توسط زمان‌بند از بین پنل‌های owner_id انتخاب و volume (گیگابایت) روی آن رزرو می‌شود
+    panel: Optional[Dict[str, Any]] = None
+    payload: UserCreateRequest
+    is_test: bool = False
+    owner_id: Optional[int] = None
+    volume: int = 0
+    # با buyer_user_id کانفیگ ساخته شده با panel_id همان پنل ثبت می‌شود؛ فروشنده پیش‌فرض owner_id است
+    buyer_user_id: Optional[int] = None
+    seller_user_id: Optional[int] = None
+
+    @property
+    def seller_id(self) -> Optional[int]:
+        return self.seller_user_id if self.seller_user_id is not None else self.owner_id
+
+
+class ProvisionResult(BaseModel):
+    index: int
+    panel_id: Optional[int] = None
+    username: str
+    user: Optional[UserResponse] = None
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
@@ -0,0 +1,122 @@
+# token.py
+from __future__ import annotations
+
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, Optional
+
+from jose import jwt
+
+from project.core.config import settings
+from project.core.errors import PanelAuthError
+
+from .schema import AdminTokenResponse
+
+
+LoginFunc = Callable[[], Awaitable[AdminTokenResponse]]
+
+# اگر توکن فیلد exp نداشت همان رفتار قبلی (یک ساعت) حفظ می‌شود
+DEFAULT_TOKEN_TTL = 3600
+
+
+def token_expires_at(token: AdminTokenResponse, now: Optional[float] = None) -> float:
+    now = time.time() if now is None else now
+    try:
+        exp = jwt.get_unverified_claims(token.access_token).get("exp")
+    except Exception:
+        exp = None
+    return float(exp) if exp else now + DEFAULT_TOKEN_TTL
+
+
+@dataclass
+class _TokenEntry:
+    token: Optional[AdminTokenResponse] = None
+    expires_at: float = 0.0
+    error: Optional[str] = None
+    failed_at: float = 0.0
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    refresh_task: Optional[asyncio.Task] = None
+
+
+class PanelTokenManager:
+    """
+    کش توکن ادمین پنل‌ها بر اساس exp واقعی توکن.
+    در هر لحظه فقط یک درخواست ورود برای هر پنل اجرا می‌شود و بقیه منتظر نتیجه آن می‌مانند.
+    """
+
+    def __init__(
+        self,
+        refresh_margin: Optional[float] = None,
+        failure_backoff: Optional[float] = None,
+    ):
+        self.refresh_margin = settings.MARZBAN_TOKEN_REFRESH_MARGIN if refresh_margin is None else refresh_margin
+        self.failure_backoff = settings.MARZBAN_LOGIN_BACKOFF if failure_backoff is None else failure_backoff
+        self._entries: Dict[int, _TokenEntry] = {}
+
+    def _entry(self, panel_id: int) -> _TokenEntry:
+        entry = self._entries.get(panel_id)
+        if entry is None:
+            entry = self._entries[panel_id] = _TokenEntry()
+        return entry
+
+    async def get(self, panel_id: int, login: LoginFunc) -> AdminTokenResponse:
+        entry = self._entry(panel_id)
+        now = time.time()
+        if entry.token and now < entry.expires_at:
+            if now >= entry.expires_at - self.refresh_margin:
+                self._schedule_refresh(panel_id, entry, login)
+            return entry.token
+
+        async with entry.lock:
+            now = time.time()
+            if entry.token and now < entry.expires_at:
+                return entry.token
+            if entry.error and now - entry.failed_at < self.failure_backoff:
+                raise PanelAuthError(panel_id, entry.error)
+            return await self._login(panel_id, entry, login)
+
+    def invalidate(self, panel_id: int, token: Optional[AdminTokenResponse] = None) -> None:
+        # اگر توکن مشخص شده باشد فقط همان باطل می‌شود تا توکن تازه‌ای که هم‌زمان گرفته شده از بین نرود
+        entry = self._entries.get(panel_id)
+        if entry is None or (token is not None and entry.token is not token):
+            return
+        entry.token = None
+        entry.expires_at = 0.0
+
+    def discard(self, panel_id: int) -> None:
+        entry = self._entries.pop(panel_id, None)
+        if entry and entry.refresh_task:
+            entry.refresh_task.cancel()
+
+    async def _login(self, panel_id: int, entry: _TokenEntry, login: LoginFunc) -> AdminTokenResponse:
+        try:
+            token = await login()
+        except Exception as e:
+            entry.error = str(e)
+            entry.failed_at = time.time()
+            raise PanelAuthError(panel_id, entry.error) from e
+        entry.token = token
+        entry.expires_at = token_expires_at(token)
+        entry.error = None
+        return token
+
+    def _schedule_refresh(self, panel_id: int, entry: _TokenEntry, login: LoginFunc) -> None:
+        if entry.refresh_task and not entry.refresh_task.done():
+            return
+        if entry.error and time.time() - entry.failed_at < self.failure_backoff:
+            return
+        entry.refresh_task = asyncio.create_task(self._refresh(panel_id, entry, login))
+
+    async def _refresh(self, panel_id: int, entry: _TokenEntry, login: LoginFunc) -> None:
+        async with entry.lock:
+            if entry.token and time.time() < entry.expires_at - self.refresh_margin:
+                return
+            try:
+                await self._login(panel_id, entry, login)
+            except PanelAuthError:
+                # توکن فعلی تا زمان انقضا معتبر است؛ تلاش بعدی پس از failure_backoff انجام می‌شود
+                pass
+
+
+token_manager = PanelTokenManager()
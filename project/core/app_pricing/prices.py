@@ -0,0 +1,112 @@
+# prices.py
+from __future__ import annotations
+
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, Iterable, Optional, Set
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from project.core.config import settings
+from project.db.models import RepresentativesCoreModel
+
+
+@dataclass(frozen=True)
+class PricePair:
+    user_id: int # شناسه هسته کاربر نماینده
+    selling: int # قیمت پایه فروش
+    purchase: int # قیمت پایه خرید
+    fetched_at: float = field(default_factory=time.time, compare=False)
+
+
+PriceLoader = Callable[[int], Awaitable[Optional[PricePair]]]
+PriceTableLoader = Callable[[], Awaitable[Iterable[PricePair]]]
+
+
+class RepresentativePriceCache:
+    """
+    کش قیمت پایه خرید/فروش همه نماینده‌ها.
+    با commit هر تغییر در RepresentativesCoreModel باطل می‌شود و TTL فقط برای تغییرات پروسه‌های دیگر است.
+    """
+
+    def __init__(self, ttl: Optional[float] = None):
+        self.ttl = settings.PRICE_CACHE_TTL if ttl is None else ttl
+        self._items: Dict[int, PricePair] = {}
+        self._locks: Dict[int, asyncio.Lock] = {}
+
+    def peek(self, user_id: int) -> Optional[PricePair]:
+        prices = self._items.get(user_id)
+        if prices and time.time() - prices.fetched_at < self.ttl:
+            return prices
+        return None
+
+    async def get(self, user_id: int, loader: PriceLoader) -> Optional[PricePair]:
+        prices = self.peek(user_id)
+        if prices:
+            return prices
+        lock = self._locks.setdefault(user_id, asyncio.Lock())
+        async with lock:
+            prices = self.peek(user_id)
+            if prices:
+                return prices
+            prices = await loader(user_id)
+            if prices:
+                self._items[user_id] = prices
+            return prices
+
+    async def warm(self, loader: PriceTableLoader) -> int:
+        """بارگذاری جدول قیمت همه نماینده‌ها با یک کوئری"""
+        items = {prices.user_id: prices for prices in await loader()}
+        self._items.update(items)
+        return len(items)
+
+    def invalidate(self, user_id: Optional[int] = None) -> None:
+        if user_id is None:
+            self._items.clear()
+        else:
+            self._items.pop(user_id, None)
+
+
+price_cache = RepresentativePriceCache()
+
+
+# ────── ORM events ──────
+# شناسه نماینده‌های تغییر کرده در session.info جمع می‌شوند و بعد از commit از کش حذف می‌شوند
+_CHANGED_KEY = "changed_representative_prices"
+
+
+def _mark_changed(mapper, connection, target: RepresentativesCoreModel) -> None:
+    session = Session.object_session(target)
+    if session is not None:
+        session.info.setdefault(_CHANGED_KEY, set()).add(target.user_core)
+
+
+for _event_name in ("after_insert", "after_update", "after_delete"):
+    event.listen(RepresentativesCoreModel, _event_name, _mark_changed)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _mark_bulk_changed(orm_execute_state) -> None:
+    # UPDATE/DELETE گروهی ORM رویداد ردیفی ندارند؛ کل کش باطل می‌شود
+    if (orm_execute_state.is_update or orm_execute_state.is_delete) and (
+        orm_execute_state.bind_mapper is not None
+        and orm_execute_state.bind_mapper.class_ is RepresentativesCoreModel
+    ):
+        orm_execute_state.session.info.setdefault(_CHANGED_KEY, set()).add(None)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_changed(session: Session) -> None:
+    changed: Set[Optional[int]] = session.info.pop(_CHANGED_KEY, set())
+    if None in changed:
+        price_cache.invalidate()
+        return
+    for user_id in changed:
+        price_cache.invalidate(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_changed(session: Session) -> None:
+    session.info.pop(_CHANGED_KEY, None)
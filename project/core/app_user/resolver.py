@@ -0,0 +1,72 @@
+# resolver.py
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Set, Tuple
+
+from project.core.config import settings
+
+
+ChatKey = Tuple[int, str] # (شناسه بالادستی/بات، شناسه چت تلگرام)
+
+
+class DownstreamUserCache:
+    """
+    LRU نگاشت (بالادستی، شناسه چت) به شناسه کاربر پایین‌دستی برای پیام‌های ورودی بات‌ها.
+    فقط شناسه نگه داشته می‌شود؛ خود کاربر با یک get روی کلید اصلی خوانده و اعتبارسنجی می‌شود.
+    """
+
+    def __init__(self, max_size: Optional[int] = None):
+        self.max_size = max_size or settings.DOWNSTREAM_CACHE_SIZE
+        self.hits = 0
+        self.misses = 0
+        self._items: "OrderedDict[ChatKey, int]" = OrderedDict()
+        self._keys: Dict[int, Set[ChatKey]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, upstream_id: int, tel_chat_id: str) -> Optional[int]:
+        key = (upstream_id, tel_chat_id)
+        with self._lock:
+            user_id = self._items.get(key)
+            if user_id is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return user_id
+
+    def put(self, upstream_id: int, tel_chat_id: str, user_id: int) -> None:
+        key = (upstream_id, tel_chat_id)
+        with self._lock:
+            previous = self._items.get(key)
+            if previous is not None and previous != user_id:
+                # کلید به کاربر دیگری رسیده؛ invalidate_user کاربر قبلی نباید این نگاشت را حذف کند
+                self._discard_key(previous, key)
+            self._items[key] = user_id
+            self._items.move_to_end(key)
+            self._keys.setdefault(user_id, set()).add(key)
+            while len(self._items) > self.max_size:
+                old_key, old_user_id = self._items.popitem(last=False)
+                self._discard_key(old_user_id, old_key)
+
+    def invalidate_user(self, user_id: int) -> None:
+        """حذف همه نگاشت‌های یک کاربر؛ بعد از حذف یا جابه‌جایی کاربر"""
+        with self._lock:
+            for key in self._keys.pop(user_id, ()):
+                self._items.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self._keys.clear()
+
+    def _discard_key(self, user_id: int, key: ChatKey) -> None:
+        keys = self._keys.get(user_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys[user_id]
+
+
+downstream_users = DownstreamUserCache()
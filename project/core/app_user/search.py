@@ -0,0 +1,76 @@
+# search.py
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+from project.db.models import UserCoreModel
+
+
+# ستون‌هایی از هسته کاربر که در سند جستجو هستند؛ تغییر آن‌ها یعنی ایندکس دوباره
+SEARCH_FIELDS = frozenset({"first_name", "last_name", "tel_chat_id", "tel_user_id"})
+
+# کوئری‌های کوتاه‌تر از این با LIKE پیشوندی جستجو می‌شوند
+MIN_TRIGRAM_QUERY = 3
+
+# حداقل نسبت سه‌حرفی‌های مشترک کوئری و سند برای تطبیق تقریبی روی sqlite
+SIMILARITY_THRESHOLD = 0.5
+
+_CHAR_MAP = str.maketrans({
+    **{chr(0x06F0 + i): str(i) for i in range(10)}, # ارقام فارسی
+    **{chr(0x0660 + i): str(i) for i in range(10)}, # ارقام عربی
+    "ي": "ی",
+    "ى": "ی",
+    "ك": "ک",
+    "ة": "ه",
+    "‌": " ", # نیم‌فاصله
+})
+_SPACES = re.compile(r"\s+")
+
+
+def normalize(value: Optional[str]) -> str:
+    """یکسان‌سازی ارقام و حروف عربی/فارسی، حروف کوچک و فاصله‌ها؛ برای سند و کوئری"""
+    if not value:
+        return ""
+    return _SPACES.sub(" ", str(value).translate(_CHAR_MAP).lower()).strip()
+
+
+def build_document(*values: Optional[str]) -> str:
+    """سند جستجوی کاربر: نام، نام خانوادگی، تلفن و شناسه‌های تلگرام با فاصله از هم"""
+    parts = [normalize(value) for value in values]
+    phone = normalize(values[2]) if len(values) > 2 else ""
+    if phone.startswith("0") and len(phone) > 1:
+        # شماره با پیش‌شماره کشور هم پیدا شود
+        parts.append("98" + phone[1:])
+    return " ".join(part for part in parts if part)
+
+
+def trigrams(query: str) -> list[str]:
+    return list(dict.fromkeys(query[i:i + 3] for i in range(len(query) - 2)))
+
+
+def fts_match(query: str) -> str:
+    """
+    عبارت MATCH برای FTS5 با tokenizer سه‌حرفی: تطبیق کامل زیررشته یا هر سه‌حرفی کوئری؛
+    سندهایی که سه‌حرفی‌های بیشتری دارند رتبه bm25 بهتری می‌گیرند (تطبیق تقریبی).
+    """
+    def quote(term: str) -> str:
+        return '"' + term.replace('"', '""') + '"'
+
+    terms = [quote(query), *(quote(term) for term in trigrams(query))]
+    return " OR ".join(dict.fromkeys(terms))
+
+
+def escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+@dataclass
+class SearchHit:
+    user: UserCoreModel
+    score: float
+
+
+def users_of(hits: Iterable[SearchHit]) -> list[UserCoreModel]:
+    return [hit.user for hit in hits]
@@ -4,6 +4,9 @@ from typing import Optional
 from datetime import datetime, timedelta, timezone 
 from passlib.context import CryptContext
 from project.core.config import settings
+
+from .hashing import password_hasher
+from .tokens import verified_tokens
  
 
 
@@ -21,6 +24,15 @@ def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
 
+# نسخه‌های async برای کد async؛ bcrypt روی thread pool محدود اجرا می‌شود
+async def hash_password_async(password: str) -> str:
+    return await password_hasher.run(pwd_context.hash, password)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await password_hasher.run(pwd_context.verify, plain_password, hashed_password)
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     expire = datetime.now(timezone.utc) + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
@@ -29,6 +41,10 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
 
 
 def decode_access_token(token: str):
+    # توکن تکراری بدون بررسی دوباره امضا از کش خوانده می‌شود
+    cached = verified_tokens.get(token)
+    if cached is not None:
+        return cached
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id_str = payload.get("sub")
@@ -36,6 +52,8 @@ def decode_access_token(token: str):
         if not user_id_str or token_pwd_ts is None:
             raise ValueError("Invalid token")
         
+        if payload.get("exp") is not None:
+            verified_tokens.put(token, int(user_id_str), token_pwd_ts, float(payload["exp"]))
         return int(user_id_str), token_pwd_ts
     except Exception as e:
         print("Error:::", e)
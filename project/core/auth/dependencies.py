@@ -1,36 +1,45 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from project.db.database import get_session
 from project.db.models import UserCoreModel
+from project.core.repositories.user import UserCoreRepository
 
 from .auth import decode_access_token
+from .principals import Principal, principal_cache
 
 
 security = HTTPBearer()
 
-def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security), session: Session = Depends(get_session)) -> UserCoreModel:
+async def get_current_principal(credentials: HTTPAuthorizationCredentials = Depends(security), session: AsyncSession = Depends(get_session)) -> Principal:
     token = credentials.credentials
     user_id, token_pwd_ts = decode_access_token(token)
     if (user_id is None) or (token_pwd_ts is None):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="توکن نامعتبر")
 
-    user = session.get(UserCoreModel, user_id)
-    if not (user and user.is_active):
+    # در حالت عادی از کش خوانده می‌شود و کوئری‌ای به دیتابیس زده نمی‌شود
+    principal = await principal_cache.get(user_id, UserCoreRepository(UserCoreModel, session).get_principal)
+    if not (principal and principal.is_active):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="کاربر فعال نیست")
 
-    current_pwd_ts = user.password_changed_at.timestamp()
-    if token_pwd_ts < current_pwd_ts:
+    if principal.pwd_ts is not None and token_pwd_ts < principal.pwd_ts:
         raise HTTPException(401, "این توکن دیگر معتبر نیست")
 
-    return user
+    return principal
 
 
-def get_current_admin(user: UserCoreModel = Depends(get_current_user)) -> UserCoreModel:
-    if not (user.is_admin and user.online_status):
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="فقط ادمین این دسترسی را دارد")
-    
+async def get_current_user(principal: Principal = Depends(get_current_principal), session: AsyncSession = Depends(get_session)) -> UserCoreModel:
+    # فقط endpointهایی که خود مدل کاربر را تغییر می‌دهند به این کوئری نیاز دارند
+    user = await session.get(UserCoreModel, principal.id)
+    if user is None:
+        principal_cache.invalidate(principal.id)
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="کاربر فعال نیست")
     return user
 
 
+def get_current_admin(principal: Principal = Depends(get_current_principal)) -> Principal:
+    if not principal.is_admin:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="فقط ادمین این دسترسی را دارد")
+    
+    return principal
@@ -0,0 +1,88 @@
+# hashing.py
+from __future__ import annotations
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Optional, TypeVar
+
+from fastapi import status
+from fastapi.exceptions import HTTPException
+
+from project.core.config import settings
+
+
+R = TypeVar("R")
+
+
+@dataclass
+class HashingStats:
+    completed: int = 0 # تعداد عملیات انجام شده
+    rejected: int = 0 # تعداد درخواست‌های رد شده به خاطر پر بودن صف
+    pending: int = 0 # در حال اجرا یا در صف
+    hash_seconds_total: float = 0.0 # مجموع زمان اجرای bcrypt
+    hash_seconds_max: float = 0.0 # بیشترین زمان اجرای bcrypt
+    wait_seconds_total: float = 0.0 # مجموع زمان انتظار در صف
+
+    @property
+    def hash_seconds_avg(self) -> float:
+        return self.hash_seconds_total / self.completed if self.completed else 0.0
+
+    @property
+    def wait_seconds_avg(self) -> float:
+        return self.wait_seconds_total / self.completed if self.completed else 0.0
+
+
+class PasswordHasher:
+    """
+    اجرای bcrypt روی یک thread pool محدود تا event loop بلاک نشود.
+    bcrypt در حین محاسبه GIL را آزاد می‌کند؛ اگر تعداد درخواست‌های در صف از max_pending
+    بیشتر شود درخواست جدید با 503 رد می‌شود تا هجوم ورود بقیه درخواست‌ها را معطل نکند.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, max_pending: Optional[int] = None):
+        self.max_workers = max_workers or settings.PASSWORD_HASH_WORKERS
+        self.max_pending = max_pending or settings.PASSWORD_HASH_MAX_PENDING
+        self.stats = HashingStats()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def _pool(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="password-hash")
+        return self._executor
+
+    async def run(self, func: Callable[..., R], *args) -> R:
+        if self.stats.pending >= self.max_pending:
+            self.stats.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many password operations in progress, retry later"
+            )
+        submitted = time.perf_counter()
+        started = submitted
+
+        def _timed():
+            nonlocal started
+            started = time.perf_counter()
+            return func(*args)
+
+        self.stats.pending += 1
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(self._pool(), _timed)
+        finally:
+            self.stats.pending -= 1
+        elapsed = time.perf_counter() - started
+        self.stats.completed += 1
+        self.stats.hash_seconds_total += elapsed
+        self.stats.hash_seconds_max = max(self.stats.hash_seconds_max, elapsed)
+        self.stats.wait_seconds_total += started - submitted
+        return result
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,85 @@
+# principals.py
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, Optional
+
+from project.core.config import settings
+
+
+@dataclass(frozen=True)
+class Principal:
+    id: int # شناسه هسته کاربر
+    upstream_id: Optional[int] # بالادستی
+    is_active: bool # حساب کاربر فعال است
+    is_admin: bool # حساب کاربر ادمین است
+    is_repres: bool # حساب کاربر نماینده است
+    pwd_ts: Optional[float] # زمان آخرین تغییر رمزعبور نماینده (timestamp)
+    fetched_at: float = field(default_factory=time.time, compare=False)
+
+
+PrincipalLoader = Callable[[int], Awaitable[Optional[Principal]]]
+
+
+class PrincipalCache:
+    """
+    کش LRU اطلاعات احراز هویت کاربران برای get_current_principal.
+    غیرفعال‌سازی، حذف و تغییر رمز باید صریحا invalidate کنند؛ TTL فقط برای تغییرات پروسه‌های دیگر است.
+    ردیف‌های منقضی هنگام خواندن و قدیمی‌ترین ردیف‌ها بعد از رسیدن به max_size حذف می‌شوند.
+    """
+
+    def __init__(self, ttl: Optional[float] = None, max_size: Optional[int] = None):
+        self.ttl = settings.PRINCIPAL_CACHE_TTL if ttl is None else ttl
+        self.max_size = max_size or settings.PRINCIPAL_CACHE_SIZE
+        self._items: "OrderedDict[int, Principal]" = OrderedDict()
+        self._locks: Dict[int, asyncio.Lock] = {}
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def peek(self, user_id: int) -> Optional[Principal]:
+        principal = self._items.get(user_id)
+        if principal is None:
+            return None
+        if time.time() - principal.fetched_at >= self.ttl:
+            del self._items[user_id]
+            return None
+        self._items.move_to_end(user_id)
+        return principal
+
+    async def get(self, user_id: int, loader: PrincipalLoader) -> Optional[Principal]:
+        principal = self.peek(user_id)
+        if principal:
+            return principal
+        lock = self._locks.setdefault(user_id, asyncio.Lock())
+        try:
+            async with lock:
+                principal = self.peek(user_id)
+                if principal:
+                    return principal
+                principal = await loader(user_id)
+                if principal:
+                    self._put(principal)
+                return principal
+        finally:
+            # قفل فقط تا پایان بارگذاری لازم است؛ درخواست‌های منتظر همان شیء قفل را نگه داشته‌اند
+            if not lock.locked() and self._locks.get(user_id) is lock:
+                del self._locks[user_id]
+
+    def _put(self, principal: Principal) -> None:
+        self._items[principal.id] = principal
+        self._items.move_to_end(principal.id)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def invalidate(self, user_id: Optional[int] = None) -> None:
+        if user_id is None:
+            self._items.clear()
+        else:
+            self._items.pop(user_id, None)
+
+
+principal_cache = PrincipalCache()
@@ -0,0 +1,69 @@
+# tokens.py
+from __future__ import annotations
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from project.core.config import settings
+
+
+@dataclass(frozen=True)
+class VerifiedToken:
+    user_id: int
+    pwd_ts: float
+    exp: float # زمان انقضای توکن (timestamp)
+
+
+class VerifiedTokenCache:
+    """
+    LRU توکن‌هایی که امضایشان قبلا بررسی شده؛ کلید digest توکن است تا خود توکن در حافظه نماند.
+    هر ردیف در زمان exp توکن حذف می‌شود و توکن منقضی شده هرگز از کش برگردانده نمی‌شود.
+    """
+
+    def __init__(self, max_size: Optional[int] = None):
+        self.max_size = max_size or settings.TOKEN_CACHE_SIZE
+        self.hits = 0
+        self.misses = 0
+        self._items: "OrderedDict[bytes, VerifiedToken]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def digest(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str) -> Optional[Tuple[int, float]]:
+        key = self.digest(token)
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and item.exp > time.time():
+                self._items.move_to_end(key)
+                self.hits += 1
+                return item.user_id, item.pwd_ts
+            if item is not None:
+                del self._items[key]
+            self.misses += 1
+            return None
+
+    def put(self, token: str, user_id: int, pwd_ts: float, exp: float) -> None:
+        if exp <= time.time():
+            return
+        key = self.digest(token)
+        with self._lock:
+            self._items[key] = VerifiedToken(user_id=user_id, pwd_ts=pwd_ts, exp=exp)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+verified_tokens = VerifiedTokenCache()
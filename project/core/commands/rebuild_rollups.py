@@ -0,0 +1,43 @@
+"""
+محاسبه دوباره آمار تجمیعی نماینده‌ها از صفر.
+
+    python -m project.core.commands.rebuild_rollups            # ساخت دوباره
+    python -m project.core.commands.rebuild_rollups --check    # فقط مقایسه با مقادیر ذخیره شده
+    python -m project.core.commands.rebuild_rollups --hierarchy  # ساخت دوباره جدول closure قبل از آمار
+"""
+import argparse
+import asyncio
+import sys
+
+from project.core.repositories.rollup import RepresentativeRollupRepository
+from project.core.repositories.user import UserCoreRepository
+from project.db.database import async_session, engine
+from project.db.models import RepresentativeRollupModel, UserCoreModel
+
+
+async def main(check: bool, hierarchy: bool) -> int:
+    try:
+        async with async_session() as session:
+            if hierarchy:
+                rows = await UserCoreRepository(UserCoreModel, session).rebuild_hierarchy()
+                print(f"user_hierarchy: {rows} rows")
+            rollup_repo = RepresentativeRollupRepository(RepresentativeRollupModel, session)
+            if check:
+                mismatches = await rollup_repo.verify()
+                for user_id, (stored, expected) in sorted(mismatches.items()):
+                    print(f"user {user_id}: stored={stored} expected={expected}")
+                print(f"{len(mismatches)} mismatched rollups")
+                return 1 if mismatches else 0
+            rows = await rollup_repo.rebuild()
+            print(f"representative_rollups: {rows} rows")
+            return 0
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild representative rollups from invoices")
+    parser.add_argument("--check", action="store_true", help="only compare stored rollups with a full recomputation")
+    parser.add_argument("--hierarchy", action="store_true", help="rebuild the user_hierarchy closure table first")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args.check, args.hierarchy)))
@@ -0,0 +1,25 @@
+"""
+ساخت دوباره ایندکس جستجوی کاربران (user_search و روی sqlite جدول user_search_fts).
+
+    python -m project.core.commands.rebuild_search
+"""
+import asyncio
+import sys
+
+from project.core.repositories.search import UserSearchRepository
+from project.db.database import async_session, engine
+from project.db.models import UserSearchModel
+
+
+async def main() -> int:
+    try:
+        async with async_session() as session:
+            rows = await UserSearchRepository(UserSearchModel, session).rebuild()
+            print(f"user_search: {rows} rows")
+            return 0
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
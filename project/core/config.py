@@ -8,8 +8,40 @@ class Settings:
     DEBUG: bool = os.getenv("DEBUG")
     SECRET_KEY: str = os.getenv("SECRET_KEY")
     DATABASE_URL: str = os.getenv("DATABASE_URL")
+    DB_ECHO: bool = os.getenv("DB_ECHO", "false").lower() == "true"
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "10"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+    DB_POOL_TIMEOUT: float = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+    DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+    DB_POOL_PRE_PING: bool = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "43200"))
     allowed_origins = os.getenv("ALLOWED_ORIGINS", "")
     ALLOWED_ORIGINS = allowed_origins.split(",") if allowed_origins else ["*"]
+    WALLET_SNAPSHOT_EVERY: int = int(os.getenv("WALLET_SNAPSHOT_EVERY", "100"))
+    PRICE_CACHE_TTL: float = float(os.getenv("PRICE_CACHE_TTL", "300"))
+    DISCOUNT_RULES_TTL: float = float(os.getenv("DISCOUNT_RULES_TTL", "60"))
+    DOWNSTREAM_CACHE_SIZE: int = int(os.getenv("DOWNSTREAM_CACHE_SIZE", "50000"))
+    TOKEN_CACHE_SIZE: int = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+    PASSWORD_HASH_WORKERS: int = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+    PASSWORD_HASH_MAX_PENDING: int = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "32"))
+    PRINCIPAL_CACHE_TTL: float = float(os.getenv("PRINCIPAL_CACHE_TTL", "30"))
+    PRINCIPAL_CACHE_SIZE: int = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+    IDEMPOTENCY_KEY_TTL: int = int(os.getenv("IDEMPOTENCY_KEY_TTL", "86400"))
+    IDEMPOTENCY_PURGE_INTERVAL: float = float(os.getenv("IDEMPOTENCY_PURGE_INTERVAL", "3600"))
+    # marzban
+    MARZBAN_TIMEOUT: float = float(os.getenv("MARZBAN_TIMEOUT", "10"))
+    MARZBAN_MAX_CONNECTIONS: int = int(os.getenv("MARZBAN_MAX_CONNECTIONS", "20"))
+    MARZBAN_MAX_KEEPALIVE: int = int(os.getenv("MARZBAN_MAX_KEEPALIVE", "10"))
+    MARZBAN_KEEPALIVE_EXPIRY: float = float(os.getenv("MARZBAN_KEEPALIVE_EXPIRY", "30"))
+    MARZBAN_TOKEN_REFRESH_MARGIN: float = float(os.getenv("MARZBAN_TOKEN_REFRESH_MARGIN", "60"))
+    MARZBAN_LOGIN_BACKOFF: float = float(os.getenv("MARZBAN_LOGIN_BACKOFF", "5"))
+    MARZBAN_METADATA_TTL: float = float(os.getenv("MARZBAN_METADATA_TTL", "600"))
+    MARZBAN_BULK_CONCURRENCY: int = int(os.getenv("MARZBAN_BULK_CONCURRENCY", "5"))
+    PANEL_FAILURE_THRESHOLD: int = int(os.getenv("PANEL_FAILURE_THRESHOLD", "5"))
+    PANEL_OPEN_TIMEOUT: float = float(os.getenv("PANEL_OPEN_TIMEOUT", "30"))
+    PANEL_HEALTH_WINDOW: int = int(os.getenv("PANEL_HEALTH_WINDOW", "50"))
+    PANEL_SCHEDULER_REFRESH: float = float(os.getenv("PANEL_SCHEDULER_REFRESH", "60"))
+    USAGE_SYNC_INTERVAL: float = float(os.getenv("USAGE_SYNC_INTERVAL", "300"))
+    USAGE_SYNC_PAGE_SIZE: int = int(os.getenv("USAGE_SYNC_PAGE_SIZE", "500"))
 
 settings = Settings()
\ No newline at end of file
@@ -0,0 +1,20 @@
+class MarzbanError(Exception):
+    """خطای پایه ارتباط با پنل‌های مرزبان"""
+
+
+class PanelAuthError(MarzbanError):
+    """ورود به پنل (دریافت توکن ادمین) ناموفق بود"""
+
+    def __init__(self, panel_id: int, detail: str):
+        self.panel_id = panel_id
+        self.detail = detail
+        super().__init__(f"panel {panel_id}: {detail}")
+
+
+class PanelUnavailableError(MarzbanError):
+    """مدار پنل باز است یا پنل سالمی برای انتخاب وجود ندارد"""
+
+    def __init__(self, panel_id: int | None, detail: str):
+        self.panel_id = panel_id
+        self.detail = detail
+        super().__init__(f"panel {panel_id}: {detail}" if panel_id is not None else detail)
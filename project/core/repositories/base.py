@@ -1,10 +1,57 @@
 # repositories/base.py
+import base64
+import json
+from dataclasses import dataclass
+from datetime import datetime
 from typing import Generic, TypeVar, Sequence, Any
+
+from fastapi import status
+from fastapi.exceptions import HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update, delete
+from sqlalchemy import select, update, delete, insert, func, and_, or_, Select
+from sqlalchemy.orm import aliased
+from sqlalchemy.dialects import postgresql, sqlite
 
 T = TypeVar("T")
 
+DEFAULT_CHUNK_SIZE = 500
+
+# دیتابیس‌هایی که INSERT ... ON CONFLICT دارند
+UPSERT_INSERTS = {
+    "postgresql": postgresql.insert,
+    "sqlite": sqlite.insert,
+}
+
+
+def chunked(rows: Sequence[Any], size: int):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+@dataclass
+class Page(Generic[T]):
+    items: Sequence[T]
+    next_cursor: str | None = None
+
+
+def encode_cursor(value: Any, last_id: int) -> str:
+    if isinstance(value, datetime):
+        value = {"dt": value.isoformat()}
+    raw = json.dumps([value, last_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[Any, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        value, last_id = json.loads(raw)
+        if isinstance(value, dict):
+            value = datetime.fromisoformat(value["dt"])
+        return value, int(last_id)
+    except (ValueError, TypeError, KeyError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid pagination cursor")
+
+
 class BaseRepository(Generic[T]):
     def __init__(self, model: type[T], session: AsyncSession):
         self.model = model
@@ -18,6 +65,62 @@ class BaseRepository(Generic[T]):
         await self.session.refresh(obj)
         return obj
 
+    async def bulk_create(
+        self,
+        rows: Sequence[dict],
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        commit: bool = True
+    ) -> list[T]:
+        """درج گروهی با INSERT ... RETURNING (executemany)؛ یک commit برای کل دسته"""
+        objs: list[T] = []
+        for chunk in chunked(rows, chunk_size):
+            result = await self.session.scalars(insert(self.model).returning(self.model), chunk)
+            objs.extend(result.all())
+        if commit:
+            await self.session.commit()
+        return objs
+
+    async def upsert(
+        self,
+        rows: Sequence[dict],
+        index_elements: Sequence[str],
+        update_fields: Sequence[str] | None = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        commit: bool = True
+    ) -> list[T]:
+        """
+        درج یا به‌روزرسانی گروهی با INSERT ... ON CONFLICT بر اساس index_elements.
+        اگر update_fields داده نشود همه ستون‌های ارسالی (به جز کلید) به‌روز می‌شوند.
+        """
+        if not rows:
+            return []
+        dialect = self.session.get_bind().dialect.name
+        dialect_insert = UPSERT_INSERTS.get(dialect)
+        if dialect_insert is None:
+            raise NotImplementedError(f"upsert is not supported on {dialect}")
+        if update_fields is None:
+            update_fields = [key for key in rows[0] if key not in index_elements and key != "id"]
+
+        objs: list[T] = []
+        for chunk in chunked(rows, chunk_size):
+            stmt = dialect_insert(self.model)
+            if update_fields:
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=index_elements,
+                    set_={field: stmt.excluded[field] for field in update_fields},
+                )
+            else:
+                stmt = stmt.on_conflict_do_nothing(index_elements=index_elements)
+            result = await self.session.scalars(
+                stmt.returning(self.model),
+                chunk,
+                execution_options={"populate_existing": True},
+            )
+            objs.extend(result.all())
+        if commit:
+            await self.session.commit()
+        return objs
+
     # ────── READ ──────
     async def get_by_id(self, id: Any) -> T | None:
         return await self.session.get(self.model, id)
@@ -39,6 +142,49 @@ class BaseRepository(Generic[T]):
         result = await self.session.execute(stmt)
         return result.scalars().all()
 
+    async def get_page(
+        self,
+        cursor: str | None = None,
+        limit: int = 100,
+        order_by: Any = None,
+        filters: dict | None = None
+    ) -> Page[T]:
+        stmt = select(self.model)
+        if filters:
+            for key, value in filters.items():
+                stmt = stmt.where(getattr(self.model, key) == value)
+        return await self.paginate(stmt, cursor=cursor, limit=limit, order_by=order_by)
+
+    async def paginate(self, stmt: Select, cursor: str | None = None, limit: int = 100, order_by: Any = None) -> Page[T]:
+        """
+        صفحه‌بندی keyset (نزولی) روی (order_by, id)؛ هزینه هر صفحه به عمق آن بستگی ندارد.
+        """
+        id_col = self.model.id
+        order_col = id_col if order_by is None else order_by
+        same_col = order_col is id_col
+        if cursor:
+            value, last_id = decode_cursor(cursor)
+            if same_col:
+                stmt = stmt.where(id_col < last_id)
+            else:
+                # مقدار ستون آخرین ردیف از خود دیتابیس خوانده می‌شود تا قالب ذخیره (مثلا تاریخ بدون میکروثانیه در sqlite)
+                # با مقدار cursor فرق نکند؛ مقدار cursor فقط برای ردیف حذف شده استفاده می‌شود
+                anchor = aliased(self.model)
+                value = func.coalesce(
+                    select(getattr(anchor, order_col.key)).where(anchor.id == last_id).scalar_subquery(),
+                    value,
+                )
+                stmt = stmt.where(or_(order_col < value, and_(order_col == value, id_col < last_id)))
+        stmt = stmt.order_by(id_col.desc()) if same_col else stmt.order_by(order_col.desc(), id_col.desc())
+        result = await self.session.execute(stmt.limit(limit + 1))
+        items = result.scalars().all()
+        if len(items) <= limit:
+            return Page(items=items)
+        items = items[:limit]
+        last = items[-1]
+        last_value = last.id if same_col else getattr(last, order_col.key)
+        return Page(items=items, next_cursor=encode_cursor(last_value, last.id))
+
     # ────── UPDATE ──────
     async def update(self, db_obj: T, data: dict) -> T:
         for field, value in data.items():
@@ -48,6 +194,18 @@ class BaseRepository(Generic[T]):
         await self.session.refresh(db_obj)
         return db_obj
 
+    async def bulk_update(
+        self,
+        rows: Sequence[dict],
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        commit: bool = True
+    ) -> None:
+        """به‌روزرسانی گروهی بر اساس کلید اصلی؛ هر ردیف باید شامل id باشد"""
+        for chunk in chunked(rows, chunk_size):
+            await self.session.execute(update(self.model), chunk)
+        if commit:
+            await self.session.commit()
+
     # ────── DELETE ──────
     async def delete(self, db_obj: T) -> None:
         await self.session.delete(db_obj)
@@ -0,0 +1,171 @@
+from typing import Dict, List, Sequence
+
+from fastapi import status
+from fastapi.exceptions import HTTPException
+from sqlalchemy import select, update, bindparam, case, and_, or_, exists, func, BigInteger
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from project.db.models import (
+    ConfigurationsModel, ConfigurationPanelModel, ConfigurationInvoiceModel, UserCoreModel, RepresentativeRollupModel
+)
+
+from .base import BaseRepository
+from .rollup import RepresentativeRollupRepository
+from .wallet import WalletBalanceRepository
+
+
+class ConfigurationRepository(BaseRepository[ConfigurationsModel]):
+    async def bulk_update_consumed(self, panel_id: int, consumed_by_name: Dict[str, int]) -> int:
+        """
+        به‌روزرسانی حجم مصرفی چند کانفیگ یک پنل با یک دستور UPDATE (executemany).
+        نام کاربری فقط در هر پنل یکتاست، پس تطبیق با (panel_id, name) انجام می‌شود.
+        کانفیگ‌های قدیمی بدون panel_id با همین نام به این پنل نسبت داده می‌شوند
+        (فقط قدیمی‌ترین ردیف و فقط اگر پنل کانفیگی با این نام نداشته باشد تا ایندکس یکتا نقض نشود).
+        """
+        if not consumed_by_name:
+            return 0
+        table = ConfigurationsModel.__table__
+        other = table.alias("other")
+        name = bindparam("b_name")
+        consumed = bindparam("b_consumed", type_=BigInteger)
+        legacy = and_(
+            table.c.panel_id.is_(None),
+            table.c.name == name,
+            table.c.id == select(func.min(other.c.id)).where(other.c.panel_id.is_(None), other.c.name == name).scalar_subquery(),
+            ~exists().where(other.c.panel_id == panel_id, other.c.name == name),
+        )
+        stmt = (
+            update(table)
+            .where(or_(and_(table.c.panel_id == panel_id, table.c.name == name), legacy))
+            .values(
+                panel_id=panel_id,
+                consumed_volume_gb=case(
+                    # قید ck_conf_consumed_le_ceiling نباید نقض شود
+                    (and_(table.c.volume_ceiling_gb.is_not(None), consumed > table.c.volume_ceiling_gb), table.c.volume_ceiling_gb),
+                    else_=consumed,
+                ),
+            )
+        )
+        result = await self.session.execute(
+            stmt, [{"b_name": name, "b_consumed": value} for name, value in consumed_by_name.items()]
+        )
+        await self.session.commit()
+        return result.rowcount
+
+    async def add_provisioned(self, rows: Sequence[dict]) -> List[ConfigurationsModel]:
+        """
+        ثبت کانفیگ‌های ساخته شده روی پنل؛ هر ردیف شامل panel_id، name، buyer_user_id، seller_user_id و volume (گیگابایت).
+        panel_id همان پنلی است که همگام‌سازی مصرف با آن تطبیق می‌دهد.
+        """
+        return await self.bulk_create([
+            {
+                "panel_id": row["panel_id"],
+                "name": row["name"],
+                "buyer_user_id": row["buyer_user_id"],
+                "seller_user_id": row["seller_user_id"],
+                "total_volume_gb": row["volume"],
+                "volume_ceiling_gb": row["volume"],
+                "consumed_volume_gb": 0,
+            }
+            for row in rows
+        ])
+
+
+class ConfigurationPanelRepository(BaseRepository[ConfigurationPanelModel]):
+    async def all_panels(self) -> List[ConfigurationPanelModel]:
+        result = await self.session.execute(select(ConfigurationPanelModel))
+        return result.scalars().all()
+
+    async def all_active(self) -> List[ConfigurationPanelModel]:
+        result = await self.session.execute(
+            select(ConfigurationPanelModel).where(ConfigurationPanelModel.is_active.is_(True))
+        )
+        return result.scalars().all()
+
+    async def set_consumed_volume(self, panel_id: int, consumed_volume: int) -> None:
+        # used_volume (حجم رزرو شده) فقط توسط reserve_volume/release_volume تغییر می‌کند
+        await self.session.execute(
+            update(ConfigurationPanelModel)
+            .where(ConfigurationPanelModel.id == panel_id)
+            .values(consumed_volume=consumed_volume)
+        )
+        await self.session.commit()
+
+    async def reserve_volume(self, panel_id: int, volume: int) -> int | None:
+        """رزرو حجم روی پنل با یک UPDATE محافظت شده؛ اگر پنل غیرفعال یا پر باشد None برمی‌گرداند"""
+        used = func.coalesce(ConfigurationPanelModel.used_volume, 0)
+        result = await self.session.execute(
+            update(ConfigurationPanelModel)
+            .where(
+                ConfigurationPanelModel.id == panel_id,
+                ConfigurationPanelModel.is_active.is_(True),
+                or_(
+                    func.coalesce(ConfigurationPanelModel.max_volume, 0) == 0,
+                    used + volume <= ConfigurationPanelModel.max_volume,
+                ),
+            )
+            .values(used_volume=used + volume)
+            .returning(ConfigurationPanelModel.used_volume)
+        )
+        used_volume = result.scalar_one_or_none()
+        await self.session.commit()
+        return used_volume
+
+    async def release_volume(self, panel_id: int, volume: int) -> int | None:
+        used = func.coalesce(ConfigurationPanelModel.used_volume, 0)
+        result = await self.session.execute(
+            update(ConfigurationPanelModel)
+            .where(ConfigurationPanelModel.id == panel_id)
+            .values(used_volume=case((used > volume, used - volume), else_=0))
+            .returning(ConfigurationPanelModel.used_volume)
+        )
+        used_volume = result.scalar_one_or_none()
+        await self.session.commit()
+        return used_volume
+
+
+class ConfigInvoiceRepository(BaseRepository[ConfigurationInvoiceModel]):
+    def __init__(self, model: type[ConfigurationInvoiceModel], session: AsyncSession):
+        super().__init__(model, session)
+        self.balance_repo = WalletBalanceRepository(UserCoreModel, session)
+        self.rollup_repo = RepresentativeRollupRepository(RepresentativeRollupModel, session)
+
+    async def create_config_invoice(
+            self,
+            buyer_user_obj: UserCoreModel,
+            seller_user_id: int,
+            volume: int,
+            price: int,
+            descriptions: str | None,
+            discount_amount: int = 0
+        ) -> ConfigurationInvoiceModel:
+        """
+        ثبت فاکتور کانفیگ؛ مانند قبل قیمت کل همان قیمت پایه (منهای تخفیف) است
+        و فقط کافی بودن موجودی کیف پول خریدار بررسی می‌شود و مبلغی کسر نمی‌شود.
+        """
+        try:
+            total_price = price - discount_amount
+            wallet_balance = await self.balance_repo.get_balance(buyer_user_obj.id)
+            if wallet_balance is None or wallet_balance < total_price:
+                raise HTTPException(status_code=status.HTTP_406_NOT_ACCEPTABLE, detail="Wallet balance is insufficient")
+            config_invoice = ConfigurationInvoiceModel(
+                buyer_user_id=buyer_user_obj.id,
+                seller_user_id=seller_user_id,
+                volume=volume,
+                base_price=price,
+                discount_amount=discount_amount,
+                total_price=total_price,
+                descriptions=descriptions,
+            )
+            self.session.add(config_invoice)
+            await self.session.flush()
+            await self.rollup_repo.config_invoice_created(config_invoice)
+            await self.session.commit()
+            await self.session.refresh(config_invoice)
+            return config_invoice
+        except HTTPException:
+            await self.session.rollback()
+            raise
+        except Exception as e:
+            await self.session.rollback()
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to create configuration invoice.") from e
@@ -0,0 +1,124 @@
+from datetime import datetime, timezone
+
+from sqlalchemy import select, update, or_
+
+from project.core.app_discount.engine import DiscountRule, SellerDiscounts, discount_rules
+from project.db.models import DiscountModel, UsersDiscountModel, UserDiscountType_choices
+
+from .base import BaseRepository, UPSERT_INSERTS
+
+
+
+class DiscountRepository(BaseRepository[DiscountModel]):
+    # ────── CREATE / UPDATE ──────
+    async def create(self, data: dict) -> DiscountModel:
+        obj = await super().create(data)
+        discount_rules.invalidate(obj.seller_user_id)
+        return obj
+
+    async def update(self, db_obj: DiscountModel, data: dict) -> DiscountModel:
+        obj = await super().update(db_obj, data)
+        discount_rules.invalidate(obj.seller_user_id)
+        return obj
+
+    async def delete(self, db_obj: DiscountModel) -> None:
+        seller_user_id = db_obj.seller_user_id
+        await super().delete(db_obj)
+        discount_rules.invalidate(seller_user_id)
+
+    # ────── RULES ──────
+    async def load_seller_discounts(self, seller_user_id: int) -> SellerDiscounts:
+        """کدهای منقضی نشده فروشنده و کاربران مجاز هر کد با دو کوئری خوانده و کامپایل می‌شوند"""
+        result = await self.session.execute(
+            select(DiscountModel).where(
+                DiscountModel.seller_user_id == seller_user_id,
+                DiscountModel.expired_dt > datetime.now(timezone.utc),
+            )
+        )
+        discounts = result.scalars().all()
+        authorized: dict[int, set[int]] = {}
+        if discounts:
+            rows = await self.session.execute(
+                select(UsersDiscountModel.discount_id, UsersDiscountModel.user_id).where(
+                    UsersDiscountModel.discount_id.in_([discount.id for discount in discounts]),
+                    UsersDiscountModel.user_type == UserDiscountType_choices.AUTHORIZED_USERS_FOR_USE,
+                )
+            )
+            for discount_id, user_id in rows.all():
+                authorized.setdefault(discount_id, set()).add(user_id)
+
+        return SellerDiscounts(rules={
+            discount.code: DiscountRule(
+                id=discount.id,
+                seller_user_id=discount.seller_user_id,
+                code=discount.code,
+                percent=discount.percent,
+                expires_at=_aware(discount.expired_dt),
+                usage_ceiling=discount.usage_ceiling,
+                maximum_discount_amount=discount.maximum_discount_amount or 0,
+                minimum_purchase_amount=discount.minimum_purchase_amount or 0,
+                number_uses_per_user=discount.number_uses_per_user,
+                refund=bool(discount.refund),
+                stackable=bool(discount.synchronicity),
+                authorized_user_ids=frozenset(authorized[discount.id]) if discount.id in authorized else None,
+            )
+            for discount in discounts
+        })
+
+    # ────── USAGE ──────
+    async def reserve_usage(self, discount_id: int) -> int | None:
+        """
+        رزرو یک استفاده از سقف کل کد با یک UPDATE شرطی و commit فوری؛
+        قفل ردیف کد پرطرفدار فقط به اندازه همین یک دستور نگه داشته می‌شود.
+        """
+        result = await self.session.execute(
+            update(DiscountModel)
+            .where(
+                DiscountModel.id == discount_id,
+                or_(DiscountModel.usage_ceiling.is_(None), DiscountModel.used_count < DiscountModel.usage_ceiling),
+            )
+            .values(used_count=DiscountModel.used_count + 1)
+            .returning(DiscountModel.used_count)
+        )
+        used_count = result.scalar_one_or_none()
+        await self.session.commit()
+        return used_count
+
+    async def release_usage(self, discount_id: int) -> None:
+        await self.session.execute(
+            update(DiscountModel)
+            .where(DiscountModel.id == discount_id, DiscountModel.used_count > 0)
+            .values(used_count=DiscountModel.used_count - 1)
+        )
+        await self.session.commit()
+
+    async def increment_user_usage(self, discount_id: int, user_id: int, per_user_limit: int | None) -> int | None:
+        """
+        افزایش اتمی تعداد استفاده کاربر از کد با یک INSERT ... ON CONFLICT DO UPDATE شرطی.
+        اگر کاربر به سقف رسیده باشد None برمی‌گردد. commit نمی‌کند.
+        """
+        if per_user_limit is not None and per_user_limit <= 0:
+            return None
+        dialect = self.session.get_bind().dialect.name
+        dialect_insert = UPSERT_INSERTS.get(dialect)
+        if dialect_insert is None:
+            raise NotImplementedError(f"discount usage counters are not supported on {dialect}")
+        table = UsersDiscountModel.__table__
+        stmt = dialect_insert(UsersDiscountModel).values(
+            user_id=user_id,
+            discount_id=discount_id,
+            user_type=UserDiscountType_choices.USED_BY_USERS,
+            count_uses=1,
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["user_id", "discount_id", "user_type"],
+            set_={"count_uses": table.c.count_uses + 1},
+            where=(table.c.count_uses < per_user_limit) if per_user_limit is not None else None,
+        )
+        result = await self.session.execute(stmt.returning(table.c.count_uses))
+        return result.scalar_one_or_none()
+
+
+def _aware(value: datetime) -> datetime:
+    # sqlite منطقه زمانی را ذخیره نمی‌کند
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
@@ -0,0 +1,85 @@
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select, update, delete, Update
+
+from project.db.models import IdempotencyKeyModel, IdempotencyStatusChoices
+
+from .base import BaseRepository
+
+
+
+class IdempotencyKeyRepository(BaseRepository[IdempotencyKeyModel]):
+    """
+    ثبت کلیدهای تکرارناپذیری. هر متد تراکنش خودش را commit می‌کند تا درخواست‌های هم‌زمان
+    (حتی در پروسه‌های دیگر) کلید ثبت شده را ببینند.
+    """
+
+    async def get_key(self, user_id: int, scope: str, key: str) -> IdempotencyKeyModel | None:
+        result = await self.session.execute(
+            select(IdempotencyKeyModel)
+            .where(
+                IdempotencyKeyModel.user_id == user_id,
+                IdempotencyKeyModel.scope == scope,
+                IdempotencyKeyModel.key == key,
+            )
+            .execution_options(populate_existing=True)
+        )
+        return result.scalars().first()
+
+    async def claim(self, user_id: int, scope: str, key: str, ttl: int) -> tuple[IdempotencyKeyModel, bool]:
+        """
+        ثبت کلید با INSERT ... ON CONFLICT DO NOTHING.
+        اگر کلید قبلا ثبت شده باشد ردیف موجود و False برگردانده می‌شود.
+        """
+        now = datetime.now(timezone.utc)
+        # کلید منقضی شده دوباره قابل استفاده است
+        await self.session.execute(
+            delete(IdempotencyKeyModel).where(
+                IdempotencyKeyModel.user_id == user_id,
+                IdempotencyKeyModel.scope == scope,
+                IdempotencyKeyModel.key == key,
+                IdempotencyKeyModel.expires_at <= now,
+            )
+        )
+        inserted = await self.upsert(
+            [{
+                "user_id": user_id,
+                "scope": scope,
+                "key": key,
+                "status": IdempotencyStatusChoices.IN_PROGRESS,
+                "expires_at": now + timedelta(seconds=ttl),
+            }],
+            index_elements=["user_id", "scope", "key"],
+            update_fields=[],
+        )
+        if inserted:
+            return inserted[0], True
+        return await self.get_key(user_id, scope, key), False
+
+    @staticmethod
+    def complete_statement(record_id: int, resource_type: str, resource_id: int) -> Update:
+        return (
+            update(IdempotencyKeyModel)
+            .where(IdempotencyKeyModel.id == record_id)
+            .values(
+                status=IdempotencyStatusChoices.COMPLETED,
+                resource_type=resource_type,
+                resource_id=resource_id,
+            )
+        )
+
+    async def complete(self, record_id: int, resource_type: str, resource_id: int) -> None:
+        await self.session.execute(self.complete_statement(record_id, resource_type, resource_id))
+        await self.session.commit()
+
+    async def release(self, record_id: int) -> None:
+        """کلید عملیات ناموفق حذف می‌شود تا کلاینت بتواند با همان کلید دوباره تلاش کند"""
+        await self.session.execute(delete(IdempotencyKeyModel).where(IdempotencyKeyModel.id == record_id))
+        await self.session.commit()
+
+    async def purge_expired(self) -> int:
+        result = await self.session.execute(
+            delete(IdempotencyKeyModel).where(IdempotencyKeyModel.expires_at <= datetime.now(timezone.utc))
+        )
+        await self.session.commit()
+        return result.rowcount
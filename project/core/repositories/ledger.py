@@ -0,0 +1,98 @@
+from datetime import datetime
+
+from sqlalchemy import select, insert, func
+
+from project.core.config import settings
+from project.db.models import (
+    UserCoreModel, WalletLedgerEntryModel, WalletBalanceSnapshotModel, WalletLedgerEntryTypeChoices
+)
+
+from .base import BaseRepository
+
+
+
+class WalletLedgerRepository(BaseRepository[WalletLedgerEntryModel]):
+    """
+    دفتر کل فقط-درج کیف پول. هر snapshot_every ردیف، موجودی در جدول snapshot ذخیره می‌شود
+    تا محاسبه موجودی در هر زمان فقط به ردیف‌های بعد از آخرین snapshot نیاز داشته باشد.
+    متدها commit نمی‌کنند و باید در تراکنش تغییر موجودی صدا زده شوند.
+    """
+
+    snapshot_every = settings.WALLET_SNAPSHOT_EVERY
+
+    async def append(
+        self,
+        user_id: int,
+        amount: int,
+        balance_after: int,
+        reference_type: str | None = None,
+        reference_id: int | None = None,
+    ) -> WalletLedgerEntryModel:
+        entry_type = WalletLedgerEntryTypeChoices.CREDIT if amount >= 0 else WalletLedgerEntryTypeChoices.DEBIT
+        # ردیف کیف پول کاربر در همین تراکنش به‌روز شده، پس درج‌های هم‌زمان یک کاربر پشت سر هم اجرا می‌شوند
+        next_seq = (
+            select(func.coalesce(func.max(WalletLedgerEntryModel.seq), 0) + 1)
+            .where(WalletLedgerEntryModel.user_id == user_id)
+            .scalar_subquery()
+        )
+        result = await self.session.scalars(
+            insert(WalletLedgerEntryModel)
+            .values(
+                user_id=user_id,
+                seq=next_seq,
+                entry_type=entry_type,
+                amount=amount,
+                balance_after=balance_after,
+                reference_type=reference_type,
+                reference_id=reference_id,
+            )
+            .returning(WalletLedgerEntryModel)
+        )
+        entry = result.one()
+        if entry.seq % self.snapshot_every == 0:
+            await self._snapshot(entry)
+        return entry
+
+    async def _snapshot(self, entry: WalletLedgerEntryModel) -> None:
+        self.session.add(WalletBalanceSnapshotModel(
+            user_id=entry.user_id,
+            ledger_entry_id=entry.id,
+            seq=entry.seq,
+            balance=entry.balance_after,
+            created_at=entry.created_at,
+        ))
+        await self.session.flush()
+
+    async def last_snapshot(self, user_id: int, at: datetime | None = None) -> WalletBalanceSnapshotModel | None:
+        stmt = select(WalletBalanceSnapshotModel).where(WalletBalanceSnapshotModel.user_id == user_id)
+        if at is not None:
+            stmt = stmt.where(WalletBalanceSnapshotModel.created_at <= at)
+        stmt = stmt.order_by(WalletBalanceSnapshotModel.seq.desc()).limit(1)
+        result = await self.session.execute(stmt)
+        return result.scalar_one_or_none()
+
+    async def balance_at(self, user_id: int, at: datetime | None = None) -> int:
+        """موجودی کاربر در زمان at (یا اکنون) از روی آخرین snapshot و ردیف‌های بعد از آن"""
+        snapshot = await self.last_snapshot(user_id, at)
+        stmt = select(func.coalesce(func.sum(WalletLedgerEntryModel.amount), 0)).where(
+            WalletLedgerEntryModel.user_id == user_id
+        )
+        if snapshot is not None:
+            stmt = stmt.where(WalletLedgerEntryModel.seq > snapshot.seq)
+        if at is not None:
+            stmt = stmt.where(WalletLedgerEntryModel.created_at <= at)
+        result = await self.session.execute(stmt)
+        return (snapshot.balance if snapshot else 0) + result.scalar_one()
+
+    async def reconcile(self, user_id: int) -> dict:
+        ledger_balance = await self.balance_at(user_id)
+        result = await self.session.execute(
+            select(UserCoreModel.wallet_balance).where(UserCoreModel.id == user_id)
+        )
+        column_balance = result.scalar_one_or_none()
+        return {
+            "user_id": user_id,
+            "ledger_balance": ledger_balance,
+            "wallet_balance": column_balance,
+            "ok": ledger_balance == column_balance,
+        }
@@ -0,0 +1,134 @@
+from dataclasses import dataclass, field
+from typing import Any, Iterable, Sequence
+
+from sqlalchemy import select, func, inspect
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload, RelationshipProperty
+
+from project.db.models import UserCoreModel
+
+
+# رابطه‌های یک‌به‌یک/چندبه‌یک کاربر که همراه فهرست کاربران با selectinload خوانده می‌شوند
+SCALAR_RELATIONS = {
+    "representative_core": UserCoreModel.representative_core,
+    "upstream": UserCoreModel.upstream,
+}
+
+
+def _relation(name: str) -> RelationshipProperty:
+    """رابطه یک‌به‌چند (write_only) کاربر با نام آن"""
+    rel = inspect(UserCoreModel).relationships.get(name)
+    if rel is None or not rel.uselist:
+        raise ValueError(f"{name} is not a one-to-many relationship of UserCoreModel")
+    return rel
+
+
+def _remote_fk(rel: RelationshipProperty):
+    # برای downstream ستون upstream_id و برای بقیه ستون foreign_keys تعریف شده
+    (column,) = rel.remote_side
+    return column
+
+
+@dataclass
+class UserBundle:
+    """کاربر به همراه شمارش‌ها و آخرین ردیف رابطه‌های خواسته شده"""
+    user: UserCoreModel
+    counts: dict[str, int] = field(default_factory=dict)
+    latest: dict[str, Any] = field(default_factory=dict)
+
+
+class UserRelationLoader:
+    """
+    بارگذاری دسته‌ای رابطه‌های کاربر؛ هر رابطه برای کل فهرست فقط یک کوئری می‌زند
+    و تعداد کوئری‌ها به تعداد کاربران بستگی ندارد.
+    """
+
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    @staticmethod
+    def options(*names: str) -> list:
+        """گزینه‌های selectinload برای رابطه‌های تکی (representative_core، upstream)"""
+        return [selectinload(SCALAR_RELATIONS[name]) for name in names]
+
+    async def users(self, user_ids: Iterable[int], *relations: str) -> dict[int, UserCoreModel]:
+        ids = list(set(user_ids))
+        if not ids:
+            return {}
+        result = await self.session.scalars(
+            select(UserCoreModel).where(UserCoreModel.id.in_(ids)).options(*self.options(*relations))
+        )
+        return {obj.id: obj for obj in result.all()}
+
+    async def counts(self, relation: str, user_ids: Iterable[int]) -> dict[int, int]:
+        """تعداد ردیف‌های رابطه برای هر کاربر با یک GROUP BY؛ کاربران بدون ردیف صفر می‌گیرند"""
+        ids = list(set(user_ids))
+        if not ids:
+            return {}
+        fk = _remote_fk(_relation(relation))
+        result = await self.session.execute(
+            select(fk, func.count()).where(fk.in_(ids)).group_by(fk)
+        )
+        counts = dict.fromkeys(ids, 0)
+        counts.update({user_id: count for user_id, count in result.all()})
+        return counts
+
+    async def latest(self, relation: str, user_ids: Iterable[int], per_user: int = 1) -> dict[int, list]:
+        """آخرین ردیف‌های رابطه (بر اساس شناسه) برای هر کاربر با یک کوئری پنجره‌ای row_number"""
+        ids = list(set(user_ids))
+        if not ids:
+            return {}
+        rel = _relation(relation)
+        target = rel.mapper.class_
+        fk = _remote_fk(rel)
+        ranked = (
+            select(
+                target.id.label("row_id"),
+                func.row_number().over(partition_by=fk, order_by=target.id.desc()).label("rank"),
+            )
+            .where(fk.in_(ids))
+            .subquery()
+        )
+        result = await self.session.scalars(
+            select(target)
+            .join(ranked, ranked.c.row_id == target.id)
+            .where(ranked.c.rank <= per_user)
+            .order_by(target.id.desc())
+        )
+        latest: dict[int, list] = {user_id: [] for user_id in ids}
+        for obj in result.all():
+            latest[getattr(obj, fk.key)].append(obj)
+        return latest
+
+    async def children(self, relation: str, user_ids: Iterable[int]) -> dict[int, list]:
+        """همه ردیف‌های رابطه برای هر کاربر با یک کوئری IN؛ فقط برای رابطه‌های کوچک"""
+        ids = list(set(user_ids))
+        if not ids:
+            return {}
+        rel = _relation(relation)
+        target = rel.mapper.class_
+        fk = _remote_fk(rel)
+        result = await self.session.scalars(select(target).where(fk.in_(ids)).order_by(target.id))
+        children: dict[int, list] = {user_id: [] for user_id in ids}
+        for obj in result.all():
+            children[getattr(obj, fk.key)].append(obj)
+        return children
+
+    async def bundle(
+        self,
+        users: Sequence[UserCoreModel],
+        counts: Sequence[str] = (),
+        latest: Sequence[str] = (),
+    ) -> list[UserBundle]:
+        """ترکیب شمارش‌ها و آخرین ردیف‌ها برای یک صفحه کاربر؛ یک کوئری به ازای هر رابطه"""
+        ids = [user.id for user in users]
+        counted = {relation: await self.counts(relation, ids) for relation in counts}
+        newest = {relation: await self.latest(relation, ids) for relation in latest}
+        return [
+            UserBundle(
+                user=user,
+                counts={relation: values[user.id] for relation, values in counted.items()},
+                latest={relation: (values[user.id] or [None])[0] for relation, values in newest.items()},
+            )
+            for user in users
+        ]
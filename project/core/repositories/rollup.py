@@ -0,0 +1,141 @@
+from sqlalchemy import select, delete, func, literal, or_, union_all
+
+from project.db.models import (
+    RepresentativeRollupModel, UserHierarchyModel,
+    ConfigurationInvoiceModel, WalletRechargeInvoiceModel, WalletInvoiceStatusChoices
+)
+
+from .base import BaseRepository, UPSERT_INSERTS
+
+
+ROLLUP_FIELDS = ("network_size", "configs_sold", "sales_volume", "revenue", "wallet_recharge_total")
+
+# وضعیت‌هایی که مبلغ فاکتور کیف پول در آن‌ها پرداخت شده است
+APPROVED_WALLET_STATUSES = (
+    WalletInvoiceStatusChoices.PAY_WALLET,
+    WalletInvoiceStatusChoices.CONFIGURATION_DIRECTE,
+)
+
+
+class RepresentativeRollupRepository(BaseRepository[RepresentativeRollupModel]):
+    """
+    آمار تجمیعی شبکه نماینده‌ها. هر تغییر با یک INSERT ... SELECT ... ON CONFLICT
+    روی کل زنجیره بالادستی (از جدول closure) اعمال می‌شود.
+    متدهای افزایشی commit نمی‌کنند و باید در تراکنش همان فاکتور صدا زده شوند.
+    """
+
+    async def apply(self, user_id: int | None, **deltas: int) -> None:
+        """اعمال تغییرات روی آمار کاربر و همه بالادستی‌هایش"""
+        deltas = {field: value for field, value in deltas.items() if value}
+        if user_id is None or not deltas:
+            return
+        dialect = self.session.get_bind().dialect.name
+        dialect_insert = UPSERT_INSERTS.get(dialect)
+        if dialect_insert is None:
+            raise NotImplementedError(f"rollups are not supported on {dialect}")
+
+        h = UserHierarchyModel
+        columns = ["user_id", *ROLLUP_FIELDS]
+        chain = select(h.ancestor_id, *(literal(deltas.get(field, 0)) for field in ROLLUP_FIELDS)).where(
+            h.descendant_id == user_id
+        )
+        stmt = dialect_insert(RepresentativeRollupModel).from_select(columns, chain)
+        table = RepresentativeRollupModel.__table__
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["user_id"],
+            set_={
+                **{field: table.c[field] + stmt.excluded[field] for field in deltas},
+                "updated_at": func.now(),
+            },
+        )
+        await self.session.execute(stmt)
+
+    async def user_created(self, upstream_id: int | None) -> None:
+        await self.apply(upstream_id, network_size=1)
+
+    async def config_invoice_created(self, invoice: ConfigurationInvoiceModel) -> None:
+        await self.apply(
+            invoice.seller_user_id,
+            configs_sold=1,
+            sales_volume=invoice.volume or 0,
+            revenue=invoice.total_price or 0,
+        )
+
+    async def wallet_invoice_approved(self, seller_user_id: int, charge_amount: int) -> None:
+        await self.apply(seller_user_id, wallet_recharge_total=charge_amount)
+
+    async def subtree_totals(self, user_id: int) -> dict[str, int]:
+        """سهم زیرشاخه کاربر (به همراه خودش) در آمار اجدادش؛ برای جابه‌جایی زیرشاخه"""
+        row = await self.session.scalar(
+            select(RepresentativeRollupModel).where(RepresentativeRollupModel.user_id == user_id)
+        )
+        totals = {field: getattr(row, field) if row else 0 for field in ROLLUP_FIELDS}
+        totals["network_size"] += 1
+        return totals
+
+    async def move_subtree(self, totals: dict[str, int], old_upstream_id: int | None, new_upstream_id: int | None) -> None:
+        await self.apply(old_upstream_id, **{field: -value for field, value in totals.items()})
+        await self.apply(new_upstream_id, **totals)
+
+    async def get_rollup(self, user_id: int) -> RepresentativeRollupModel | None:
+        return await self.session.scalar(
+            select(RepresentativeRollupModel).where(RepresentativeRollupModel.user_id == user_id)
+        )
+
+    # ────── REBUILD ──────
+    def _expected_stmt(self):
+        """محاسبه کامل آمار همه کاربران از روی فاکتورها و جدول closure"""
+        h = UserHierarchyModel
+        ci = ConfigurationInvoiceModel
+        wi = WalletRechargeInvoiceModel
+        # هر ستون literal جداگانه و با نام ساخته می‌شود تا select ستون‌های تکراری را یکی نکند
+        def row(user_id, **values):
+            return [user_id.label("user_id"), *(values.get(field, literal(0)).label(field) for field in ROLLUP_FIELDS)]
+
+        parts = union_all(
+            select(*row(h.ancestor_id, network_size=literal(1)))
+            .where(h.depth > 0),
+            select(*row(
+                h.ancestor_id,
+                configs_sold=literal(1),
+                sales_volume=func.coalesce(ci.volume, 0),
+                revenue=func.coalesce(ci.total_price, 0),
+            ))
+            .join(ci, ci.seller_user_id == h.descendant_id),
+            select(*row(h.ancestor_id, wallet_recharge_total=func.coalesce(wi.charge_amount, 0)))
+            .join(wi, wi.seller_user_id == h.descendant_id)
+            .where(wi.status.in_(APPROVED_WALLET_STATUSES)),
+        ).subquery()
+        sums = [func.sum(parts.c[field]) for field in ROLLUP_FIELDS]
+        return (
+            select(parts.c.user_id, *sums)
+            .group_by(parts.c.user_id)
+            .having(or_(*(total != 0 for total in sums)))
+        )
+
+    async def expected(self) -> dict[int, dict[str, int]]:
+        result = await self.session.execute(self._expected_stmt())
+        return {row[0]: dict(zip(ROLLUP_FIELDS, map(int, row[1:]))) for row in result.all()}
+
+    async def verify(self) -> dict[int, tuple[dict[str, int], dict[str, int]]]:
+        """اختلاف آمار ذخیره شده با محاسبه کامل؛ {user_id: (ذخیره شده، مورد انتظار)}"""
+        expected = await self.expected()
+        stored = {
+            row.user_id: {field: getattr(row, field) for field in ROLLUP_FIELDS}
+            for row in (await self.session.scalars(select(RepresentativeRollupModel))).all()
+        }
+        empty = dict.fromkeys(ROLLUP_FIELDS, 0)
+        return {
+            user_id: (stored.get(user_id, empty), expected.get(user_id, empty))
+            for user_id in expected.keys() | stored.keys()
+            if stored.get(user_id, empty) != expected.get(user_id, empty)
+        }
+
+    async def rebuild(self) -> int:
+        """پاک کردن و محاسبه دوباره همه آمار از صفر در یک تراکنش"""
+        expected = await self.expected()
+        await self.session.execute(delete(RepresentativeRollupModel))
+        rows = [{"user_id": user_id, **values} for user_id, values in expected.items()]
+        await self.bulk_create(rows, commit=False)
+        await self.session.commit()
+        return len(rows)
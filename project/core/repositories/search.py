@@ -0,0 +1,177 @@
+from typing import Iterable, Sequence
+
+from fastapi import status
+from fastapi.exceptions import HTTPException
+from sqlalchemy import select, delete, insert, func, case, literal, literal_column, table, column, and_, or_
+
+from project.core.app_user.search import (
+    SearchHit, MIN_TRIGRAM_QUERY, SIMILARITY_THRESHOLD, normalize, build_document, trigrams, fts_match, escape_like
+)
+from project.db.models import UserSearchModel, UserCoreModel, RepresentativesCoreModel, UserHierarchyModel, USER_SEARCH_FTS
+
+from .base import BaseRepository, Page, chunked, encode_cursor, decode_cursor, DEFAULT_CHUNK_SIZE, UPSERT_INSERTS
+
+
+# جدول مجازی FTS5 (فقط sqlite)؛ rowid همان شناسه کاربر است
+user_search_fts = table(USER_SEARCH_FTS, column("rowid"), column("document"))
+
+
+def _keyset_after(keys: list[tuple], values: Sequence) -> object:
+    """شرط «بعد از آخرین ردیف» برای ترتیب چندکلیدی؛ keys به صورت (عبارت، نزولی)"""
+    clauses = []
+    for i, (expr, descending) in enumerate(keys):
+        equal = [key == value for (key, _), value in zip(keys[:i], values[:i])]
+        clauses.append(and_(*equal, expr < values[i] if descending else expr > values[i]))
+    return or_(*clauses)
+
+
+class UserSearchRepository(BaseRepository[UserSearchModel]):
+    """
+    نگهداری و جستجوی سند جستجوی کاربران.
+    PostgreSQL: ایندکس GIN سه‌حرفی pg_trgm روی user_search.document با رتبه word_similarity.
+    SQLite: جدول FTS5 با tokenizer سه‌حرفی کنار user_search با رتبه bm25.
+    متدهای ایندکس commit نمی‌کنند و باید در تراکنش همان تغییر کاربر صدا زده شوند.
+    """
+
+    @property
+    def dialect(self) -> str:
+        return self.session.get_bind().dialect.name
+
+    # ────── INDEX ──────
+    async def _documents(self, user_ids: Sequence[int] | None = None) -> list[dict]:
+        stmt = (
+            select(
+                UserCoreModel.id,
+                UserCoreModel.first_name,
+                UserCoreModel.last_name,
+                RepresentativesCoreModel.phone_number,
+                UserCoreModel.tel_chat_id,
+                UserCoreModel.tel_user_id,
+            )
+            .outerjoin(RepresentativesCoreModel, RepresentativesCoreModel.user_core == UserCoreModel.id)
+        )
+        if user_ids is not None:
+            stmt = stmt.where(UserCoreModel.id.in_(user_ids))
+        result = await self.session.execute(stmt)
+        return [{"user_id": row[0], "document": build_document(*row[1:])} for row in result.all()]
+
+    async def index_users(self, user_ids: Iterable[int]) -> None:
+        """ساخت دوباره سند جستجوی کاربران داده شده از روی ستون‌های فعلی"""
+        ids = list(set(user_ids))
+        for chunk in chunked(ids, DEFAULT_CHUNK_SIZE):
+            rows = await self._documents(chunk)
+            if not rows:
+                continue
+            dialect_insert = UPSERT_INSERTS.get(self.dialect)
+            if dialect_insert is None:
+                raise NotImplementedError(f"user search is not supported on {self.dialect}")
+            stmt = dialect_insert(UserSearchModel)
+            await self.session.execute(
+                stmt.on_conflict_do_update(index_elements=["user_id"], set_={"document": stmt.excluded.document}),
+                rows,
+            )
+            if self.dialect == "sqlite":
+                await self.session.execute(delete(user_search_fts).where(user_search_fts.c.rowid.in_(chunk)))
+                await self.session.execute(
+                    insert(user_search_fts),
+                    [{"rowid": row["user_id"], "document": row["document"]} for row in rows],
+                )
+
+    async def remove_users(self, user_ids: Iterable[int]) -> None:
+        ids = list(set(user_ids))
+        if not ids:
+            return
+        await self.session.execute(delete(UserSearchModel).where(UserSearchModel.user_id.in_(ids)))
+        if self.dialect == "sqlite":
+            await self.session.execute(delete(user_search_fts).where(user_search_fts.c.rowid.in_(ids)))
+
+    async def rebuild(self) -> int:
+        """ساخت دوباره کل ایندکس جستجو در یک تراکنش"""
+        await self.session.execute(delete(UserSearchModel))
+        if self.dialect == "sqlite":
+            await self.session.execute(delete(user_search_fts))
+        ids = (await self.session.scalars(select(UserCoreModel.id))).all()
+        await self.index_users(ids)
+        await self.session.commit()
+        return len(ids)
+
+    # ────── SEARCH ──────
+    async def search(
+        self,
+        query: str,
+        scope_user_id: int | None = None,
+        cursor: str | None = None,
+        limit: int = 20,
+    ) -> Page[SearchHit]:
+        """
+        جستجوی رتبه‌بندی شده روی نام، تلفن و شناسه‌های تلگرام.
+        scope_user_id نتایج را به زیرمجموعه (مستقیم و غیرمستقیم) آن نماینده محدود می‌کند.
+        صفحه‌بندی keyset روی (امتیاز، [bm25]، شناسه) انجام می‌شود؛ cursor همان ترتیب رتبه را ادامه می‌دهد.
+        """
+        q = normalize(query)
+        if not q:
+            return Page(items=[])
+        doc = UserSearchModel.document
+        like = escape_like(q)
+        # تطبیق از ابتدای یک کلمه بالاتر از تطبیق وسط کلمه است
+        prefix = case((or_(doc.like(f"{like}%", escape="\\"), doc.like(f"% {like}%", escape="\\")), 2.0), else_=0.0)
+        contains = case((doc.like(f"%{like}%", escape="\\"), 1.0), else_=0.0)
+
+        stmt = select(UserCoreModel).join(UserSearchModel, UserSearchModel.user_id == UserCoreModel.id)
+        tiebreak = None
+        if self.dialect == "postgresql":
+            similarity = func.word_similarity(q, doc)
+            score = prefix + contains + similarity
+            # <% و LIKE هر دو از ایندکس gin_trgm_ops استفاده می‌کنند
+            stmt = stmt.where(or_(literal(q).op("<%")(doc), doc.like(f"%{like}%", escape="\\")))
+        elif self.dialect == "sqlite" and len(q) >= MIN_TRIGRAM_QUERY:
+            fts = (
+                select(
+                    user_search_fts.c.rowid.label("user_id"),
+                    func.bm25(literal_column(USER_SEARCH_FTS)).label("bm25"),
+                )
+                .where(literal_column(USER_SEARCH_FTS).op("MATCH")(fts_match(q)))
+                .subquery()
+            )
+            # نسبت سه‌حرفی‌های کوئری که در سند هستند (مانند similarity در pg_trgm)؛ فقط روی نامزدهای FTS محاسبه می‌شود
+            grams = trigrams(q)
+            overlap = sum(case((doc.like(f"%{escape_like(gram)}%", escape="\\"), 1.0), else_=0.0) for gram in grams) / len(grams)
+            score = prefix + contains + overlap
+            # bm25 منفی است و مقدار کمتر یعنی تطبیق بهتر؛ فقط برای امتیازهای برابر
+            tiebreak = fts.c.bm25
+            stmt = stmt.join(fts, fts.c.user_id == UserCoreModel.id).where(
+                or_(contains > 0, overlap >= SIMILARITY_THRESHOLD)
+            )
+        else:
+            # کوئری کوتاه (کمتر از سه حرف) فقط پیشوندی جستجو می‌شود
+            score = prefix + contains
+            stmt = stmt.where(prefix > 0)
+
+        if scope_user_id is not None:
+            h = UserHierarchyModel
+            stmt = stmt.join(h, h.descendant_id == UserCoreModel.id).where(
+                h.ancestor_id == scope_user_id, h.depth > 0
+            )
+        # (عبارت، نزولی) به ترتیب مرتب‌سازی؛ امتیاز در WHERE دوباره محاسبه می‌شود چون برچسب آنجا معتبر نیست
+        keys = [(score, True), *([(tiebreak, False)] if tiebreak is not None else [])]
+        if cursor:
+            values, last_id = decode_cursor(cursor)
+            if not isinstance(values, list) or len(values) != len(keys):
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid pagination cursor")
+            stmt = stmt.where(_keyset_after([*keys, (UserCoreModel.id, True)], [*values, last_id]))
+
+        sort_columns = [expr.label(f"k{i}") for i, (expr, _) in enumerate(keys)]
+        result = await self.session.execute(
+            stmt.add_columns(*sort_columns)
+            .order_by(
+                *(key.desc() if descending else key for key, (_, descending) in zip(sort_columns, keys)),
+                UserCoreModel.id.desc(),
+            )
+            .limit(limit + 1)
+        )
+        rows = result.all()
+        items = [SearchHit(user=row[0], score=float(row[1])) for row in rows[:limit]]
+        if len(rows) <= limit:
+            return Page(items=items)
+        last = rows[limit - 1]
+        return Page(items=items, next_cursor=encode_cursor([float(value) for value in last[1:]], last[0].id))
@@ -1,14 +1,247 @@
-from typing import List
+from datetime import timezone
+from typing import Sequence
 
-from sqlalchemy import select
+from fastapi import status
+from fastapi.exceptions import HTTPException
+from sqlalchemy import select, insert, delete, update, func, literal, true
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from project.db.models import UserCoreModel
+from project.core.app_pricing.prices import PricePair
+from project.core.app_user.resolver import downstream_users
+from project.core.app_user.search import SEARCH_FIELDS, SearchHit, users_of
+from project.core.auth.principals import Principal, principal_cache
+from project.db.models import (
+    UserCoreModel, UserHierarchyModel, RepresentativeRollupModel, RepresentativesCoreModel, ConfigurationPanelModel,
+    UserSearchModel,
+)
 
-from .base import BaseRepository
+from .base import BaseRepository, Page, DEFAULT_CHUNK_SIZE
+from .loaders import UserRelationLoader, UserBundle
+from .rollup import RepresentativeRollupRepository
+from .search import UserSearchRepository
 
 
 
 class UserCoreRepository(BaseRepository[UserCoreModel]):
+    def __init__(self, model: type[UserCoreModel], session: AsyncSession):
+        super().__init__(model, session)
+        self.rollup_repo = RepresentativeRollupRepository(RepresentativeRollupModel, session)
+        self.loader = UserRelationLoader(session)
+        self.search_repo = UserSearchRepository(UserSearchModel, session)
+
+    # ────── CREATE ──────
+    async def create(self, data: dict) -> UserCoreModel:
+        obj = self.model(**data)
+        self.session.add(obj)
+        await self.session.flush()
+        await self._link_hierarchy(obj.id, obj.upstream_id)
+        await self.rollup_repo.user_created(obj.upstream_id)
+        await self.search_repo.index_users([obj.id])
+        await self.session.commit()
+        await self.session.refresh(obj)
+        return obj
+
+    async def bulk_create(
+        self,
+        rows: Sequence[dict],
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        commit: bool = True
+    ) -> list[UserCoreModel]:
+        objs = await super().bulk_create(rows, chunk_size=chunk_size, commit=False)
+        # به ترتیب درج، تا بالادستی‌هایی که در همین دسته هستند قبل از پایین‌دستی‌ها ثبت شوند
+        for obj in objs:
+            await self._link_hierarchy(obj.id, obj.upstream_id)
+            await self.rollup_repo.user_created(obj.upstream_id)
+        await self.search_repo.index_users([obj.id for obj in objs])
+        if commit:
+            await self.session.commit()
+        return objs
+
+    # ────── HIERARCHY ──────
+    async def _link_hierarchy(self, user_id: int, upstream_id: int | None) -> None:
+        """ردیف‌های closure کاربر جدید: خودش با depth صفر و همه اجداد بالادستی با depth+1"""
+        h = UserHierarchyModel
+        rows = select(literal(user_id), literal(user_id), literal(0))
+        if upstream_id is not None:
+            rows = rows.union_all(
+                select(h.ancestor_id, literal(user_id), h.depth + 1).where(h.descendant_id == upstream_id)
+            )
+        await self.session.execute(
+            insert(h).from_select(["ancestor_id", "descendant_id", "depth"], rows)
+        )
+
+    async def reparent(self, user_obj: UserCoreModel, new_upstream_id: int | None) -> UserCoreModel:
+        """انتقال کاربر و کل زیرشاخه‌اش زیر بالادستی جدید"""
+        h = UserHierarchyModel
+        if new_upstream_id is not None and await self.is_descendant(new_upstream_id, user_obj.id, include_self=True):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="A user cannot be moved under itself or one of its downstream users"
+            )
+        # (upstream_id, tel_chat_id) یکتاست؛ بالادستی جدید نباید کاربر دیگری با همین شناسه چت داشته باشد
+        if new_upstream_id is not None:
+            existing = await self.get_downstream_by_chat_id(new_upstream_id, user_obj.tel_chat_id)
+            if existing is not None and existing.id != user_obj.id:
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail="The new upstream already has a user with this chat id"
+                )
+        # آمار زیرشاخه از زنجیره قبلی کم و به زنجیره جدید اضافه می‌شود
+        totals = await self.rollup_repo.subtree_totals(user_obj.id)
+        await self.rollup_repo.move_subtree(totals, user_obj.upstream_id, new_upstream_id)
+
+        subtree = select(h.descendant_id).where(h.ancestor_id == user_obj.id)
+        # جدا کردن زیرشاخه از اجداد قبلی (ردیف‌های داخل زیرشاخه دست نمی‌خورند)
+        await self.session.execute(
+            delete(h).where(
+                h.descendant_id.in_(subtree),
+                h.ancestor_id.not_in(subtree),
+            )
+        )
+        if new_upstream_id is not None:
+            above = select(h.ancestor_id, h.depth).where(h.descendant_id == new_upstream_id).subquery()
+            below = select(h.descendant_id, h.depth).where(h.ancestor_id == user_obj.id).subquery()
+            await self.session.execute(
+                insert(h).from_select(
+                    ["ancestor_id", "descendant_id", "depth"],
+                    # ضرب دکارتی عمدی: هر جد جدید با هر عضو زیرشاخه
+                    select(above.c.ancestor_id, below.c.descendant_id, above.c.depth + below.c.depth + 1)
+                    .select_from(above).join(below, true())
+                )
+            )
+        await self.session.execute(
+            update(UserCoreModel).where(UserCoreModel.id == user_obj.id).values(upstream_id=new_upstream_id)
+        )
+        try:
+            await self.session.commit()
+        except IntegrityError as e:
+            # کاربر هم‌نام در همین فاصله توسط درخواست دیگری زیر بالادستی جدید ساخته شده
+            await self.session.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="The new upstream already has a user with this chat id"
+            ) from e
+        principal_cache.invalidate(user_obj.id)
+        downstream_users.invalidate_user(user_obj.id)
+        await self.session.refresh(user_obj)
+        return user_obj
+
+    async def is_descendant(self, user_id: int, ancestor_id: int, include_self: bool = False) -> bool:
+        h = UserHierarchyModel
+        stmt = select(h.id).where(h.ancestor_id == ancestor_id, h.descendant_id == user_id)
+        if not include_self:
+            stmt = stmt.where(h.depth > 0)
+        return await self.session.scalar(stmt.limit(1)) is not None
+
+    async def descendants(
+        self,
+        user_id: int,
+        max_depth: int | None = None,
+        cursor: str | None = None,
+        limit: int = 20
+    ) -> Page[UserCoreModel]:
+        """همه پایین‌دستی‌های کاربر تا عمق max_depth (بدون محدودیت اگر None باشد)"""
+        h = UserHierarchyModel
+        stmt = (
+            select(UserCoreModel)
+            .join(h, h.descendant_id == UserCoreModel.id)
+            .where(h.ancestor_id == user_id, h.depth > 0)
+        )
+        if max_depth is not None:
+            stmt = stmt.where(h.depth <= max_depth)
+        return await self.paginate(stmt, cursor=cursor, limit=limit)
+
+    async def count_descendants(self, user_id: int, max_depth: int | None = None) -> int:
+        h = UserHierarchyModel
+        stmt = select(func.count()).where(h.ancestor_id == user_id, h.depth > 0)
+        if max_depth is not None:
+            stmt = stmt.where(h.depth <= max_depth)
+        return await self.session.scalar(stmt)
+
+    async def ancestors(self, user_id: int) -> list[UserCoreModel]:
+        """زنجیره بالادستی‌های کاربر؛ از نزدیک‌ترین تا ریشه"""
+        h = UserHierarchyModel
+        result = await self.session.execute(
+            select(UserCoreModel)
+            .join(h, h.ancestor_id == UserCoreModel.id)
+            .where(h.descendant_id == user_id, h.depth > 0)
+            .order_by(h.depth)
+        )
+        return result.scalars().all()
+
+    async def depth(self, user_id: int) -> int:
+        """فاصله کاربر تا ریشه درخت (ریشه صفر است)"""
+        h = UserHierarchyModel
+        return await self.session.scalar(
+            select(func.coalesce(func.max(h.depth), 0)).where(h.descendant_id == user_id)
+        )
+
+    async def rebuild_hierarchy(self) -> int:
+        """ساخت دوباره کل جدول closure از ستون upstream_id با یک CTE بازگشتی"""
+        tree = (
+            select(
+                UserCoreModel.id.label("ancestor_id"),
+                UserCoreModel.id.label("descendant_id"),
+                literal(0).label("depth"),
+            )
+            .cte("tree", recursive=True)
+        )
+        tree = tree.union_all(
+            select(tree.c.ancestor_id, UserCoreModel.id, tree.c.depth + 1)
+            .join(UserCoreModel, UserCoreModel.upstream_id == tree.c.descendant_id)
+        )
+        await self.session.execute(delete(UserHierarchyModel))
+        result = await self.session.execute(
+            insert(UserHierarchyModel).from_select(
+                ["ancestor_id", "descendant_id", "depth"],
+                select(tree.c.ancestor_id, tree.c.descendant_id, tree.c.depth),
+            )
+        )
+        await self.session.commit()
+        return result.rowcount
+
+    # ────── READ ──────
+    async def bundle_page(
+        self,
+        page: Page[UserCoreModel],
+        counts: Sequence[str] = (),
+        latest: Sequence[str] = (),
+    ) -> Page[UserBundle]:
+        """افزودن شمارش‌ها و آخرین ردیف رابطه‌ها به یک صفحه کاربر با تعداد ثابتی کوئری"""
+        items = await self.loader.bundle(page.items, counts=counts, latest=latest)
+        return Page(items=items, next_cursor=page.next_cursor)
+
+    async def get_principal(self, user_id: int) -> Principal | None:
+        """ستون‌های لازم برای احراز هویت با یک کوئری؛ زمان تغییر رمز از هسته نماینده خوانده می‌شود"""
+        result = await self.session.execute(
+            select(
+                UserCoreModel.id,
+                UserCoreModel.upstream_id,
+                UserCoreModel.is_active,
+                UserCoreModel.is_admin,
+                UserCoreModel.is_repres,
+                RepresentativesCoreModel.password_changed_at,
+            )
+            .outerjoin(RepresentativesCoreModel, RepresentativesCoreModel.user_core == UserCoreModel.id)
+            .where(UserCoreModel.id == user_id)
+        )
+        row = result.first()
+        if row is None:
+            return None
+        changed_at = row.password_changed_at
+        if changed_at is not None and changed_at.tzinfo is None:
+            # sqlite منطقه زمانی را ذخیره نمی‌کند
+            changed_at = changed_at.replace(tzinfo=timezone.utc)
+        return Principal(
+            id=row.id,
+            upstream_id=row.upstream_id,
+            is_active=bool(row.is_active),
+            is_admin=bool(row.is_admin),
+            is_repres=bool(row.is_repres),
+            pwd_ts=changed_at.timestamp() if changed_at else None,
+        )
+
     async def get_by_unique_id(self, unique_id: str) -> UserCoreModel | None:
         result = await self.session.execute(
             select(UserCoreModel).where(UserCoreModel.unique_id == unique_id)
@@ -19,31 +252,135 @@ class UserCoreRepository(BaseRepository[UserCoreModel]):
         result = await self.session.execute(
             select(UserCoreModel).where(UserCoreModel.tel_chat_id == tel_chat_id)
         )
-        return result.scalars().all()
+        return result.scalars().first()
+
+    async def get_user_by_unique_id(self, unique_id: str) -> UserCoreModel | None:
+        return await self.get_by_unique_id(unique_id)
+
+    async def get_downstream_by_chat_id(self, upstream_id: int, tel_chat_id: str) -> UserCoreModel | None:
+        # ایندکس یکتای ix_user_upstream_chat حداکثر یک ردیف را تضمین می‌کند
+        result = await self.session.execute(
+            select(UserCoreModel).where(
+                UserCoreModel.upstream_id == upstream_id,
+                UserCoreModel.tel_chat_id == tel_chat_id,
+            )
+        )
+        return result.scalar_one_or_none()
 
-    async def get_user_by_unique_id(self, unique_id: str) -> UserCoreModel:
-        user_obj = await self.user_repo.session.query(UserCoreModel).filter(UserCoreModel.unique_id==unique_id).first()
+    async def resolve_downstream(self, upstream_id: int, tel_chat_id: str) -> UserCoreModel | None:
+        """
+        کاربر پایین‌دستی بات از روی شناسه چت؛ با شناسه کش شده فقط یک get روی کلید اصلی
+        (که در identity map همین session ممکن است اصلا کوئری نزند) و در غیر این صورت یک کوئری ایندکس شده.
+        """
+        user_id = downstream_users.get(upstream_id, tel_chat_id)
+        if user_id is not None:
+            user_obj = await self.session.get(UserCoreModel, user_id)
+            if user_obj is not None and user_obj.upstream_id == upstream_id and user_obj.tel_chat_id == tel_chat_id:
+                return user_obj
+            # کاربر در پروسه دیگری حذف یا جابه‌جا شده است
+            downstream_users.invalidate_user(user_id)
+        user_obj = await self.get_downstream_by_chat_id(upstream_id, tel_chat_id)
+        if user_obj is not None:
+            downstream_users.put(upstream_id, tel_chat_id, user_obj.id)
         return user_obj
 
-    async def search_by_name(self, query: str, skip: int = 0, limit: int = 20) -> List[UserCoreModel] | List:
-        stmt = select(UserCoreModel).where(
-            (UserCoreModel.first_name.ilike(f"%{query}%")) |
-            (UserCoreModel.last_name.ilike(f"%{query}%"))
-        ).offset(skip).limit(limit)
-        result = await self.session.execute(stmt)
-        return result.scalars().all()
+    async def search(
+        self, query: str, scope_user_id: int | None = None, cursor: str | None = None, limit: int = 20
+    ) -> Page[SearchHit]:
+        return await self.search_repo.search(query, scope_user_id=scope_user_id, cursor=cursor, limit=limit)
+
+    async def search_by_name(self, query: str, cursor: str | None = None, limit: int = 20) -> Page[UserCoreModel]:
+        page = await self.search(query, cursor=cursor, limit=limit)
+        return Page(items=users_of(page.items), next_cursor=page.next_cursor)
     
+    # ────── UPDATE ──────
+    async def update(self, db_obj: UserCoreModel, data: dict) -> UserCoreModel:
+        data = dict(data)
+        if "upstream_id" in data and data["upstream_id"] != db_obj.upstream_id:
+            db_obj = await self.reparent(db_obj, data.pop("upstream_id"))
+        data.pop("upstream_id", None)
+        if SEARCH_FIELDS & data.keys():
+            for field in SEARCH_FIELDS & data.keys():
+                setattr(db_obj, field, data[field])
+            await self.session.flush()
+            await self.search_repo.index_users([db_obj.id])
+        db_obj = await super().update(db_obj, data)
+        principal_cache.invalidate(db_obj.id)
+        downstream_users.invalidate_user(db_obj.id)
+        return db_obj
+
+    # ────── DELETE ──────
+    async def delete(self, db_obj: UserCoreModel) -> None:
+        """
+        حذف کاربر؛ پایین‌دستی‌های مستقیم ریشه می‌شوند و زیرشاخه از زنجیره بالادستی جدا می‌شود.
+        رابطه‌های write_only بارگذاری نمی‌شوند و ردیف‌های وابسته با دستورهای گروهی پاک می‌شوند.
+        """
+        h = UserHierarchyModel
+        totals = await self.rollup_repo.subtree_totals(db_obj.id)
+        await self.rollup_repo.move_subtree(totals, db_obj.upstream_id, None)
+
+        subtree = select(h.descendant_id).where(h.ancestor_id == db_obj.id)
+        above = select(h.ancestor_id).where(h.descendant_id == db_obj.id)
+        await self.session.execute(delete(h).where(h.descendant_id.in_(subtree), h.ancestor_id.in_(above)))
+        await self.session.execute(
+            update(UserCoreModel).where(UserCoreModel.upstream_id == db_obj.id).values(upstream_id=None)
+        )
+        await self.session.execute(delete(ConfigurationPanelModel).where(ConfigurationPanelModel.user_core == db_obj.id))
+        await self.session.execute(delete(RepresentativeRollupModel).where(RepresentativeRollupModel.user_id == db_obj.id))
+        await self.search_repo.remove_users([db_obj.id])
+        user_id = db_obj.id
+        await super().delete(db_obj)
+        principal_cache.invalidate(user_id)
+        downstream_users.invalidate_user(user_id)
+
     async def set_repres(self, user_obj: UserCoreModel) -> UserCoreModel:
         user_obj.is_repres = True
         await self.session.commit()
+        principal_cache.invalidate(user_obj.id)
         await self.session.refresh(user_obj)
         return user_obj
     
 
 
+class RepresentativeRepository(BaseRepository[RepresentativesCoreModel]):
+    def __init__(self, model: type[RepresentativesCoreModel], session: AsyncSession):
+        super().__init__(model, session)
+        self.search_repo = UserSearchRepository(UserSearchModel, session)
 
+    # شماره تلفن نماینده در سند جستجوی کاربر است
+    async def create(self, data: dict) -> RepresentativesCoreModel:
+        obj = self.model(**data)
+        self.session.add(obj)
+        await self.session.flush()
+        await self.search_repo.index_users([obj.user_core])
+        await self.session.commit()
+        await self.session.refresh(obj)
+        return obj
 
+    async def update(self, db_obj: RepresentativesCoreModel, data: dict) -> RepresentativesCoreModel:
+        if "phone_number" in data:
+            db_obj.phone_number = data["phone_number"]
+            await self.session.flush()
+            await self.search_repo.index_users([db_obj.user_core])
+        return await super().update(db_obj, data)
 
+    async def get_price_pair(self, user_id: int) -> PricePair | None:
+        result = await self.session.execute(
+            select(
+                RepresentativesCoreModel.user_core,
+                RepresentativesCoreModel.base_selling_price,
+                RepresentativesCoreModel.base_purchase_price,
+            ).where(RepresentativesCoreModel.user_core == user_id)
+        )
+        row = result.first()
+        return PricePair(*row) if row else None
 
-
-
+    async def all_price_pairs(self) -> list[PricePair]:
+        result = await self.session.execute(
+            select(
+                RepresentativesCoreModel.user_core,
+                RepresentativesCoreModel.base_selling_price,
+                RepresentativesCoreModel.base_purchase_price,
+            )
+        )
+        return [PricePair(*row) for row in result.all()]
@@ -1,43 +1,69 @@
-from typing import List, Any
+from typing import Any, List, Sequence
 
 from fastapi.exceptions import HTTPException
 from fastapi import status
-from sqlalchemy import select
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from project.db.models import WalletInvoiceStatusChoices, WalletRechargeInvoiceModel, UserCoreModel, ConfigurationInvoiceModel
+from project.core.app_pricing.prices import price_cache
+from project.db.models import (
+    WalletInvoiceStatusChoices, WalletRechargeInvoiceModel, UserCoreModel, ConfigurationInvoiceModel, WalletLedgerEntryModel,
+    RepresentativeRollupModel, RepresentativesCoreModel
+)
 
-from .base import BaseRepository
+from .base import BaseRepository, Page
+from .ledger import WalletLedgerRepository
+from .rollup import RepresentativeRollupRepository
+from .user import RepresentativeRepository
+
+
+WALLET_INVOICE_REFERENCE = "wallet_recharge_invoice"
 
 
 
 class WalletInvoiceRepository(BaseRepository[WalletRechargeInvoiceModel]):
+    def __init__(self, model: type[WalletRechargeInvoiceModel], session: AsyncSession):
+        super().__init__(model, session)
+        self.balance_repo = WalletBalanceRepository(UserCoreModel, session)
+        self.rollup_repo = RepresentativeRollupRepository(RepresentativeRollupModel, session)
+        self.representative_repo = RepresentativeRepository(RepresentativesCoreModel, session)
+
+    async def _seller_selling_price(self, seller_user_id: int) -> int:
+        # قیمت از کش جدول قیمت نماینده‌ها خوانده می‌شود؛ نبود ردیف نمایندگی یعنی فروشنده نماینده نیست
+        prices = await price_cache.get(seller_user_id, self.representative_repo.get_price_pair)
+        if prices is None:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Seller must be representative.")
+        return prices.selling
+
     async def all_invoices_seller_user(
             self, 
             upstream_user_obj: UserCoreModel,
             limit: int = 100, 
-            skip: int = 0, 
+            cursor: str | None = None, 
             order_by: Any = None
-            ) -> List[WalletRechargeInvoiceModel]:
-        wi_objs = upstream_user_obj.seller_wallet_invoice
-        if order_by:
-            wi_objs = wi_objs.order_by(order_by.desc())
-        return wi_objs.offset(skip).limit(limit).all()
+            ) -> Page[WalletRechargeInvoiceModel]:
+        return await self.get_page(
+            cursor=cursor,
+            limit=limit,
+            order_by=order_by,
+            filters={"seller_user_id": upstream_user_obj.id}
+        )
 
     async def all_invoices_buyer_user(
             self,
             upstream_user_obj: UserCoreModel, 
             user_obj: UserCoreModel,
             limit: int = 100, 
-            skip: int = 0, 
+            cursor: str | None = None, 
             order_by: Any = None
-            ) -> List[WalletRechargeInvoiceModel]:
+            ) -> Page[WalletRechargeInvoiceModel]:
             
             filters = {
                 "buyer_user_id": user_obj.id,
                 "seller_user_id": upstream_user_obj.id
             }
-            wi_objs = await self.get_multi(
-                skip=skip,
+            wi_objs = await self.get_page(
+                cursor=cursor,
                 limit=limit,
                 order_by=order_by,
                 filters=filters
@@ -49,7 +75,7 @@ class WalletInvoiceRepository(BaseRepository[WalletRechargeInvoiceModel]):
             wi_id: int, 
             upstream_user_obj: UserCoreModel
         ) -> WalletRechargeInvoiceModel:
-        wi_result = await self.session.execute(select(WalletInvoiceStatusChoices).where(
+        wi_result = await self.session.execute(select(WalletRechargeInvoiceModel).where(
              WalletRechargeInvoiceModel.id==wi_id,
              WalletRechargeInvoiceModel.seller_user_id==upstream_user_obj.id 
         ))
@@ -61,43 +87,155 @@ class WalletInvoiceRepository(BaseRepository[WalletRechargeInvoiceModel]):
                 )
         return wi_obj
 
+    async def get_upstream_user_wallet_invoices_by_ids(
+            self,
+            wi_ids: List[int],
+            upstream_user_obj: UserCoreModel
+        ) -> List[WalletRechargeInvoiceModel]:
+        wi_result = await self.session.execute(select(WalletRechargeInvoiceModel).where(
+             WalletRechargeInvoiceModel.id.in_(wi_ids),
+             WalletRechargeInvoiceModel.seller_user_id==upstream_user_obj.id
+        ))
+        return wi_result.scalars().all()
+
+    async def claim_invoices(self, wi_ids: List[int], new_status: WalletInvoiceStatusChoices) -> set[int]:
+        """نسخه گروهی claim_invoice؛ شناسه فاکتورهایی که واقعا تغییر کردند برگردانده می‌شود"""
+        if not wi_ids:
+            return set()
+        result = await self.session.execute(
+            update(WalletRechargeInvoiceModel)
+            .where(
+                WalletRechargeInvoiceModel.id.in_(wi_ids),
+                WalletRechargeInvoiceModel.status == WalletInvoiceStatusChoices.WAITING,
+            )
+            .values(status=new_status)
+            .returning(WalletRechargeInvoiceModel.id)
+        )
+        return set(result.scalars().all())
+
+    async def accept_invoices(
+            self,
+            wi_objs: List[WalletRechargeInvoiceModel],
+            seller_user_obj: UserCoreModel
+        ) -> set[int]:
+        """
+        تایید گروهی فاکتورهای در انتظار در یک تراکنش:
+        یک کسر شرطی از کیف پول فروشنده برای جمع کل (با یک ردیف دفتر کل برای هر فاکتور)،
+        واریز به خریداران و ساخت فاکتورهای کانفیگ مستقیم.
+        """
+        try:
+            direct_ids = [wi.id for wi in wi_objs if wi.get_config]
+            wallet_ids = [wi.id for wi in wi_objs if not wi.get_config]
+            price = await self._seller_selling_price(seller_user_obj.id) if direct_ids else None
+
+            claimed = await self.claim_invoices(direct_ids, WalletInvoiceStatusChoices.CONFIGURATION_DIRECTE)
+            claimed |= await self.claim_invoices(wallet_ids, WalletInvoiceStatusChoices.PAY_WALLET)
+            claimed_objs = [wi for wi in wi_objs if wi.id in claimed]
+            if not claimed_objs:
+                return claimed
+
+            total = sum(wi.charge_amount for wi in claimed_objs)
+            debits = [(wi.charge_amount, wi.id) for wi in claimed_objs]
+            if await self.balance_repo.debit_many(seller_user_obj.id, debits, WALLET_INVOICE_REFERENCE) is None:
+                raise HTTPException(
+                    status_code=status.HTTP_406_NOT_ACCEPTABLE,
+                    detail="You do not have permission to approve these receipts due to insufficient funds in your wallet."
+                )
+            await self.rollup_repo.wallet_invoice_approved(seller_user_obj.id, total)
+            config_invoices = []
+            for wi in claimed_objs:
+                if wi.get_config:
+                    volume = wi.charge_amount // price
+                    config_invoices.append(ConfigurationInvoiceModel(
+                        buyer_user_id=wi.buyer_user_id,
+                        seller_user_id=seller_user_obj.id,
+                        volume=volume,
+                        base_price=price,
+                        total_price=price * volume,
+                        descriptions=wi.descriptions,
+                    ))
+                else:
+                    await self.balance_repo.credit(wi.buyer_user_id, wi.charge_amount, WALLET_INVOICE_REFERENCE, wi.id)
+            self.session.add_all(config_invoices)
+            for config_invoice in config_invoices:
+                await self.rollup_repo.config_invoice_created(config_invoice)
+            await self.session.commit()
+            return claimed
+        except HTTPException:
+            await self.session.rollback()
+            raise
+        except Exception as e:
+            await self.session.rollback()
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to approve wallet invoices.") from e
+
+    async def reject_invoices(self, wi_ids: List[int]) -> set[int]:
+        claimed = await self.claim_invoices(wi_ids, WalletInvoiceStatusChoices.REJECTED)
+        await self.session.commit()
+        return claimed
+
+    async def claim_invoice(self, wi_id: int, new_status: WalletInvoiceStatusChoices) -> bool:
+        """تغییر وضعیت فقط اگر فاکتور هنوز در انتظار باشد؛ از تایید دوباره هم‌زمان جلوگیری می‌کند"""
+        result = await self.session.execute(
+            update(WalletRechargeInvoiceModel)
+            .where(
+                WalletRechargeInvoiceModel.id == wi_id,
+                WalletRechargeInvoiceModel.status == WalletInvoiceStatusChoices.WAITING,
+            )
+            .values(status=new_status)
+            .returning(WalletRechargeInvoiceModel.id)
+        )
+        return result.scalar_one_or_none() is not None
+
+    async def _claim_and_debit_seller(self, wi_obj: WalletRechargeInvoiceModel, new_status: WalletInvoiceStatusChoices) -> None:
+        if not await self.claim_invoice(wi_obj.id, new_status):
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="wallet invoice is not waiting for approval")
+        debited = await self.balance_repo.debit(
+            wi_obj.seller_user_id, wi_obj.charge_amount, WALLET_INVOICE_REFERENCE, wi_obj.id
+        )
+        if debited is None:
+            raise HTTPException(
+                status_code=status.HTTP_406_NOT_ACCEPTABLE,
+                detail="You do not have permission to approve this receipt due to insufficient funds in your wallet."
+            )
+        await self.rollup_repo.wallet_invoice_approved(wi_obj.seller_user_id, wi_obj.charge_amount)
+
     async def get_direct_config(self, wallet_invoice: WalletRechargeInvoiceModel) -> WalletRechargeInvoiceModel:
         try:
-            seller_user_obj = await wallet_invoice.awaitable_attrs.seller_user
-            if not seller_user_obj.is_repres:
-                raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Seller must be representative.")
-            
-            price = seller_user_obj.representative_core.base_selling_price
+            price = await self._seller_selling_price(wallet_invoice.seller_user_id)
             volume = wallet_invoice.charge_amount // price
             
-            async with self.session.begin():
-                config_invoice = ConfigurationInvoiceModel(
-                    buyer_user=wallet_invoice.buyer_user,
-                    seller_user=seller_user_obj,
-                    volume=volume,
-                    base_price=price,
-                    total_price=price * volume,
-                    descriptions=wallet_invoice.descriptions,
-                )
-                wallet_invoice.status = WalletInvoiceStatusChoices.CONFIGURATION_DIRECTE.value
-                await self.session.add(config_invoice)
-            
+            await self._claim_and_debit_seller(wallet_invoice, WalletInvoiceStatusChoices.CONFIGURATION_DIRECTE)
+            config_invoice = ConfigurationInvoiceModel(
+                buyer_user_id=wallet_invoice.buyer_user_id,
+                seller_user_id=wallet_invoice.seller_user_id,
+                volume=volume,
+                base_price=price,
+                total_price=price * volume,
+                descriptions=wallet_invoice.descriptions,
+            )
+            self.session.add(config_invoice)
+            await self.rollup_repo.config_invoice_created(config_invoice)
+            await self.session.commit()
             await self.session.refresh(wallet_invoice)
             return wallet_invoice
         except HTTPException:
+            await self.session.rollback()
             raise
         except Exception as e:
+            await self.session.rollback()
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to create configuration invoice") from e
 
     async def adding_charge_to_wallet(self, wi_obj: WalletRechargeInvoiceModel) -> WalletRechargeInvoiceModel:
         try:
-            buyer_user_obj = await wi_obj.awaitable_attrs.buyer_user
-            buyer_user_obj.wallet_balance += wi_obj.charge_amount
-            wi_obj.status = WalletInvoiceStatusChoices.PAY_WALLET.value
-            async with self.session.begin():
-                pass
+            # انتقال شارژ از کیف پول فروشنده به خریدار بدون قفل ردیف؛ هر دو به‌روزرسانی شرطی و تک‌دستوری هستند
+            await self._claim_and_debit_seller(wi_obj, WalletInvoiceStatusChoices.PAY_WALLET)
+            await self.balance_repo.credit(wi_obj.buyer_user_id, wi_obj.charge_amount, WALLET_INVOICE_REFERENCE, wi_obj.id)
+            await self.session.commit()
             await self.session.refresh(wi_obj)
             return wi_obj
+        except HTTPException:
+            await self.session.rollback()
+            raise
         except Exception as e:
             await self.session.rollback()
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to add charge to wallet.") from e
@@ -105,7 +243,76 @@ class WalletInvoiceRepository(BaseRepository[WalletRechargeInvoiceModel]):
     async def wallet_balance_sufficient(self, upstream_user_obj: UserCoreModel, amount: int):
         if not upstream_user_obj:
             return None
-        wallet_balance = upstream_user_obj.wallet_balance
-        if wallet_balance < amount:
+        wallet_balance = await self.balance_repo.get_balance(upstream_user_obj.id)
+        if wallet_balance is None or wallet_balance < amount:
             return False
         return True
+
+
+class WalletBalanceRepository(BaseRepository[UserCoreModel]):
+    """
+    تغییر موجودی کیف پول با UPDATE شرطی تک‌دستوری (بدون خواندن-تغییر-نوشتن در پایتون).
+    هر تغییر یک ردیف در دفتر کل ثبت می‌کند؛ ستون wallet_balance همچنان منبع خواندن سریع است.
+    هیچ‌کدام commit نمی‌کنند تا در تراکنش فراخواننده اجرا شوند.
+    """
+
+    def __init__(self, model: type[UserCoreModel], session: AsyncSession):
+        super().__init__(model, session)
+        self.ledger_repo = WalletLedgerRepository(WalletLedgerEntryModel, session)
+
+    async def get_balance(self, user_id: int) -> int | None:
+        result = await self.session.execute(
+            select(UserCoreModel.wallet_balance).where(UserCoreModel.id == user_id)
+        )
+        return result.scalar_one_or_none()
+
+    async def credit(self, user_id: int, amount: int, reference_type: str | None = None, reference_id: int | None = None) -> int | None:
+        if amount < 0:
+            raise ValueError("credit amount must be non-negative")
+        result = await self.session.execute(
+            update(UserCoreModel)
+            .where(UserCoreModel.id == user_id)
+            .values(wallet_balance=UserCoreModel.wallet_balance + amount)
+            .returning(UserCoreModel.wallet_balance)
+        )
+        balance = result.scalar_one_or_none()
+        if balance is not None:
+            await self.ledger_repo.append(user_id, amount, balance, reference_type, reference_id)
+        return balance
+
+    async def _debit_balance(self, user_id: int, amount: int) -> int | None:
+        result = await self.session.execute(
+            update(UserCoreModel)
+            .where(UserCoreModel.id == user_id, UserCoreModel.wallet_balance >= amount)
+            .values(wallet_balance=UserCoreModel.wallet_balance - amount)
+            .returning(UserCoreModel.wallet_balance)
+        )
+        return result.scalar_one_or_none()
+
+    async def debit(self, user_id: int, amount: int, reference_type: str | None = None, reference_id: int | None = None) -> int | None:
+        """اگر موجودی کافی نباشد None برمی‌گرداند و چیزی تغییر نمی‌کند"""
+        if amount < 0:
+            raise ValueError("debit amount must be non-negative")
+        balance = await self._debit_balance(user_id, amount)
+        if balance is not None:
+            await self.ledger_repo.append(user_id, -amount, balance, reference_type, reference_id)
+        return balance
+
+    async def debit_many(
+        self, user_id: int, debits: Sequence[tuple[int, int | None]], reference_type: str | None = None
+    ) -> int | None:
+        """
+        کسر جمع چند مبلغ (amount, reference_id) با یک UPDATE شرطی؛ همه یا هیچ.
+        برای هر مبلغ یک ردیف جداگانه با شناسه مرجع خودش در دفتر کل ثبت می‌شود.
+        """
+        if any(amount < 0 for amount, _ in debits):
+            raise ValueError("debit amount must be non-negative")
+        total = sum(amount for amount, _ in debits)
+        balance = await self._debit_balance(user_id, total)
+        if balance is None:
+            return None
+        balance_after = balance + total
+        for amount, reference_id in debits:
+            balance_after -= amount
+            await self.ledger_repo.append(user_id, -amount, balance_after, reference_type, reference_id)
+        return balance
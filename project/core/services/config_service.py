@@ -0,0 +1,67 @@
+from typing import Optional, Sequence
+
+from project.core.auth.principals import Principal
+from project.core.repositories.configuration import ConfigInvoiceRepository
+from project.core.repositories.discount import DiscountRepository
+from project.core.repositories.idempotency import IdempotencyKeyRepository
+from project.core.repositories.user import RepresentativeRepository
+from project.core.services.discount_service import DiscountService
+from project.core.services.idempotency_service import IdempotencyService
+from project.core.services.pricing_service import PricingService, Quote
+from project.db.models import UserCoreModel, ConfigurationInvoiceModel, IdempotencyKeyModel, DiscountModel, RepresentativesCoreModel
+
+
+class ConfigInvoiceService:
+    def __init__(
+        self,
+        ci_repo: ConfigInvoiceRepository,
+        idempotency: Optional[IdempotencyService] = None,
+        discount_service: Optional[DiscountService] = None,
+        pricing: Optional[PricingService] = None,
+    ):
+        self.ci_repo = ci_repo
+        self.idempotency = idempotency or IdempotencyService(IdempotencyKeyRepository(IdempotencyKeyModel, ci_repo.session))
+        self.discount_service = discount_service or DiscountService(DiscountRepository(DiscountModel, ci_repo.session))
+        self.pricing = pricing or PricingService(
+            RepresentativeRepository(RepresentativesCoreModel, ci_repo.session), self.discount_service
+        )
+
+    async def create_config_invoice(
+        self,
+        buyer_user_obj: UserCoreModel | Principal,
+        volume: int,
+        descriptions: Optional[str] = None,
+        idempotency_key: Optional[str] = None,
+        discount_codes: Sequence[str] = (),
+    ) -> ConfigurationInvoiceModel:
+        """برای ثبت رسید دریافت کانفیگ کاربر"""
+        return await self.idempotency.run(
+            user_id=buyer_user_obj.id,
+            scope="create_config_invoice",
+            key=idempotency_key,
+            action=lambda: self._create_config_invoice(buyer_user_obj, volume, descriptions, discount_codes),
+            load=self.ci_repo.get_by_id,
+            model=ConfigurationInvoiceModel,
+        )
+
+    async def quote(self, buyer_user_obj: UserCoreModel | Principal, volume: int, discount_codes: Sequence[str] = ()) -> Quote:
+        return await self.pricing.quote(buyer_user_obj, volume, discount_codes)
+
+    async def _create_config_invoice(
+        self,
+        buyer_user_obj: UserCoreModel | Principal,
+        volume: int,
+        descriptions: Optional[str],
+        discount_codes: Sequence[str] = (),
+    ) -> ConfigurationInvoiceModel:
+        quote = await self.pricing.quote(buyer_user_obj, volume, discount_codes)
+        # شمارنده‌های استفاده با rollback فاکتور برمی‌گردند
+        async with self.discount_service.redemption(quote.discount, buyer_user_obj.id):
+            return await self.ci_repo.create_config_invoice(
+                buyer_user_obj=buyer_user_obj,
+                seller_user_id=quote.seller_user_id,
+                volume=volume,
+                price=quote.base_price,
+                descriptions=descriptions,
+                discount_amount=quote.discount_amount,
+            )
@@ -0,0 +1,59 @@
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Sequence
+
+from fastapi import status
+from fastapi.exceptions import HTTPException
+
+from project.core.app_discount.engine import DiscountEvaluation, DiscountRuleCache, discount_rules, evaluate
+from project.core.app_discount.redemption import DiscountRedemptionCounter, redemption_counter
+from project.core.repositories.discount import DiscountRepository
+
+
+class DiscountService:
+    def __init__(
+        self,
+        discount_repo: DiscountRepository,
+        cache: DiscountRuleCache = discount_rules,
+        counter: DiscountRedemptionCounter = redemption_counter,
+    ):
+        self.discount_repo = discount_repo
+        self.cache = cache
+        self.counter = counter
+
+    async def evaluate(self, seller_user_id: int, buyer_user_id: int, codes: Sequence[str], amount: int) -> DiscountEvaluation:
+        """محاسبه تخفیف از روی قوانین کش شده؛ در حالت پایدار به دیتابیس نیازی ندارد"""
+        if not codes:
+            return DiscountEvaluation(amount=amount)
+        seller_discounts = await self.cache.get(
+            seller_user_id, lambda: self.discount_repo.load_seller_discounts(seller_user_id)
+        )
+        return evaluate(seller_discounts, codes, buyer_user_id, amount)
+
+    async def redeem(self, evaluation: DiscountEvaluation, buyer_user_id: int) -> None:
+        """ثبت استفاده کاربر از کدها در تراکنش جاری فاکتور (commit نمی‌کند)"""
+        for rule in evaluation.rules:
+            used = await self.discount_repo.increment_user_usage(rule.id, buyer_user_id, rule.number_uses_per_user)
+            if used is None:
+                raise HTTPException(
+                    status_code=status.HTTP_406_NOT_ACCEPTABLE,
+                    detail=f"You have reached the usage limit of discount code {rule.code}"
+                )
+
+    @asynccontextmanager
+    async def redemption(self, evaluation: DiscountEvaluation, buyer_user_id: int) -> AsyncIterator[DiscountEvaluation]:
+        """
+        رزرو سقف کل کدها در تراکنش جداگانه و ثبت استفاده کاربر در تراکنش جاری.
+        اگر بدنه (تراکنش فاکتور) شکست بخورد رزروها آزاد می‌شوند.
+        """
+        if not evaluation.rules:
+            yield evaluation
+            return
+        # تراکنش خواندنی جاری بسته می‌شود تا تراکنش کوتاه شمارنده منتظر آن نماند
+        await self.discount_repo.session.commit()
+        async with self.counter.reserve(evaluation.rules):
+            try:
+                await self.redeem(evaluation, buyer_user_id)
+            except BaseException:
+                await self.discount_repo.session.rollback()
+                raise
+            yield evaluation
@@ -0,0 +1,167 @@
+import asyncio
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional, Tuple
+
+from fastapi import status
+from fastapi.exceptions import HTTPException
+from sqlalchemy import event
+
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from project.core.config import settings
+from project.core.repositories.idempotency import IdempotencyKeyRepository
+from project.db.database import async_session
+from project.db.models import IdempotencyKeyModel, IdempotencyStatusChoices
+
+
+# درخواست‌های در حال اجرای همین پروسه؛ درخواست تکراری هم‌زمان منتظر نتیجه درخواست اول می‌ماند
+_inflight: Dict[Tuple[int, str, str], asyncio.Future] = {}
+
+
+class IdempotencyService:
+    """
+    اجرای یک عملیات فقط یک بار به ازای هر (کاربر، نوع عملیات، کلید).
+    تکرار درخواست بعد از اتمام، سند ساخته شده قبلی را برمی‌گرداند و دوباره اجرا نمی‌شود.
+    """
+
+    def __init__(self, key_repo: IdempotencyKeyRepository, ttl: Optional[int] = None):
+        self.key_repo = key_repo
+        self.ttl = ttl or settings.IDEMPOTENCY_KEY_TTL
+
+    async def run(
+        self,
+        user_id: int,
+        scope: str,
+        key: Optional[str],
+        action: Callable[[], Awaitable[Any]],
+        load: Callable[[int], Awaitable[Any]],
+        model: type,
+        resource_id: Optional[int] = None,
+    ) -> Any:
+        """
+        model نوع سندی است که action می‌سازد یا تغییر می‌دهد. اگر سند از قبل وجود دارد
+        (مثل تایید فاکتور) شناسه آن در resource_id داده می‌شود، وگرنه اولین ردیف جدید model
+        که action ذخیره می‌کند سند نتیجه است.
+        """
+        if not key:
+            return await action()
+
+        ident = (user_id, scope, key)
+        inflight = _inflight.get(ident)
+        if inflight is not None:
+            resource_id = await asyncio.shield(inflight)
+            return await load(resource_id)
+
+        future = asyncio.get_running_loop().create_future()
+        _inflight[ident] = future
+        record, created = None, False
+        completed: Dict[int, int] = {}
+        try:
+            record, created = await self.key_repo.claim(user_id, scope, key, self.ttl)
+            if not created:
+                if record.status != IdempotencyStatusChoices.COMPLETED:
+                    # درخواست اول در پروسه دیگری در حال اجراست
+                    raise HTTPException(
+                        status_code=status.HTTP_409_CONFLICT,
+                        detail="A request with this idempotency key is already in progress"
+                    )
+                future.set_result(record.resource_id)
+                return await load(record.resource_id)
+
+            # بعد از rollback عملیات ناموفق، ویژگی‌های record منقضی می‌شوند
+            record_id = record.id
+            with self._complete_on_commit(completed, record_id, model, resource_id):
+                obj = await action()
+            if completed.get(record_id) != obj.id:
+                # action چیزی commit نکرده یا سند دیگری برگردانده است
+                await self.key_repo.complete(record_id, model.__tablename__, obj.id)
+            future.set_result(obj.id)
+            return obj
+        except BaseException as e:
+            if not future.done():
+                if created and record_id in completed and not isinstance(e, HTTPException):
+                    # سند ذخیره و کلید در همان تراکنش تمام شده است؛ تکرار درخواست همان سند را می‌گیرد
+                    future.set_result(completed[record_id])
+                    raise
+                if created:
+                    await self.key_repo.session.rollback()
+                    await self.key_repo.release(record_id)
+                if isinstance(e, asyncio.CancelledError):
+                    future.cancel()
+                else:
+                    future.set_exception(e)
+                    # اگر درخواست تکراری منتظر نباشد، هشدار exception never retrieved داده نشود
+                    future.exception()
+            raise
+        finally:
+            _inflight.pop(ident, None)
+
+    @contextmanager
+    def _complete_on_commit(
+        self, completed: Dict[int, int], record_id: int, model: type, resource_id: Optional[int]
+    ) -> Iterator[None]:
+        """
+        ثبت اتمام کلید داخل همان commit که اثر action را ذخیره می‌کند؛ اگر پروسه بین ذخیره سند
+        و ثبت کلید از کار بیفتد، کلید IN_PROGRESS نمی‌ماند تا تکرارها تا پایان TTL با 409 رد شوند.
+        """
+        sync_session = self.key_repo.session.sync_session
+        created: list = []
+        pending: list = []
+
+        def after_flush(session, flush_context):
+            created.extend(obj for obj in session.new if isinstance(obj, model))
+
+        def before_commit(session):
+            if record_id in completed:
+                return
+            # سندهای در انتظار flush می‌شوند تا شناسه سند جدید مشخص شود
+            session.flush()
+            target = resource_id if resource_id is not None else next((obj.id for obj in created), None)
+            if target is None:
+                return
+            session.execute(self.key_repo.complete_statement(record_id, model.__tablename__, target))
+            pending.append(target)
+
+        def after_commit(session):
+            if pending:
+                completed[record_id] = pending[0]
+
+        def after_rollback(session):
+            pending.clear()
+            created.clear()
+
+        listeners = (
+            ("after_flush", after_flush), ("before_commit", before_commit),
+            ("after_commit", after_commit), ("after_soft_rollback", after_rollback),
+        )
+        for name, fn in listeners:
+            event.listen(sync_session, name, fn)
+        try:
+            yield
+        finally:
+            for name, fn in listeners:
+                event.remove(sync_session, name, fn)
+
+
+class IdempotencyKeyPurger:
+    """
+    حذف دوره‌ای کلیدهای منقضی شده؛ claim فقط کلید منقضی همان درخواست را پاک می‌کند
+    و بدون این کار کلیدهایی که دوباره استفاده نمی‌شوند در جدول می‌مانند.
+    """
+
+    def __init__(self, session_factory: async_sessionmaker = async_session, interval: Optional[float] = None):
+        self.session_factory = session_factory
+        self.interval = interval or settings.IDEMPOTENCY_PURGE_INTERVAL
+
+    async def purge(self) -> int:
+        async with self.session_factory() as session:
+            return await IdempotencyKeyRepository(IdempotencyKeyModel, session).purge_expired()
+
+    async def run_forever(self, stop_event: Optional[asyncio.Event] = None) -> None:
+        stop_event = stop_event or asyncio.Event()
+        while not stop_event.is_set():
+            await self.purge()
+            try:
+                await asyncio.wait_for(stop_event.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
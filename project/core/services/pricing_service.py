@@ -0,0 +1,71 @@
+from dataclasses import dataclass
+from typing import Optional, Sequence
+
+from fastapi import status
+from fastapi.exceptions import HTTPException
+
+from project.core.app_discount.engine import DiscountEvaluation
+from project.core.app_pricing.prices import PricePair, RepresentativePriceCache, price_cache
+from project.core.auth.principals import Principal
+from project.core.repositories.discount import DiscountRepository
+from project.core.repositories.user import RepresentativeRepository
+from project.core.services.discount_service import DiscountService
+from project.db.models import UserCoreModel, DiscountModel
+
+
+@dataclass
+class Quote:
+    seller_user_id: int
+    volume: int
+    base_price: int
+    discount: DiscountEvaluation
+
+    @property
+    def discount_amount(self) -> int:
+        return self.discount.discount_amount
+
+    @property
+    def total_price(self) -> int:
+        return self.discount.total
+
+
+class PricingService:
+    """
+    قیمت‌گذاری خرید کانفیگ از روی جدول قیمت کش شده نماینده‌ها و قوانین کش شده تخفیف؛
+    در حالت پایدار هیچ کوئری‌ای اجرا نمی‌شود.
+    """
+
+    def __init__(
+        self,
+        representative_repo: RepresentativeRepository,
+        discount_service: Optional[DiscountService] = None,
+        cache: RepresentativePriceCache = price_cache,
+    ):
+        self.representative_repo = representative_repo
+        self.discount_service = discount_service or DiscountService(DiscountRepository(DiscountModel, representative_repo.session))
+        self.cache = cache
+
+    async def prices(self, user_id: int) -> PricePair:
+        prices = await self.cache.get(user_id, self.representative_repo.get_price_pair)
+        if prices is None:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Seller must be representative.")
+        return prices
+
+    async def unit_price(self, buyer_user_obj: UserCoreModel | Principal) -> int:
+        # نماینده با قیمت خرید خودش و کاربر عادی با قیمت فروش بالادستی خرید می‌کند
+        if buyer_user_obj.is_repres:
+            return (await self.prices(buyer_user_obj.id)).purchase
+        return (await self.prices(buyer_user_obj.upstream_id)).selling
+
+    async def quote(self, buyer_user_obj: UserCoreModel | Principal, volume: int, discount_codes: Sequence[str] = ()) -> Quote:
+        if buyer_user_obj.upstream_id is None:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="User has no upstream seller.")
+        base_price = await self.unit_price(buyer_user_obj)
+        # قیمت فاکتور کانفیگ همان قیمت پایه است و تخفیف روی آن محاسبه می‌شود
+        discount = await self.discount_service.evaluate(
+            buyer_user_obj.upstream_id, buyer_user_obj.id, discount_codes, base_price
+        )
+        return Quote(seller_user_id=buyer_user_obj.upstream_id, volume=volume, base_price=base_price, discount=discount)
+
+    async def warm(self) -> int:
+        return await self.cache.warm(self.representative_repo.all_price_pairs)
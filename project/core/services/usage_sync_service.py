@@ -0,0 +1,79 @@
+import asyncio
+from dataclasses import dataclass
+from typing import List, Optional
+
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from project.core.app_marzban.client import MarzbanClientPool, clients
+from project.core.app_marzban.panels import panel_from_model
+from project.core.config import settings
+from project.core.repositories.configuration import ConfigurationRepository, ConfigurationPanelRepository
+from project.db.database import async_session
+from project.db.models import ConfigurationsModel, ConfigurationPanelModel
+
+
+GB = 1024 ** 3
+
+
+@dataclass
+class UsageSyncResult:
+    panel_id: int
+    users: int = 0
+    updated: int = 0
+    consumed_volume_gb: int = 0
+    error: Optional[str] = None
+
+
+class UsageSyncService:
+    """
+    همگام‌سازی دوره‌ای مصرف کاربران پنل‌های مرزبان با جدول configurations.
+    کاربران هر پنل صفحه به صفحه خوانده می‌شوند و هر صفحه با یک UPDATE گروهی ذخیره می‌شود.
+    """
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker = async_session,
+        pool: MarzbanClientPool = clients,
+        page_size: Optional[int] = None,
+        interval: Optional[float] = None,
+    ):
+        self.session_factory = session_factory
+        self.pool = pool
+        self.page_size = page_size or settings.USAGE_SYNC_PAGE_SIZE
+        self.interval = interval or settings.USAGE_SYNC_INTERVAL
+
+    async def sync_panel(self, panel_obj: ConfigurationPanelModel) -> UsageSyncResult:
+        result = UsageSyncResult(panel_id=panel_obj.id)
+        client = self.pool.get(panel_from_model(panel_obj))
+        used_bytes = 0
+        try:
+            async for users in client.iter_users(page_size=self.page_size):
+                consumed = {user.username: user.used_traffic // GB for user in users}
+                used_bytes += sum(user.used_traffic for user in users)
+                async with self.session_factory() as session:
+                    result.updated += await ConfigurationRepository(ConfigurationsModel, session).bulk_update_consumed(panel_obj.id, consumed)
+                result.users += len(users)
+
+            # ترافیک واقعی جدا از حجم رزرو شده (used_volume) نگه‌داری می‌شود که زمان‌بند بر اساس آن ظرفیت می‌دهد
+            result.consumed_volume_gb = used_bytes // GB
+            async with self.session_factory() as session:
+                await ConfigurationPanelRepository(ConfigurationPanelModel, session).set_consumed_volume(
+                    panel_obj.id, result.consumed_volume_gb
+                )
+        except Exception as e:
+            result.error = str(e)
+        return result
+
+    async def sync_all(self) -> List[UsageSyncResult]:
+        async with self.session_factory() as session:
+            panels = await ConfigurationPanelRepository(ConfigurationPanelModel, session).all_active()
+        return await asyncio.gather(*(self.sync_panel(panel_obj) for panel_obj in panels))
+
+    async def run_forever(self, stop_event: Optional[asyncio.Event] = None) -> None:
+        stop_event = stop_event or asyncio.Event()
+        while not stop_event.is_set():
+            await self.sync_all()
+            try:
+                await asyncio.wait_for(stop_event.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
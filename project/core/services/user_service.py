@@ -1,14 +1,21 @@
 from datetime import datetime, timezone
-from typing import List
 
 from fastapi import status
 from fastapi.exceptions import HTTPException
 from sqlalchemy import select
 
-from project.core.repositories.user import UserCoreRepository
-from project.db.models import UserCoreModel
-from project.core.auth import hash_unique_id
-from project.core.auth.auth import hash_password
+from project.core.app_user.search import SearchHit
+from project.core.repositories.base import Page
+from project.core.repositories.loaders import UserBundle
+from project.core.repositories.user import UserCoreRepository, RepresentativeRepository
+from project.db.models import UserCoreModel, RepresentativeRollupModel, RepresentativesCoreModel
+from project.core.auth.auth import hash_password_async, hash_unique_id
+from project.core.auth.principals import Principal, principal_cache
+
+
+# خلاصه‌ای که کنار هر کاربر فهرست پایین‌دستی برگردانده می‌شود (یک کوئری به ازای هر رابطه)
+DOWNSTREAM_COUNTS = ("downstream", "buyer_configurations")
+DOWNSTREAM_LATEST = ("buyer_configuration_invoice",)
 
 
 class UserCoreService:
@@ -28,20 +35,17 @@ class UserCoreService:
         })
 
     async def update_fullname(self, upstream_user_obj: UserCoreModel, first_name: str, last_name: str) -> UserCoreModel:
-        upstream_user_obj.first_name = first_name
-        upstream_user_obj.last_name = last_name
-        await self.user_repo.session.commit()
-        await self.user_repo.session.refresh(upstream_user_obj)
-        return upstream_user_obj
+        # از مسیر مخزن تا سند جستجوی کاربر هم به‌روز شود
+        return await self.user_repo.update(upstream_user_obj, {"first_name": first_name, "last_name": last_name})
 
 
 class RepresentativesCoreService(UserCoreService):
     def __init__(self, user_repo: UserCoreRepository):
         super().__init__(user_repo)
 
-    async def get_downstream_user(self, upstream_user_obj: UserCoreModel, user_tel_chat_id: str) -> UserCoreModel:
-        unique_id = hash_unique_id(upstream_id=upstream_user_obj.tel_chat_id, user_id=user_tel_chat_id)
-        user_obj = await self.user_repo.get_user_by_unique_id(unique_id)
+    async def get_downstream_user(self, upstream_user_obj: UserCoreModel | Principal, user_tel_chat_id: str) -> UserCoreModel:
+        # unique_id از همین دو مقدار ساخته می‌شود؛ مستقیم با ایندکس (upstream_id, tel_chat_id) پیدا می‌شود
+        user_obj = await self.user_repo.resolve_downstream(upstream_user_obj.id, user_tel_chat_id)
         if not user_obj:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -49,9 +53,42 @@ class RepresentativesCoreService(UserCoreService):
             )
         return user_obj
 
-    async def all_downstream_users(self, upstream_user_obj: UserCoreModel, skip: int=0, limit: int=10) -> List[UserCoreModel]:
-        downstream_users = await self.user_repo.get_multi(filters={"upstream_id": upstream_user_obj.id}, skip=skip, limit=limit)
-        return downstream_users
+    async def create_downstream_user(
+        self, upstream_user_obj: UserCoreModel, tel_chat_id: str, first_name: str, last_name: str
+    ) -> UserCoreModel:
+        if await self.user_repo.resolve_downstream(upstream_user_obj.id, tel_chat_id):
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="User already exists"
+            )
+        return await self.register(upstream_user_obj, tel_chat_id, None, first_name, last_name)
+
+    async def complete_repres_user(
+        self, upstream_user_obj: UserCoreModel | Principal, user_tel_chat_id: str, phone_number: str, first_name: str, last_name: str
+    ) -> tuple[UserCoreModel, RepresentativesCoreModel]:
+        """تکمیل مشخصات نماینده پایین‌دستی (نام و شماره تلفن)"""
+        user_obj = await self.get_downstream_user(upstream_user_obj, user_tel_chat_id)
+        representative = await user_obj.awaitable_attrs.representative_core
+        if not user_obj.is_repres or representative is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Representative not found"
+            )
+        user_obj = await self.user_repo.update(user_obj, {"first_name": first_name, "last_name": last_name})
+        representative = await RepresentativeRepository(RepresentativesCoreModel, self.user_repo.session).update(
+            representative, {"phone_number": phone_number}
+        )
+        return user_obj, representative
+
+    async def all_downstream_users(self, upstream_user_obj: UserCoreModel, cursor: str|None=None, limit: int=10) -> Page[UserBundle]:
+        downstream_users = await self.user_repo.get_page(filters={"upstream_id": upstream_user_obj.id}, cursor=cursor, limit=limit)
+        return await self.user_repo.bundle_page(downstream_users, counts=DOWNSTREAM_COUNTS, latest=DOWNSTREAM_LATEST)
+
+    async def search_downstream_users(
+        self, upstream_user_obj: UserCoreModel, query: str, cursor: str | None = None, limit: int = 20
+    ) -> Page[SearchHit]:
+        # فقط در شبکه زیرمجموعه خود نماینده جستجو می‌شود
+        return await self.user_repo.search(query, scope_user_id=upstream_user_obj.id, cursor=cursor, limit=limit)
 
     async def set_repres(self, upstream_user_obj: UserCoreModel, user_tel_chat_id: str):
         user_obj = await self.get_downstream_user(upstream_user_obj, user_tel_chat_id)
@@ -59,9 +96,12 @@ class RepresentativesCoreService(UserCoreService):
         return user_obj
 
     async def update_password(self, upstream_user_obj: UserCoreModel, new_password: str) -> UserCoreModel:
-        upstream_user_obj.representative_core.password = hash_password(new_password)
-        upstream_user_obj.representative_core.password_changed_at = datetime.now(timezone.utc)
+        representative_core = await upstream_user_obj.awaitable_attrs.representative_core
+        representative_core.password = await hash_password_async(new_password)
+        representative_core.password_changed_at = datetime.now(timezone.utc)
         await self.user_repo.session.commit()
+        # توکن‌های قبلی از همین درخواست بعدی رد می‌شوند
+        principal_cache.invalidate(upstream_user_obj.id)
         return upstream_user_obj
 
 
@@ -78,10 +118,37 @@ class AdminCoreService(RepresentativesCoreService):
             )
         return user_obj
 
-    async def all_downstream_users_repres(self, upstream_user_obj: UserCoreModel, unique_id: str, skip: int=0, limit: int=10) -> List[UserCoreModel]:
-        repres_user_obj = self.get_user(upstream_user_obj, unique_id)
-        downstream_users = await self.user_repo.get_multi(filters={"upstream_id": repres_user_obj.id}, skip=skip, limit=limit)
-        return downstream_users
+    async def search_users(
+        self, upstream_user_obj: UserCoreModel, query: str, cursor: str | None = None, limit: int = 20
+    ) -> Page[SearchHit]:
+        return await self.user_repo.search(query, cursor=cursor, limit=limit)
+
+    async def all_downstream_users_repres(
+            self, 
+            upstream_user_obj: UserCoreModel, 
+            unique_id: str, 
+            cursor: str|None=None, 
+            limit: int=10, 
+            max_depth: int|None=1
+        ) -> Page[UserBundle]:
+        # max_depth=None کل شبکه زیرمجموعه نماینده را برمی‌گرداند
+        repres_user_obj = await self.get_user(upstream_user_obj, unique_id)
+        downstream_users = await self.user_repo.descendants(repres_user_obj.id, max_depth=max_depth, cursor=cursor, limit=limit)
+        return await self.user_repo.bundle_page(downstream_users, counts=DOWNSTREAM_COUNTS, latest=DOWNSTREAM_LATEST)
+
+    async def network_rollup(self, upstream_user_obj: UserCoreModel, unique_id: str) -> RepresentativeRollupModel | None:
+        # آمار کل شبکه نماینده (شامل زیرنماینده‌ها) از جدول تجمیعی خوانده می‌شود
+        repres_user_obj = await self.get_user(upstream_user_obj, unique_id)
+        return await self.user_repo.rollup_repo.get_rollup(repres_user_obj.id)
+
+    async def upstream_chain(self, upstream_user_obj: UserCoreModel, unique_id: str) -> list[UserCoreModel]:
+        user_obj = await self.get_user(upstream_user_obj, unique_id)
+        return await self.user_repo.ancestors(user_obj.id)
+
+    async def move_downstream_user(self, upstream_user_obj: UserCoreModel, unique_id: str, new_upstream_unique_id: str) -> UserCoreModel:
+        user_obj = await self.get_user(upstream_user_obj, unique_id)
+        new_upstream_obj = await self.get_user(upstream_user_obj, new_upstream_unique_id)
+        return await self.user_repo.reparent(user_obj, new_upstream_obj.id)
 
     async def deactive_downstream_user(self, upstream_user_obj: UserCoreModel, unique_id: str) -> UserCoreModel:
         user_obj = await self.user_repo.get_user_by_unique_id(unique_id)
@@ -92,6 +159,7 @@ class AdminCoreService(RepresentativesCoreService):
             )
         user_obj.is_active = False
         await self.user_repo.session.commit()
+        principal_cache.invalidate(user_obj.id)
         await self.user_repo.session.refresh(user_obj)
         return user_obj
 
@@ -102,8 +170,7 @@ class AdminCoreService(RepresentativesCoreService):
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="User not found or access denied"
             )
-        await self.user_repo.session.delete(user_obj)
-        await self.user_repo.session.commit()
+        await self.user_repo.delete(user_obj)
         return True
 
 
@@ -1,50 +1,122 @@
+from typing import Dict, List, Optional
+
 from fastapi import status
 from fastapi.exceptions import HTTPException
 
+from project.core.auth.principals import Principal
+from project.core.repositories.idempotency import IdempotencyKeyRepository
 from project.core.repositories.wallet import WalletInvoiceRepository
-from project.db.models import UserCoreModel, WalletRechargeInvoiceModel, WalletInvoiceStatusChoices
+from project.core.services.idempotency_service import IdempotencyService
+from project.db.models import UserCoreModel, WalletRechargeInvoiceModel, WalletInvoiceStatusChoices, IdempotencyKeyModel
 
 
 class WalletInvoiceService:
-    def __init__(self, wi_repo: WalletInvoiceRepository):
+    def __init__(self, wi_repo: WalletInvoiceRepository, idempotency: Optional[IdempotencyService] = None):
         self.wi_repo = wi_repo
+        self.idempotency = idempotency or IdempotencyService(IdempotencyKeyRepository(IdempotencyKeyModel, wi_repo.session))
 
     async def create_wallet_invoice(
         self,
-        upstream_user_obj: UserCoreModel,
-        downstream_user_obj: UserCoreModel,
+        downstream_user_obj: UserCoreModel | Principal,
         charge_amount: int,
         get_config: bool,
         descriptions: str,
+        idempotency_key: Optional[str] = None,
     ) -> WalletRechargeInvoiceModel:
-        return await self.wi_repo.create({ 
-            "buyer_user":downstream_user_obj,
-            "seller_user":upstream_user_obj,
-            "charge_amount":charge_amount,
-            "get_config":get_config,
-            "descriptions":descriptions,
-        })
-
-    async def accept_wallet_invoice(self, wallet_invoice_id: int, upstream_user_obj: UserCoreModel, accepted: bool=True):
+        # فروشنده همان بالادستی کاربر است؛ فقط شناسه‌ها لازم‌اند و مدل کاربر خوانده نمی‌شود
+        if downstream_user_obj.upstream_id is None:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="User has no upstream to charge the wallet from.")
+        return await self.idempotency.run(
+            user_id=downstream_user_obj.id,
+            scope="create_wallet_invoice",
+            key=idempotency_key,
+            action=lambda: self.wi_repo.create({ 
+                "buyer_user_id":downstream_user_obj.id,
+                "seller_user_id":downstream_user_obj.upstream_id,
+                "charge_amount":charge_amount,
+                "get_config":get_config,
+                "descriptions":descriptions,
+            }),
+            load=self.wi_repo.get_by_id,
+            model=WalletRechargeInvoiceModel,
+        )
+
+    async def accept_wallet_invoice(
+            self,
+            wallet_invoice_id: int,
+            upstream_user_obj: UserCoreModel | Principal,
+            accepted: bool=True,
+            idempotency_key: Optional[str] = None
+        ) -> WalletRechargeInvoiceModel:
+        return await self.idempotency.run(
+            user_id=upstream_user_obj.id,
+            scope=f"accept_wallet_invoice:{wallet_invoice_id}",
+            key=idempotency_key,
+            action=lambda: self._accept_wallet_invoice(wallet_invoice_id, upstream_user_obj, accepted),
+            load=self.wi_repo.get_by_id,
+            model=WalletRechargeInvoiceModel,
+            resource_id=wallet_invoice_id,
+        )
+
+    async def _accept_wallet_invoice(self, wallet_invoice_id: int, upstream_user_obj: UserCoreModel | Principal, accepted: bool):
         wallet_invoice_obj = await self.wi_repo.get_upstream_user_wallet_invoice_by_id(wi_id=wallet_invoice_id, upstream_user_obj=upstream_user_obj)
         if not wallet_invoice_obj:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="wallet invoice not found among your sub-users' receipts")
-        wallet_charge_amount_invoice = wallet_invoice_obj.charge_amount
-        if not await self.wi_repo.wallet_balance_sufficient(upstream_user_obj, wallet_charge_amount_invoice):
-            raise HTTPException(status_code=status.HTTP_406_NOT_ACCEPTABLE, detail="You do not have permission to approve this receipt due to insufficient funds in your wallet.")
         if accepted:
-            invoice_status = WalletInvoiceStatusChoices.CONFIRMED
+            # کافی بودن موجودی فروشنده داخل همان UPDATE شرطی کسر از کیف پول بررسی می‌شود
             if wallet_invoice_obj.get_config:
                 wallet_invoice_obj = await self.wi_repo.get_direct_config(wallet_invoice=wallet_invoice_obj)
             else:
-                wallet_invoice_obj = self.wi_repo.adding_charge_to_wallet(wi_obj=wallet_invoice_obj)
+                wallet_invoice_obj = await self.wi_repo.adding_charge_to_wallet(wi_obj=wallet_invoice_obj)
         else:
-            invoice_status = WalletInvoiceStatusChoices.REJECTED.value
-            wallet_invoice_obj.status = invoice_status
-            await self.wi_repo.session.add(wallet_invoice_obj)
+            if not await self.wi_repo.claim_invoice(wallet_invoice_obj.id, WalletInvoiceStatusChoices.REJECTED):
+                raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="wallet invoice is not waiting for approval")
             await self.wi_repo.session.commit()
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST, 
                 detail="There is a problem with the data sent and the receipt status has changed to rejected."
                 )
-        return wallet_invoice_obj
\ No newline at end of file
+        return wallet_invoice_obj
+
+    async def accept_wallet_invoices(
+            self,
+            wallet_invoice_ids: List[int],
+            upstream_user_obj: UserCoreModel | Principal,
+            accepted: bool = True
+        ) -> List[Dict]:
+        """
+        تایید یا رد گروهی فاکتورهای کیف پول؛ نتیجه هر فاکتور جداگانه برگردانده می‌شود.
+        همه فاکتورها با یک کوئری خوانده و تغییرات در یک تراکنش اعمال می‌شوند.
+        """
+        wallet_invoice_ids = list(dict.fromkeys(wallet_invoice_ids))
+        wallet_invoices = await self.wi_repo.get_upstream_user_wallet_invoices_by_ids(
+            wi_ids=wallet_invoice_ids, upstream_user_obj=upstream_user_obj
+        )
+        wallet_invoices_by_id = {wi.id: wi for wi in wallet_invoices}
+        results = {}
+        pending = []
+        for wi_id in wallet_invoice_ids:
+            wallet_invoice_obj = wallet_invoices_by_id.get(wi_id)
+            if wallet_invoice_obj is None:
+                results[wi_id] = (status.HTTP_404_NOT_FOUND, "wallet invoice not found among your sub-users' receipts")
+            elif wallet_invoice_obj.status != WalletInvoiceStatusChoices.WAITING:
+                results[wi_id] = (status.HTTP_409_CONFLICT, "wallet invoice is not waiting for approval")
+            else:
+                pending.append(wallet_invoice_obj)
+
+        if accepted:
+            claimed = await self.wi_repo.accept_invoices(wi_objs=pending, seller_user_obj=upstream_user_obj)
+        else:
+            claimed = await self.wi_repo.reject_invoices([wi.id for wi in pending])
+
+        for wallet_invoice_obj in pending:
+            if wallet_invoice_obj.id in claimed:
+                results[wallet_invoice_obj.id] = (status.HTTP_200_OK, None)
+            else:
+                # بین خواندن و ثبت، درخواست دیگری وضعیت فاکتور را تغییر داده است
+                results[wallet_invoice_obj.id] = (status.HTTP_409_CONFLICT, "wallet invoice is not waiting for approval")
+
+        return [
+            {"invoice_id": wi_id, "status_code": results[wi_id][0], "detail": results[wi_id][1]}
+            for wi_id in wallet_invoice_ids
+        ]
@@ -1,5 +1,7 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from typing import AsyncIterator
+
+from sqlalchemy.engine import make_url, URL
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 
 from project.core.config import settings
 
@@ -7,18 +9,46 @@ from .models import Base
 
 
 
-engine = create_engine("sqlite:///./dev.db", connect_args={"check_same_thread": False})
-session = sessionmaker(bind=engine, autocommit=False, autoflush=False)
+# درایورهای async متناظر با هر دیتابیس
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
 
-def create_db_and_tables():
-    Base.metadata.create_all(engine)
 
-def get_session():
-    db = session()
-    try:
-        yield db
-    finally:
-        db.close()
+def async_database_url(url: str | None) -> URL:
+    url = make_url(url or "sqlite:///./dev.db")
+    driver = ASYNC_DRIVERS.get(url.get_backend_name())
+    if driver and url.drivername != driver:
+        url = url.set(drivername=driver)
+    return url
+
+
+def _engine_options(url: URL) -> dict:
+    options = {"echo": settings.DB_ECHO}
+    if url.get_backend_name() == "sqlite":
+        # sqlite استخر اتصال شبکه‌ای ندارد
+        return options
+    options.update(
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+    )
+    return options
 
 
+database_url = async_database_url(settings.DATABASE_URL)
+engine = create_async_engine(database_url, **_engine_options(database_url))
+async_session = async_sessionmaker(bind=engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+async def create_db_and_tables():
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+async def get_session() -> AsyncIterator[AsyncSession]:
+    async with async_session() as db:
+        yield db
+
 
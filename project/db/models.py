@@ -1,12 +1,13 @@
 import enum
 
-from sqlalchemy import Column, Integer, BigInteger, SmallInteger, String, Boolean, DateTime, Enum, ForeignKey, text, CheckConstraint
+from sqlalchemy import Column, Integer, BigInteger, SmallInteger, String, Text, Boolean, DateTime, Enum, ForeignKey, text, CheckConstraint, Index, DDL, event
+from sqlalchemy.ext.asyncio import AsyncAttrs
 from sqlalchemy.orm import relationship, DeclarativeBase
 from sqlalchemy.sql import func
 
 
 
-class Base(DeclarativeBase):pass
+class Base(AsyncAttrs, DeclarativeBase):pass
 
 class BaseModel(Base):
     __abstract__ = True
@@ -16,12 +17,12 @@ class BaseModel(Base):
 
 class UserCoreModel(BaseModel):
     __tablename__ = 'user_core'
-    upstream_id = Column(Integer, ForeignKey("user_core.id")) # بالادستی
+    upstream_id = Column(Integer, ForeignKey("user_core.id"), index=True) # بالادستی
     first_name = Column(String(32), nullable=True) # نام
     last_name = Column(String(32), nullable=True) # نام خانوادگی
     created_at = Column(DateTime(timezone=True), server_default=func.now()) # زمان ثبت نام
     tel_user_id = Column(String(128), nullable=True) # شناسه کاربری تلگرام
-    tel_chat_id = Column(String(128)) # شناسه چت تلگرام
+    tel_chat_id = Column(String(128), index=True) # شناسه چت تلگرام
     unique_id = Column(String(128), unique=True, index=True) #شناسه یکتا
     is_active = Column(Boolean, default=True) # حساب کاربر فعال است
     is_admin = Column(Boolean, default=False) # حساب کاربر ادمین است
@@ -29,6 +30,8 @@ class UserCoreModel(BaseModel):
     wallet_balance =Column(BigInteger, default=0, nullable=False) # موجودی کیف پول
     __table_args__ = (
         CheckConstraint('wallet_balance >= 0', name='ck_user_wallet_non_negative'),
+        # پیدا کردن کاربر پایین‌دستی هر بات از روی شناسه چت
+        Index('ix_user_upstream_chat', 'upstream_id', 'tel_chat_id', unique=True),
     )
     # -------------------------------------------------------------
     representative_core = relationship( # هسته نماینده
@@ -44,66 +47,75 @@ class UserCoreModel(BaseModel):
         uselist=True,
         cascade="all, delete-orphan", 
         single_parent=True,
-        lazy="dynamic"
+        lazy="write_only",
+        passive_deletes=True
     )
     upstream = relationship( # بالادستی کاربر
         "UserCoreModel", 
-        remote_side=[BaseModel.id], 
+        remote_side="UserCoreModel.id", 
         back_populates="downstream",
-        lazy="dynamic"
     )
     downstream = relationship( # پایین‌دستی کاربر
         "UserCoreModel", 
         back_populates="upstream",
-        lazy="dynamic"
+        lazy="write_only",
+        passive_deletes=True
     )
     buyer_wallet_invoice = relationship( # فاکتور های  افزایش شارژ کیف پول کاربر
         "WalletRechargeInvoiceModel", 
         foreign_keys="WalletRechargeInvoiceModel.buyer_user_id", 
         back_populates="buyer_user",
-        lazy="dynamic"
+        lazy="write_only",
+        passive_deletes=True
     )
     seller_wallet_invoice = relationship( # فاکتور های کاهش شارژ کیف پول کاربر کاربر
         "WalletRechargeInvoiceModel", 
         foreign_keys="WalletRechargeInvoiceModel.seller_user_id", 
         back_populates="seller_user",
-        lazy="dynamic"
+        lazy="write_only",
+        passive_deletes=True
     )
     buyer_configuration_invoice = relationship( # فاکتور های خرید کانفیگ کاربر
         "ConfigurationInvoiceModel", 
         foreign_keys="ConfigurationInvoiceModel.buyer_user_id", 
         back_populates="buyer_user",
-        lazy="dynamic"
+        lazy="write_only",
+        passive_deletes=True
     )
     seller_configuration_invoice = relationship( # فاکتور های فروش کانفیگ کاربر
         "ConfigurationInvoiceModel", 
         foreign_keys="ConfigurationInvoiceModel.seller_user_id", 
         back_populates="seller_user",
-        lazy="dynamic"
+        lazy="write_only",
+        passive_deletes=True
     )
     seller_discounts = relationship( # تخفیف های فروش کاربر
         "DiscountModel", 
         foreign_keys="DiscountModel.seller_user_id", 
         back_populates="seller_user",
-        lazy="dynamic"
+        lazy="write_only",
+        passive_deletes=True
     )
     user_discounts = relationship( # تخفیف های خرید کاربر
         "UsersDiscountModel", 
         foreign_keys="UsersDiscountModel.user_id", 
         back_populates="user",
-        lazy="dynamic"
+        lazy="write_only",
+        passive_deletes=True
     )
     buyer_configurations = relationship( # کانفیگ‌های خریداری شده کاربر
         "ConfigurationsModel", 
         foreign_keys="ConfigurationsModel.buyer_user_id", 
         back_populates="buyer_user",
-        lazy="dynamic"
+        lazy="write_only",
+        passive_deletes=True
     )
     seller_configurations = relationship( # کانفیگ‌های فروخته شده کاربر
         "ConfigurationsModel", 
         foreign_keys="ConfigurationsModel.seller_user_id", 
         back_populates="seller_user",
-        lazy="dynamic"
+        lazy="write_only",
+        passive_deletes=True
     )
 
 # ==========================================================================================
@@ -124,13 +136,79 @@ class ConfigurationPanelModel(BaseModel):
     username = Column(String) # نام کاربری
     password = Column(String) # رمز عبور
     max_volume = Column(Integer) #حداکثر حجم
-    used_volume = Column(Integer) #حجم استفاده شده
+    used_volume = Column(Integer) #حجم استفاده شده (مجموع حجم رزرو شده برای کانفیگ‌ها)
+    consumed_volume = Column(BigInteger, default=0) # ترافیک مصرف شده واقعی (گیگابایت) طبق آخرین همگام‌سازی
     is_active = Column(Boolean, default=True) #فعال
     # -------------------------------------------------------------
     user = relationship("UserCoreModel", back_populates="configuration_panel")
 
 # ==========================================================================================
 
+class UserHierarchyModel(BaseModel):
+    """
+    جدول closure درخت بالادستی/پایین‌دستی کاربران؛ برای هر جفت (جد، نواده) یک ردیف با فاصله آن‌ها.
+    هر کاربر یک ردیف با خودش و depth صفر دارد.
+    """
+    __tablename__ = 'user_hierarchy'
+    ancestor_id = Column(Integer, ForeignKey('user_core.id', ondelete="CASCADE"), nullable=False) # شناسه جد
+    descendant_id = Column(Integer, ForeignKey('user_core.id', ondelete="CASCADE"), nullable=False) # شناسه نواده
+    depth = Column(Integer, nullable=False) # فاصله نواده تا جد
+    __table_args__ = (
+        Index('ix_user_hierarchy_ancestor_depth', 'ancestor_id', 'depth', 'descendant_id', unique=True),
+        Index('ix_user_hierarchy_descendant_depth', 'descendant_id', 'depth'),
+        CheckConstraint('depth >= 0', name='ck_user_hierarchy_depth_non_negative'),
+    )
+
+# ==========================================================================================
+
+class UserSearchModel(BaseModel):
+    """
+    سند جستجوی هر کاربر (نام، تلفن و شناسه‌های تلگرام به شکل یکسان شده) که مخزن کاربر به‌روز نگه می‌دارد.
+    روی PostgreSQL ایندکس GIN سه‌حرفی (pg_trgm) دارد و روی SQLite جدول FTS5 هم‌نام user_search_fts کنار آن است.
+    """
+    __tablename__ = 'user_search'
+    user_id = Column(Integer, ForeignKey('user_core.id', ondelete="CASCADE"), nullable=False, unique=True) # شناسه کاربر
+    document = Column(Text, nullable=False, default="") # متن قابل جستجو
+    __table_args__ = (
+        Index(
+            'ix_user_search_document_trgm', 'document',
+            postgresql_using='gin',
+            postgresql_ops={'document': 'gin_trgm_ops'},
+        ).ddl_if(dialect='postgresql'),
+    )
+
+USER_SEARCH_FTS = 'user_search_fts'
+
+event.listen(
+    UserSearchModel.__table__, "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"),
+)
+event.listen(
+    UserSearchModel.__table__, "after_create",
+    DDL(f"CREATE VIRTUAL TABLE IF NOT EXISTS {USER_SEARCH_FTS} USING fts5(document, tokenize='trigram')").execute_if(dialect="sqlite"),
+)
+event.listen(
+    UserSearchModel.__table__, "after_drop",
+    DDL(f"DROP TABLE IF EXISTS {USER_SEARCH_FTS}").execute_if(dialect="sqlite"),
+)
+
+# ==========================================================================================
+
+class RepresentativeRollupModel(BaseModel):
+    """
+    آمار تجمیعی شبکه هر نماینده (خودش و همه زیرمجموعه‌ها) که با هر فاکتور به‌صورت افزایشی به‌روز می‌شود.
+    """
+    __tablename__ = 'representative_rollups'
+    user_id = Column(Integer, ForeignKey('user_core.id', ondelete="CASCADE"), nullable=False, unique=True) # شناسه نماینده
+    network_size = Column(BigInteger, default=0, nullable=False) # تعداد کل زیرمجموعه‌ها
+    configs_sold = Column(BigInteger, default=0, nullable=False) # تعداد فاکتورهای کانفیگ فروخته شده
+    sales_volume = Column(BigInteger, default=0, nullable=False) # حجم کل فروخته شده
+    revenue = Column(BigInteger, default=0, nullable=False) # مبلغ کل فروش کانفیگ
+    wallet_recharge_total = Column(BigInteger, default=0, nullable=False) # مبلغ کل شارژهای تایید شده کیف پول
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now()) # زمان آخرین به‌روزرسانی
+
+# ==========================================================================================
+
 class RepresentativesCoreModel(BaseModel):
     __tablename__ = 'representatives_core'
     user_core = Column( # هسته کاربر
@@ -183,12 +261,17 @@ class WalletRechargeInvoiceModel(BaseModel):
     get_config = Column(Boolean, default=False) # دریافت کانفیگ
     created_at = Column(DateTime(timezone=True), server_default=func.now()) # تاریخ ایجاد
     status = Column(
-        Enum(WalletInvoiceStatusChoices), 
+        Enum(WalletInvoiceStatusChoices, values_callable=lambda choices: [c.value for c in choices]), 
         nullable=False, 
-        default=WalletInvoiceStatusChoices.WAITING.value,
+        default=WalletInvoiceStatusChoices.WAITING,
         server_default=text("'waiting'")
     ) # وضعیت
     descriptions = Column(String) # توضیحات
+    __table_args__ = (
+        # برای صفحه‌بندی keyset فاکتورها
+        Index('ix_wallet_invoice_seller_created', 'seller_user_id', 'created_at', 'id'),
+        Index('ix_wallet_invoice_buyer_seller', 'buyer_user_id', 'seller_user_id', 'id'),
+    )
     # --------------------------------------------------------------------
     buyer_user = relationship( # کاربر خریدار
         "UserCoreModel",
@@ -239,10 +322,14 @@ class DiscountModel(BaseModel):
     number_uses_per_user = Column(Integer) # محدودیت استفاده برای هر کاربر
     refund = Column(Boolean, default=False) # بازگشت وجه
     synchronicity = Column(Boolean, default=False) # همزمانی
+    used_count = Column(Integer, default=0, nullable=False, server_default=text("0")) # تعداد استفاده کل
     __table_args__ = (
         CheckConstraint('percent >= 0 AND percent <= 100', name='ck_discount_percent_range'),
         CheckConstraint('usage_ceiling >= 0', name='ck_discount_usage_ceiling'),
+        CheckConstraint('used_count >= 0', name='ck_discount_used_count_non_negative'),
         CheckConstraint('maximum_discount_amount <= minimum_purchase_amount', name='ck_discount_max_le_min'),
+        # جستجوی کد تخفیف هر فروشنده
+        Index('ix_discount_seller_code', 'seller_user_id', 'code', unique=True),
     )
     # -------------------------------------------------------------------------
     seller_user = relationship( # کاربر فروشنده
@@ -267,20 +354,21 @@ class UsersDiscountModel(BaseModel):
     __tablename__ = 'user_discount'
     user_id = Column(Integer, ForeignKey('user_core.id')) # شناسه کاربر
     discount_id = Column(Integer, ForeignKey('discount.id')) # شناسه تخفیف
-    count_uses = Column(Integer) # تعداد استفاده
+    count_uses = Column(Integer, default=0, nullable=False, server_default=text("0")) # تعداد استفاده
     user_type = Column(Enum(UserDiscountType_choices), nullable=False) # نوع کاربر
+    __table_args__ = (
+        Index('ix_user_discount_user_discount_type', 'user_id', 'discount_id', 'user_type', unique=True),
+    )
     # --------------------------------------------------------------------------
     user = relationship( # کاربر
         "UserCoreModel",
         foreign_keys=[user_id],
         back_populates="user_discounts",
-        cascade="all, delete-orphan"
     )
     discount = relationship( # تخفیف
         "DiscountModel",
         foreign_keys=[discount_id],
         back_populates="user_discounts",
-        cascade="all, delete-orphan"
     )
 
 # ==========================================================================================
@@ -289,7 +377,12 @@ class ConfigurationsModel(BaseModel):
     __tablename__ = 'configurations'
     buyer_user_id = Column(Integer, ForeignKey('user_core.id'), nullable=False) # شناسه کاربر خریدار
     seller_user_id = Column(Integer, ForeignKey('user_core.id'), nullable=False) # شناسه کاربر فروشنده
-    name = Column(String(128)) #نام
+    panel_id = Column( # پنلی که کانفیگ روی آن ساخته شده
+        Integer,
+        ForeignKey('configuration_panel_core.id', ondelete="SET NULL"),
+        nullable=True,
+    )
+    name = Column(String(128), index=True) #نام (نام کاربری در پنل)
     total_volume_gb = Column(BigInteger) # حجم کل خریداری شده
     volume_ceiling_gb = Column(BigInteger) # سقف حجم قابل مصرف
     consumed_volume_gb = Column(BigInteger) # حجم مصرف شده
@@ -297,6 +390,8 @@ class ConfigurationsModel(BaseModel):
     __table_args__ = (
         CheckConstraint('consumed_volume_gb <= volume_ceiling_gb', name='ck_conf_consumed_le_ceiling'),
         CheckConstraint('volume_ceiling_gb <= total_volume_gb', name='ck_conf_ceiling_le_total'),
+        # نام کاربری فقط در هر پنل یکتاست
+        Index('ix_conf_panel_name', 'panel_id', 'name', unique=True),
     )
     # --------------------------------------------------------------------
     buyer_user = relationship( # کاربر خریدار
@@ -310,4 +405,68 @@ class ConfigurationsModel(BaseModel):
         back_populates="seller_configurations"
     )
 
+# ==========================================================================================
+
+class WalletLedgerEntryTypeChoices(enum.Enum):
+    OPENING = "opening" # موجودی اولیه
+    CREDIT = "credit" # واریز
+    DEBIT = "debit" # برداشت
+
+class WalletLedgerEntryModel(BaseModel):
+    """دفتر کل کیف پول؛ فقط درج می‌شود و هیچ ردیفی ویرایش یا حذف نمی‌شود"""
+    __tablename__ = 'wallet_ledger_entries'
+    user_id = Column(Integer, ForeignKey('user_core.id', ondelete="CASCADE"), nullable=False) # شناسه کاربر
+    seq = Column(Integer, nullable=False) # شماره ترتیب ردیف برای هر کاربر
+    entry_type = Column(
+        Enum(WalletLedgerEntryTypeChoices, values_callable=lambda choices: [c.value for c in choices]),
+        nullable=False
+    ) # نوع ردیف
+    amount = Column(BigInteger, nullable=False) # مبلغ (مثبت واریز، منفی برداشت)
+    balance_after = Column(BigInteger, nullable=False) # موجودی بعد از این ردیف
+    reference_type = Column(String(32), nullable=True) # نوع سند مرتبط
+    reference_id = Column(Integer, nullable=True) # شناسه سند مرتبط
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False) # تاریخ ایجاد
+    __table_args__ = (
+        Index('ix_wallet_ledger_user_seq', 'user_id', 'seq', unique=True),
+        Index('ix_wallet_ledger_user_created', 'user_id', 'created_at'),
+    )
+
+# ==========================================================================================
+
+class WalletBalanceSnapshotModel(BaseModel):
+    __tablename__ = 'wallet_balance_snapshots'
+    user_id = Column(Integer, ForeignKey('user_core.id', ondelete="CASCADE"), nullable=False) # شناسه کاربر
+    ledger_entry_id = Column(Integer, ForeignKey('wallet_ledger_entries.id', ondelete="CASCADE"), nullable=False) # آخرین ردیف دفتر در این تصویر
+    seq = Column(Integer, nullable=False) # شماره ترتیب همان ردیف
+    balance = Column(BigInteger, nullable=False) # موجودی
+    created_at = Column(DateTime(timezone=True), nullable=False) # زمان ردیف دفتر
+    __table_args__ = (
+        Index('ix_wallet_snapshot_user_created', 'user_id', 'created_at'),
+    )
+
+# ==========================================================================================
+
+class IdempotencyStatusChoices(enum.Enum):
+    IN_PROGRESS = "in_progress" # در حال انجام
+    COMPLETED = "completed" # انجام شده
 
+class IdempotencyKeyModel(BaseModel):
+    """کلید تکرارناپذیری درخواست‌ها؛ درخواست تکراری با همان کلید نتیجه ذخیره شده را می‌گیرد"""
+    __tablename__ = 'idempotency_keys'
+    user_id = Column(Integer, ForeignKey('user_core.id', ondelete="CASCADE"), nullable=False) # شناسه کاربر
+    scope = Column(String(64), nullable=False) # نوع عملیات
+    key = Column(String(128), nullable=False) # کلید ارسالی کلاینت
+    status = Column(
+        Enum(IdempotencyStatusChoices, values_callable=lambda choices: [c.value for c in choices]),
+        nullable=False,
+        default=IdempotencyStatusChoices.IN_PROGRESS
+    ) # وضعیت
+    resource_type = Column(String(64), nullable=True) # نوع سند ساخته شده
+    resource_id = Column(Integer, nullable=True) # شناسه سند ساخته شده
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False) # تاریخ ایجاد
+    expires_at = Column(DateTime(timezone=True), nullable=False) # تاریخ انقضا
+    __table_args__ = (
+        Index('ix_idempotency_user_scope_key', 'user_id', 'scope', 'key', unique=True),
+        # برای پاک‌سازی کلیدهای منقضی شده
+        Index('ix_idempotency_expires_at', 'expires_at'),
+    )
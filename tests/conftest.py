@@ -0,0 +1,178 @@
+import asyncio
+import itertools
+import json
+import os
+import tempfile
+import time
+
+import httpx
+import pytest
+from jose import jwt
+
+# تنظیمات قبل از import پروژه خوانده می‌شوند؛ هر اجرای تست دیتابیس sqlite جداگانه دارد
+_db_dir = tempfile.mkdtemp(prefix="representative_panel_tests_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'test.db')}"
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+
+from project.core.app_marzban.client import MarzbanClient, MarzbanClientPool  # noqa: E402
+from project.core.app_marzban.health import PanelHealthRegistry  # noqa: E402
+from project.core.app_marzban.metadata import PanelMetadataCache  # noqa: E402
+from project.core.app_marzban.token import PanelTokenManager  # noqa: E402
+from project.core.app_pricing.prices import price_cache  # noqa: E402
+from project.core.app_user.resolver import downstream_users  # noqa: E402
+from project.core.auth.principals import principal_cache  # noqa: E402
+from project.core.repositories.user import UserCoreRepository  # noqa: E402
+from project.core.repositories.wallet import WalletBalanceRepository  # noqa: E402
+from project.db.database import async_session, engine  # noqa: E402
+from project.db.models import Base, UserCoreModel  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def loop():
+    # یک event loop برای کل تست‌ها؛ اتصال‌های aiosqlite و قفل‌های کش‌ها به loop وابسته‌اند
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.run_until_complete(engine.dispose())
+    loop.close()
+
+
+@pytest.fixture
+def run(loop):
+    """اجرای یک coroutine روی loop مشترک؛ pytest-asyncio لازم نیست"""
+    return loop.run_until_complete
+
+
+@pytest.fixture(autouse=True)
+def fresh_db(loop):
+    async def reset():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+            await conn.run_sync(Base.metadata.create_all)
+
+    loop.run_until_complete(reset())
+    # شناسه‌ها در دیتابیس جدید تکرار می‌شوند؛ کش‌های سراسری نباید ردیف‌های تست قبلی را برگردانند
+    price_cache.invalidate()
+    principal_cache.invalidate()
+    downstream_users.clear()
+
+
+@pytest.fixture
+def session_factory():
+    return async_session
+
+
+@pytest.fixture
+def make_user():
+    """ساخت کاربر از مسیر repository تا ردیف‌های closure، آمار و جستجو هم ساخته شوند"""
+    serial = itertools.count(1)
+
+    async def make(session, upstream: UserCoreModel | None = None, balance: int = 0, **data) -> UserCoreModel:
+        n = next(serial)
+        data.setdefault("tel_chat_id", f"chat-{n}")
+        data.setdefault("unique_id", f"unique-{n}")
+        user = await UserCoreRepository(UserCoreModel, session).create(
+            {"upstream_id": upstream.id if upstream else None, **data}
+        )
+        if balance:
+            await WalletBalanceRepository(UserCoreModel, session).credit(user.id, balance)
+            await session.commit()
+        return user
+
+    return make
+
+
+class FakeMarzban:
+    """
+    پنل مرزبان جعلی روی httpx.MockTransport؛ کاربران در حافظه نگه‌داری می‌شوند.
+    expire_token() توکن فعلی را سمت پنل باطل می‌کند تا مسیر 401 و ورود دوباره آزموده شود.
+    """
+
+    def __init__(self, version: str = "0.8.0"):
+        self.version = version
+        self.users: dict[str, int] = {} # نام کاربری -> ترافیک مصرفی (بایت)
+        self.logins = 0
+        self.requests: list[tuple[str, str]] = []
+        self.valid_token: str | None = None
+        self.fail_create: set[str] = set()
+        self.create_gate: asyncio.Event | None = None # تا set نشود ساخت کاربر جواب نمی‌گیرد
+        self.token_ttl: float | None = None # با مقدار، توکن‌ها فیلد exp دارند
+        self.fail_login = False
+
+    def expire_token(self) -> None:
+        self.valid_token = None
+
+    def _user(self, username: str) -> dict:
+        return {"username": username, "status": "active", "used_traffic": self.users[username], "subscription_url": ""}
+
+    async def handler(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append((request.method, request.url.path))
+        if request.url.path == "/api/admin/token":
+            self.logins += 1
+            if self.fail_login:
+                return httpx.Response(401, json={"detail": "Incorrect username or password"})
+            claims = {"sub": "admin", "n": self.logins}
+            if self.token_ttl is not None:
+                claims["exp"] = int(time.time() + self.token_ttl)
+            self.valid_token = jwt.encode(claims, "panel-secret")
+            return httpx.Response(200, json={"access_token": self.valid_token, "token_type": "bearer"})
+        if request.headers.get("Authorization") != f"Bearer {self.valid_token}":
+            return httpx.Response(401, json={"detail": "Could not validate credentials"})
+        if request.url.path == "/api/system":
+            return httpx.Response(200, json={"version": self.version})
+        if request.url.path == "/api/users":
+            offset, limit = int(request.url.params["offset"]), int(request.url.params["limit"])
+            names = sorted(self.users)
+            return httpx.Response(200, json={
+                "users": [self._user(name) for name in names[offset:offset + limit]],
+                "total": len(names),
+            })
+        if request.url.path == "/api/user" and request.method == "POST":
+            username = json.loads(request.content)["username"]
+            if self.create_gate is not None:
+                await self.create_gate.wait()
+            if username in self.fail_create:
+                return httpx.Response(500, json={"detail": "panel error"})
+            if username in self.users:
+                return httpx.Response(409, json={"detail": "User already exists"})
+            self.users[username] = 0
+            return httpx.Response(200, json=self._user(username))
+        return httpx.Response(404, json={"detail": "Not Found"})
+
+    def client(self, panel: dict, **kwargs) -> MarzbanClient:
+        client = MarzbanClient(
+            panel,
+            tokens=kwargs.get("tokens") or PanelTokenManager(),
+            metadata=kwargs.get("metadata") or PanelMetadataCache(),
+            health=kwargs.get("health") or PanelHealthRegistry(),
+        )
+        client._http = httpx.AsyncClient(base_url=client._http.base_url, transport=httpx.MockTransport(self.handler))
+        return client
+
+    def pool(self) -> MarzbanClientPool:
+        fake = self
+
+        class FakePool(MarzbanClientPool):
+            def get(self, panel: dict) -> MarzbanClient:
+                if panel["id"] not in self._clients:
+                    self._clients[panel["id"]] = fake.client(panel)
+                return self._clients[panel["id"]]
+
+        return FakePool()
+
+
+@pytest.fixture
+def marzban() -> FakeMarzban:
+    return FakeMarzban()
+
+
+def panel_dict(panel_id: int, owner_id: int = 1, **extra) -> dict:
+    return {
+        "id": panel_id, "user_core": owner_id, "name": f"panel-{panel_id}", "url_panel": f"http://panel-{panel_id}",
+        "username_panel": "admin", "password_panel": "secret", "max_volume": 0, "used_volume": 0, "is_active": True,
+        **extra,
+    }
+
+
+@pytest.fixture
+def make_panel_dict():
+    return panel_dict
@@ -0,0 +1,74 @@
+import asyncio
+
+from project.core.app_marzban.bulk import provision_users
+from project.core.app_marzban.health import PanelHealthRegistry
+from project.core.app_marzban.scheduler import PanelScheduler
+from project.core.app_marzban.schema import ProvisionRequest, UserCreateRequest
+from project.db.models import ConfigurationPanelModel
+
+
+async def _panel(session, owner, name: str, max_volume: int = 100) -> ConfigurationPanelModel:
+    panel = ConfigurationPanelModel(
+        user_core=owner.id, name=name, url_address=f"http://{name}", username="admin", password="secret",
+        max_volume=max_volume, used_volume=0, is_active=True,
+    )
+    session.add(panel)
+    await session.commit()
+    return panel
+
+
+async def _used_volume(session_factory, panel_id: int) -> int:
+    async with session_factory() as session:
+        return (await session.get(ConfigurationPanelModel, panel_id)).used_volume
+
+
+def _requests(owner, *usernames: str, volume: int = 10) -> list[ProvisionRequest]:
+    return [
+        ProvisionRequest(payload=UserCreateRequest(username=username), owner_id=owner.id, volume=volume)
+        for username in usernames
+    ]
+
+
+def test_failed_items_release_their_reservation(run, session_factory, make_user, marzban):
+    async def scenario():
+        async with session_factory() as session:
+            owner = await make_user(session)
+            panel = await _panel(session, owner, "p1")
+        marzban.fail_create.add("broken")
+        scheduler = PanelScheduler(health=PanelHealthRegistry())
+
+        results = await provision_users(
+            _requests(owner, "erin", "broken"), pool=marzban.pool(), scheduler=scheduler, session_factory=session_factory
+        )
+
+        assert [r.ok for r in results] == [True, False]
+        assert await _used_volume(session_factory, panel.id) == 10
+        assert scheduler.get_panel(panel.id)["used_volume"] == 10
+
+    run(scenario())
+
+
+def test_cancelled_provisioning_releases_its_reservation(run, session_factory, make_user, marzban):
+    async def scenario():
+        async with session_factory() as session:
+            owner = await make_user(session)
+            panel = await _panel(session, owner, "p1")
+        marzban.create_gate = asyncio.Event()
+        scheduler = PanelScheduler(health=PanelHealthRegistry())
+
+        task = asyncio.ensure_future(provision_users(
+            _requests(owner, "erin", "frank"), concurrency_per_panel=1, pool=marzban.pool(), scheduler=scheduler,
+            session_factory=session_factory,
+        ))
+        # یک آیتم منتظر جواب پنل و دیگری منتظر semaphore است
+        while ("POST", "/api/user") not in marzban.requests:
+            await asyncio.sleep(0.001)
+        assert await _used_volume(session_factory, panel.id) == 20
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+        assert task.cancelled()
+        assert await _used_volume(session_factory, panel.id) == 0
+        assert scheduler.get_panel(panel.id)["used_volume"] == 0
+
+    run(scenario())
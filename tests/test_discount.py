@@ -0,0 +1,122 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi.exceptions import HTTPException
+from sqlalchemy import select
+
+from project.core.app_discount.engine import DiscountRuleCache
+from project.core.repositories.discount import DiscountRepository
+from project.core.services.discount_service import DiscountService
+from project.db.models import DiscountModel, UsersDiscountModel
+
+
+AMOUNT = 1000
+
+
+async def _discount(session, seller, **data) -> DiscountModel:
+    return await DiscountRepository(DiscountModel, session).create({
+        "seller_user_id": seller.id,
+        "code": "OFF10",
+        "percent": 10,
+        "expired_dt": datetime.now(timezone.utc) + timedelta(days=1),
+        **data,
+    })
+
+
+def _service(session) -> DiscountService:
+    # کش جداگانه برای هر تست؛ شناسه فروشنده‌ها در دیتابیس تازه تکرار می‌شوند
+    return DiscountService(DiscountRepository(DiscountModel, session), cache=DiscountRuleCache())
+
+
+async def _redeem(session_factory, seller_id: int, buyer_id: int, fail: bool = False) -> None:
+    async with session_factory() as session:
+        service = _service(session)
+        evaluation = await service.evaluate(seller_id, buyer_id, ["OFF10"], AMOUNT)
+        async with service.redemption(evaluation, buyer_id):
+            if fail:
+                # شکست تراکنش فاکتور بعد از رزرو
+                await session.rollback()
+                raise RuntimeError("invoice failed")
+            await session.commit()
+
+
+async def _usage(session_factory, discount_id: int) -> tuple[int, list[int]]:
+    async with session_factory() as session:
+        used_count = await session.scalar(select(DiscountModel.used_count).where(DiscountModel.id == discount_id))
+        per_user = await session.scalars(
+            select(UsersDiscountModel.count_uses).where(UsersDiscountModel.discount_id == discount_id)
+        )
+        return used_count, per_user.all()
+
+
+def test_failed_invoice_releases_reserved_usage(run, session_factory, make_user):
+    async def scenario():
+        async with session_factory() as session:
+            seller = await make_user(session)
+            buyer = await make_user(session, seller)
+            discount = await _discount(session, seller, usage_ceiling=1)
+
+        with pytest.raises(RuntimeError):
+            await _redeem(session_factory, seller.id, buyer.id, fail=True)
+        assert await _usage(session_factory, discount.id) == (0, [])
+
+        # سقف یک‌باره با رزرو آزاد شده هنوز قابل استفاده است
+        await _redeem(session_factory, seller.id, buyer.id)
+        assert await _usage(session_factory, discount.id) == (1, [1])
+
+    run(scenario())
+
+
+def test_usage_ceiling_holds_under_concurrency(run, session_factory, make_user):
+    async def scenario():
+        async with session_factory() as session:
+            seller = await make_user(session)
+            buyers = [await make_user(session, seller) for _ in range(4)]
+            discount = await _discount(session, seller, usage_ceiling=2)
+
+        results = await asyncio.gather(
+            *(_redeem(session_factory, seller.id, buyer.id) for buyer in buyers), return_exceptions=True
+        )
+        errors = [r for r in results if isinstance(r, Exception)]
+        assert len(errors) == 2
+        assert all(isinstance(e, HTTPException) and e.status_code == 406 for e in errors)
+        assert await _usage(session_factory, discount.id) == (2, [1, 1])
+
+    run(scenario())
+
+
+def test_per_user_limit_releases_the_ceiling_reservation(run, session_factory, make_user):
+    async def scenario():
+        async with session_factory() as session:
+            seller = await make_user(session)
+            buyer = await make_user(session, seller)
+            discount = await _discount(session, seller, usage_ceiling=5, number_uses_per_user=1)
+
+        await _redeem(session_factory, seller.id, buyer.id)
+        with pytest.raises(HTTPException) as exc:
+            await _redeem(session_factory, seller.id, buyer.id)
+        assert exc.value.status_code == 406
+        assert await _usage(session_factory, discount.id) == (1, [1])
+
+    run(scenario())
+
+
+def test_evaluation_applies_percent_and_cap(run, session_factory, make_user):
+    async def scenario():
+        async with session_factory() as session:
+            seller = await make_user(session)
+            buyer = await make_user(session, seller)
+            await _discount(session, seller, percent=50, maximum_discount_amount=100, minimum_purchase_amount=500)
+            service = _service(session)
+
+            evaluation = await service.evaluate(seller.id, buyer.id, ["OFF10"], AMOUNT)
+            assert (evaluation.discount_amount, evaluation.total) == (100, AMOUNT - 100)
+            with pytest.raises(HTTPException) as exc:
+                await service.evaluate(seller.id, buyer.id, ["OFF10"], 499)
+            assert exc.value.status_code == 406
+            with pytest.raises(HTTPException) as exc:
+                await service.evaluate(seller.id, buyer.id, ["MISSING"], AMOUNT)
+            assert exc.value.status_code == 404
+
+    run(scenario())
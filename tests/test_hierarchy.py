@@ -0,0 +1,91 @@
+import pytest
+from fastapi.exceptions import HTTPException
+from sqlalchemy import select
+
+from project.core.repositories.user import UserCoreRepository
+from project.db.models import UserCoreModel, UserHierarchyModel
+
+
+async def _closure(session) -> set[tuple[int, int, int]]:
+    h = UserHierarchyModel
+    result = await session.execute(select(h.ancestor_id, h.descendant_id, h.depth))
+    return set(result.all())
+
+
+def test_create_links_all_ancestors(run, session_factory, make_user):
+    async def scenario():
+        async with session_factory() as session:
+            root = await make_user(session)
+            child = await make_user(session, root)
+            grandchild = await make_user(session, child)
+            repo = UserCoreRepository(UserCoreModel, session)
+
+            assert [u.id for u in await repo.ancestors(grandchild.id)] == [child.id, root.id]
+            assert await repo.depth(grandchild.id) == 2
+            assert await repo.count_descendants(root.id) == 2
+            assert await repo.count_descendants(root.id, max_depth=1) == 1
+            assert await repo.is_descendant(grandchild.id, root.id)
+            assert not await repo.is_descendant(root.id, root.id)
+            assert await repo.is_descendant(root.id, root.id, include_self=True)
+
+    run(scenario())
+
+
+def test_reparent_moves_subtree_and_rollups(run, session_factory, make_user):
+    async def scenario():
+        async with session_factory() as session:
+            a = await make_user(session)
+            b = await make_user(session)
+            child = await make_user(session, a)
+            grandchild = await make_user(session, child)
+            repo = UserCoreRepository(UserCoreModel, session)
+            assert (await repo.rollup_repo.get_rollup(a.id)).network_size == 2
+
+            await repo.reparent(child, b.id)
+
+            assert child.upstream_id == b.id
+            assert [u.id for u in await repo.ancestors(grandchild.id)] == [child.id, b.id]
+            assert await repo.count_descendants(a.id) == 0
+            assert (await repo.rollup_repo.get_rollup(a.id)).network_size == 0
+            assert (await repo.rollup_repo.get_rollup(b.id)).network_size == 2
+            assert await repo.rollup_repo.verify() == {}
+
+            # جدول closure افزایشی باید با ساخت کامل از upstream_id یکی باشد
+            incremental = await _closure(session)
+            await repo.rebuild_hierarchy()
+            assert await _closure(session) == incremental
+
+    run(scenario())
+
+
+def test_reparent_under_own_subtree_is_rejected(run, session_factory, make_user):
+    async def scenario():
+        async with session_factory() as session:
+            root = await make_user(session)
+            child = await make_user(session, root)
+            repo = UserCoreRepository(UserCoreModel, session)
+
+            with pytest.raises(HTTPException) as exc:
+                await repo.reparent(root, child.id)
+            assert exc.value.status_code == 400
+            with pytest.raises(HTTPException):
+                await repo.reparent(root, root.id)
+
+    run(scenario())
+
+
+def test_reparent_refuses_chat_id_collision(run, session_factory, make_user):
+    async def scenario():
+        async with session_factory() as session:
+            a = await make_user(session)
+            b = await make_user(session)
+            await make_user(session, b, tel_chat_id="same")
+            moving = await make_user(session, a, tel_chat_id="same")
+            repo = UserCoreRepository(UserCoreModel, session)
+
+            with pytest.raises(HTTPException) as exc:
+                await repo.reparent(moving, b.id)
+            assert exc.value.status_code == 409
+            assert [u.id for u in await repo.ancestors(moving.id)] == [a.id]
+
+    run(scenario())
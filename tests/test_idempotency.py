@@ -0,0 +1,218 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi.exceptions import HTTPException
+from sqlalchemy import select, update
+
+from project.core.repositories.idempotency import IdempotencyKeyRepository
+from project.core.services.idempotency_service import IdempotencyKeyPurger, IdempotencyService
+from project.db.models import (
+    IdempotencyKeyModel, IdempotencyStatusChoices, WalletInvoiceStatusChoices, WalletRechargeInvoiceModel,
+)
+
+
+SCOPE = "wallet_invoice.create"
+
+
+class InvoiceAction:
+    """عملیات نمونه که یک فاکتور کیف پول می‌سازد و تعداد اجرا را می‌شمارد"""
+
+    def __init__(self, session, seller, buyer, gate: asyncio.Event | None = None, fail: bool = False, after_commit=None):
+        self.session = session
+        self.seller_id, self.buyer_id = seller.id, buyer.id
+        self.gate = gate
+        self.fail = fail
+        self.after_commit = after_commit
+        self.calls = 0
+
+    async def __call__(self) -> WalletRechargeInvoiceModel:
+        self.calls += 1
+        if self.gate is not None:
+            await self.gate.wait()
+        if self.fail:
+            raise HTTPException(status_code=406, detail="insufficient funds")
+        invoice = WalletRechargeInvoiceModel(seller_user_id=self.seller_id, buyer_user_id=self.buyer_id, charge_amount=100)
+        self.session.add(invoice)
+        await self.session.commit()
+        if self.after_commit is not None:
+            await self.after_commit(invoice)
+        return invoice
+
+    async def load(self, invoice_id: int) -> WalletRechargeInvoiceModel:
+        return await self.session.get(WalletRechargeInvoiceModel, invoice_id)
+
+
+def _service(session) -> IdempotencyService:
+    return IdempotencyService(IdempotencyKeyRepository(IdempotencyKeyModel, session))
+
+
+async def _invoice_count(session) -> int:
+    return len((await session.scalars(select(WalletRechargeInvoiceModel.id))).all())
+
+
+def test_completed_key_replays_the_first_result(run, session_factory, make_user):
+    async def scenario():
+        async with session_factory() as session:
+            seller = await make_user(session)
+            buyer = await make_user(session, seller)
+            action = InvoiceAction(session, seller, buyer)
+            service = _service(session)
+
+            first = await service.run(buyer.id, SCOPE, "key-1", action, action.load, model=WalletRechargeInvoiceModel)
+            second = await service.run(buyer.id, SCOPE, "key-1", action, action.load, model=WalletRechargeInvoiceModel)
+            other = await service.run(buyer.id, SCOPE, "key-2", action, action.load, model=WalletRechargeInvoiceModel)
+
+            assert first.id == second.id != other.id
+            assert action.calls == 2
+            assert await _invoice_count(session) == 2
+
+    run(scenario())
+
+
+def test_concurrent_duplicate_waits_for_the_in_flight_request(run, session_factory, make_user):
+    async def scenario():
+        async with session_factory() as session:
+            seller = await make_user(session)
+            buyer = await make_user(session, seller)
+
+        gate = asyncio.Event()
+        async with session_factory() as first_session, session_factory() as second_session:
+            first_action = InvoiceAction(first_session, seller, buyer, gate=gate)
+            second_action = InvoiceAction(second_session, seller, buyer)
+            first = asyncio.ensure_future(
+                _service(first_session).run(buyer.id, SCOPE, "key-1", first_action, first_action.load, model=WalletRechargeInvoiceModel)
+            )
+            # اجازه بده درخواست اول کلید را ثبت کند و منتظر بماند
+            while first_action.calls == 0:
+                await asyncio.sleep(0)
+            second = asyncio.ensure_future(
+                _service(second_session).run(buyer.id, SCOPE, "key-1", second_action, second_action.load, model=WalletRechargeInvoiceModel)
+            )
+            await asyncio.sleep(0)
+            gate.set()
+            results = await asyncio.gather(first, second)
+
+            assert results[0].id == results[1].id
+            assert (first_action.calls, second_action.calls) == (1, 0)
+
+        async with session_factory() as session:
+            assert await _invoice_count(session) == 1
+
+    run(scenario())
+
+
+def test_failed_action_releases_the_key(run, session_factory, make_user):
+    async def scenario():
+        async with session_factory() as session:
+            seller = await make_user(session)
+            buyer = await make_user(session, seller)
+            buyer_id = buyer.id
+            failing = InvoiceAction(session, seller, buyer, fail=True)
+            service = _service(session)
+
+            with pytest.raises(HTTPException) as exc:
+                await service.run(buyer_id, SCOPE, "key-1", failing, failing.load, model=WalletRechargeInvoiceModel)
+            assert exc.value.status_code == 406
+            assert await service.key_repo.get_key(buyer_id, SCOPE, "key-1") is None
+
+            # همان کلید بعد از شکست دوباره قابل استفاده است
+            action = InvoiceAction(session, seller, buyer)
+            invoice = await service.run(buyer_id, SCOPE, "key-1", action, action.load, model=WalletRechargeInvoiceModel)
+            assert action.calls == 1
+            assert (await service.key_repo.get_key(buyer_id, SCOPE, "key-1")).resource_id == invoice.id
+
+    run(scenario())
+
+
+async def _key_row(session_factory, user_id: int, key: str) -> IdempotencyKeyModel | None:
+    async with session_factory() as session:
+        return await IdempotencyKeyRepository(IdempotencyKeyModel, session).get_key(user_id, SCOPE, key)
+
+
+def test_key_is_completed_in_the_actions_commit(run, session_factory, make_user):
+    async def scenario():
+        async with session_factory() as session:
+            seller = await make_user(session)
+            buyer = await make_user(session, seller)
+            buyer_id = buyer.id
+            seen = {}
+
+            async def crash_after_commit(invoice):
+                # پروسه درست بعد از ذخیره سند از کار می‌افتد؛ کلید باید از قبل تمام شده باشد
+                seen["key"] = await _key_row(session_factory, buyer_id, "key-1")
+                raise asyncio.CancelledError
+
+            action = InvoiceAction(session, seller, buyer, after_commit=crash_after_commit)
+            with pytest.raises(asyncio.CancelledError):
+                await _service(session).run(buyer_id, SCOPE, "key-1", action, action.load, model=WalletRechargeInvoiceModel)
+
+        assert seen["key"].status == IdempotencyStatusChoices.COMPLETED
+        assert (seen["key"].resource_type, seen["key"].resource_id) == ("wallet_recharge_invoices", seen["key"].resource_id)
+
+        # تکرار درخواست سند ذخیره شده را برمی‌گرداند و نه 409
+        async with session_factory() as session:
+            retry = InvoiceAction(session, seller, buyer)
+            invoice = await _service(session).run(buyer_id, SCOPE, "key-1", retry, retry.load, model=WalletRechargeInvoiceModel)
+            assert invoice.id == seen["key"].resource_id
+            assert retry.calls == 0
+            assert await _invoice_count(session) == 1
+
+    run(scenario())
+
+
+def test_existing_resource_is_recorded_by_id(run, session_factory, make_user):
+    async def scenario():
+        async with session_factory() as session:
+            seller = await make_user(session)
+            buyer = await make_user(session, seller)
+            invoice = WalletRechargeInvoiceModel(seller_user_id=seller.id, buyer_user_id=buyer.id, charge_amount=100)
+            session.add(invoice)
+            await session.commit()
+            invoice_id, buyer_id = invoice.id, buyer.id
+            service = _service(session)
+
+            async def approve():
+                # مانند تایید فاکتور: سند جدیدی ساخته نمی‌شود و ردیف موجود با UPDATE تغییر می‌کند
+                await session.execute(
+                    update(WalletRechargeInvoiceModel)
+                    .where(WalletRechargeInvoiceModel.id == invoice_id)
+                    .values(status=WalletInvoiceStatusChoices.PAY_WALLET)
+                )
+                await session.commit()
+                assert (await _key_row(session_factory, buyer_id, "key-1")).resource_id == invoice_id
+                return await session.get(WalletRechargeInvoiceModel, invoice_id)
+
+            result = await service.run(
+                buyer_id, SCOPE, "key-1", approve, service.key_repo.session.get, model=WalletRechargeInvoiceModel,
+                resource_id=invoice_id,
+            )
+            assert result.id == invoice_id
+
+    run(scenario())
+
+
+def test_purger_deletes_only_expired_keys(run, session_factory, make_user):
+    async def scenario():
+        async with session_factory() as session:
+            user = await make_user(session)
+            repo = IdempotencyKeyRepository(IdempotencyKeyModel, session)
+            await repo.claim(user.id, SCOPE, "old", ttl=60)
+            await repo.claim(user.id, SCOPE, "fresh", ttl=60)
+            await session.execute(
+                update(IdempotencyKeyModel)
+                .where(IdempotencyKeyModel.key == "old")
+                .values(expires_at=datetime.now(timezone.utc) - timedelta(seconds=1))
+            )
+            await session.commit()
+            user_id = user.id
+
+        purger = IdempotencyKeyPurger(session_factory, interval=60)
+        stop = asyncio.Event()
+        stop.set()
+        assert await purger.purge() == 1
+        await purger.run_forever(stop)
+        assert await _key_row(session_factory, user_id, "old") is None
+        assert await _key_row(session_factory, user_id, "fresh") is not None
+
+    run(scenario())
@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+
+from project.core.app_marzban.token import PanelTokenManager
+from project.core.errors import PanelAuthError
+
+
+def test_concurrent_requests_share_one_login(run, marzban, make_panel_dict):
+    async def scenario():
+        client = marzban.client(make_panel_dict(1))
+        tokens = await asyncio.gather(*(client.token() for _ in range(10)))
+        assert marzban.logins == 1
+        assert len({t.access_token for t in tokens}) == 1
+
+    run(scenario())
+
+
+def test_unauthorized_response_logs_in_again_and_retries_once(run, marzban, make_panel_dict):
+    async def scenario():
+        client = marzban.client(make_panel_dict(1))
+        assert (await client.get_system_stats()).version == "0.8.0"
+        first = await client.token()
+
+        # پنل توکن را باطل کرده ولی کش هنوز آن را معتبر می‌داند
+        marzban.expire_token()
+        assert (await client.get_system_stats()).version == "0.8.0"
+
+        assert marzban.logins == 2
+        assert (await client.token()).access_token != first.access_token
+        assert [path for _, path in marzban.requests].count("/api/system") == 3
+
+    run(scenario())
+
+
+def test_token_inside_refresh_margin_is_refreshed_in_the_background(run, marzban, make_panel_dict):
+    async def scenario():
+        marzban.token_ttl = 30
+        client = marzban.client(make_panel_dict(1), tokens=PanelTokenManager(refresh_margin=60))
+        first = await client.token()
+
+        # توکن هنوز معتبر است و بدون انتظار برگردانده می‌شود؛ ورود دوباره در پس‌زمینه انجام می‌شود
+        assert (await client.token()) is first
+        await client._tokens._entries[1].refresh_task
+        assert marzban.logins == 2
+        assert (await client.token()).access_token != first.access_token
+
+    run(scenario())
+
+
+def test_failed_login_backs_off(run, marzban, make_panel_dict):
+    async def scenario():
+        marzban.fail_login = True
+        client = marzban.client(make_panel_dict(1), tokens=PanelTokenManager(failure_backoff=60))
+        for _ in range(3):
+            with pytest.raises(PanelAuthError):
+                await client.token()
+        # تا پایان backoff دوباره به پنل درخواست ورود فرستاده نمی‌شود
+        assert marzban.logins == 1
+
+        marzban.fail_login = False
+        client._tokens.failure_backoff = 0
+        assert (await client.token()).access_token == marzban.valid_token
+        assert marzban.logins == 2
+
+    run(scenario())
@@ -0,0 +1,101 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi.exceptions import HTTPException
+
+from project.core.repositories.base import decode_cursor, encode_cursor
+from project.core.repositories.user import UserCoreRepository
+from project.core.repositories.wallet import WalletInvoiceRepository
+from project.db.models import UserCoreModel, WalletRechargeInvoiceModel
+
+
+async def _walk(fetch, limit: int) -> list[int]:
+    """همه صفحه‌ها را تا انتها می‌خواند؛ اگر cursor جلو نرود تست به جای حلقه بی‌پایان شکست می‌خورد"""
+    ids, cursor = [], None
+    for _ in range(50):
+        page = await fetch(cursor=cursor, limit=limit)
+        assert len(page.items) <= limit
+        ids.extend(item.id for item in page.items)
+        cursor = page.next_cursor
+        if cursor is None:
+            return ids
+    pytest.fail(f"pagination did not terminate: {ids}")
+
+
+async def _invoices(session, seller, buyer, created_at: list | None = None) -> list[WalletRechargeInvoiceModel]:
+    invoices = [
+        WalletRechargeInvoiceModel(
+            seller_user_id=seller.id, buyer_user_id=buyer.id, charge_amount=100,
+            **({"created_at": created_at[i]} if created_at else {}),
+        )
+        for i in range(5)
+    ]
+    session.add_all(invoices)
+    await session.commit()
+    return invoices
+
+
+def test_timestamp_ordered_pages_walk_every_row(run, session_factory, make_user):
+    async def scenario():
+        async with session_factory() as session:
+            seller = await make_user(session)
+            buyer = await make_user(session, seller)
+            # created_at با server_default پر می‌شود (قالب ذخیره sqlite بدون میکروثانیه) و همه در یک ثانیه‌اند
+            invoices = await _invoices(session, seller, buyer)
+            repo = WalletInvoiceRepository(WalletRechargeInvoiceModel, session)
+
+            async def fetch(cursor, limit):
+                return await repo.all_invoices_seller_user(
+                    seller, limit=limit, cursor=cursor, order_by=WalletRechargeInvoiceModel.created_at
+                )
+
+            assert await _walk(fetch, limit=2) == sorted((wi.id for wi in invoices), reverse=True)
+
+    run(scenario())
+
+
+def test_distinct_timestamps_are_paged_newest_first(run, session_factory, make_user):
+    async def scenario():
+        async with session_factory() as session:
+            seller = await make_user(session)
+            buyer = await make_user(session, seller)
+            base = datetime(2024, 1, 1, tzinfo=timezone.utc)
+            # ترتیب زمان برعکس ترتیب شناسه است تا مرتب‌سازی واقعا روی created_at باشد
+            invoices = await _invoices(session, seller, buyer, [base - timedelta(seconds=i) for i in range(5)])
+            repo = WalletInvoiceRepository(WalletRechargeInvoiceModel, session)
+
+            async def fetch(cursor, limit):
+                return await repo.all_invoices_seller_user(
+                    seller, limit=limit, cursor=cursor, order_by=WalletRechargeInvoiceModel.created_at
+                )
+
+            assert await _walk(fetch, limit=2) == [wi.id for wi in invoices]
+
+    run(scenario())
+
+
+def test_id_ordered_pages_and_descendants(run, session_factory, make_user):
+    async def scenario():
+        async with session_factory() as session:
+            root = await make_user(session)
+            children = [await make_user(session, root) for _ in range(3)]
+            grandchildren = [await make_user(session, children[0]) for _ in range(2)]
+            repo = UserCoreRepository(UserCoreModel, session)
+
+            async def fetch(cursor, limit):
+                return await repo.descendants(root.id, cursor=cursor, limit=limit)
+
+            expected = sorted((u.id for u in children + grandchildren), reverse=True)
+            assert await _walk(fetch, limit=2) == expected
+            assert await _walk(fetch, limit=len(expected)) == expected
+
+    run(scenario())
+
+
+def test_cursor_round_trip_and_bad_cursor():
+    when = datetime(2024, 1, 1, 12, 30, tzinfo=timezone.utc)
+    assert decode_cursor(encode_cursor(when, 7)) == (when, 7)
+    assert decode_cursor(encode_cursor([1.5, -2.0], 3)) == ([1.5, -2.0], 3)
+    with pytest.raises(HTTPException) as exc:
+        decode_cursor("not-a-cursor")
+    assert exc.value.status_code == 400
@@ -0,0 +1,116 @@
+import asyncio
+import time
+from contextlib import contextmanager
+
+import httpx
+from fastapi import FastAPI
+from sqlalchemy import event, select
+
+from project.core.app_bot.router import router
+from project.core.auth.auth import create_access_token
+from project.core.auth.principals import Principal, PrincipalCache, principal_cache
+from project.db.database import engine
+from project.db.models import WalletRechargeInvoiceModel
+
+
+def _principal(user_id: int, fetched_at: float | None = None) -> Principal:
+    return Principal(
+        id=user_id, upstream_id=None, is_active=True, is_admin=False, is_repres=False, pwd_ts=None,
+        fetched_at=time.time() if fetched_at is None else fetched_at,
+    )
+
+
+class CountingLoader:
+    def __init__(self, delay: float = 0):
+        self.calls: list[int] = []
+        self.delay = delay
+
+    async def __call__(self, user_id: int) -> Principal:
+        self.calls.append(user_id)
+        await asyncio.sleep(self.delay)
+        return _principal(user_id)
+
+
+def test_cache_is_single_flight_and_drops_its_locks(run):
+    async def scenario():
+        cache = PrincipalCache(ttl=60, max_size=10)
+        loader = CountingLoader(delay=0.01)
+        principals = await asyncio.gather(*(cache.get(1, loader) for _ in range(5)))
+        assert loader.calls == [1]
+        assert {p.id for p in principals} == {1}
+        assert cache._locks == {}
+
+    run(scenario())
+
+
+def test_cache_evicts_least_recently_used(run):
+    async def scenario():
+        cache = PrincipalCache(ttl=60, max_size=2)
+        loader = CountingLoader()
+        await cache.get(1, loader)
+        await cache.get(2, loader)
+        await cache.get(1, loader) # ۱ تازه‌ترین می‌شود
+        await cache.get(3, loader)
+        assert len(cache) == 2
+        assert cache.peek(2) is None
+        assert cache.peek(1) is not None and cache.peek(3) is not None
+        assert loader.calls == [1, 2, 3]
+
+    run(scenario())
+
+
+def test_expired_entries_are_removed_and_reloaded(run):
+    async def scenario():
+        cache = PrincipalCache(ttl=30, max_size=10)
+        cache._put(_principal(1, fetched_at=time.time() - 31))
+        assert cache.peek(1) is None
+        assert len(cache) == 0
+        loader = CountingLoader()
+        await cache.get(1, loader)
+        assert loader.calls == [1]
+
+    run(scenario())
+
+
+@contextmanager
+def _user_core_queries():
+    """شمارش کوئری‌هایی که جدول user_core را می‌خوانند"""
+    statements: list[str] = []
+
+    def before(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT") and "FROM user_core" in statement:
+            statements.append(statement)
+
+    event.listen(engine.sync_engine, "before_cursor_execute", before)
+    try:
+        yield statements
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", before)
+
+
+def test_read_only_endpoints_use_the_cached_principal(run, session_factory, make_user):
+    app = FastAPI()
+    app.include_router(router)
+
+    async def scenario():
+        async with session_factory() as session:
+            seller = await make_user(session, balance=1000)
+            buyer = await make_user(session, seller)
+        token = create_access_token({"sub": str(buyer.id), "pwd_ts": 0})
+        headers = {"Authorization": f"Bearer {token}"}
+        payload = {"charge_amount": 500, "get_config": False, "descriptions": "x"}
+
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            first = await client.post("/bot/wallet", json=payload, headers=headers)
+            assert first.status_code == 200, first.text
+            assert principal_cache.peek(buyer.id) is not None
+            with _user_core_queries() as statements:
+                second = await client.post("/bot/wallet", json=payload, headers=headers)
+            assert second.status_code == 200, second.text
+            assert statements == []
+
+        async with session_factory() as session:
+            invoices = (await session.scalars(select(WalletRechargeInvoiceModel))).all()
+            assert [(wi.buyer_user_id, wi.seller_user_id) for wi in invoices] == [(buyer.id, seller.id)] * 2
+
+    run(scenario())
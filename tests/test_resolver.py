@@ -0,0 +1,29 @@
+from project.core.app_user.resolver import DownstreamUserCache
+
+
+def test_remapped_key_leaves_no_entry_under_the_previous_user():
+    cache = DownstreamUserCache(max_size=10)
+    cache.put(1, "chat", 100)
+    cache.put(1, "other", 100)
+    cache.put(1, "chat", 200)
+
+    assert cache._keys == {100: {(1, "other")}, 200: {(1, "chat")}}
+    # باطل کردن کاربر قبلی نگاشت جدید را حذف نمی‌کند
+    cache.invalidate_user(100)
+    assert cache.get(1, "chat") == 200
+    assert cache.get(1, "other") is None
+
+    cache.put(1, "chat", 300)
+    assert cache._keys == {300: {(1, "chat")}}
+
+
+def test_eviction_drops_the_reverse_index():
+    cache = DownstreamUserCache(max_size=2)
+    cache.put(1, "a", 100)
+    cache.put(1, "b", 200)
+    assert cache.get(1, "a") == 100
+    cache.put(1, "c", 300)
+
+    assert cache.get(1, "b") is None
+    assert set(cache._keys) == {100, 300}
+    assert (cache.hits, cache.misses) == (1, 1)
@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+from sqlalchemy import update
+
+from project.core.app_marzban.health import PanelHealthRegistry
+from project.core.app_marzban.scheduler import PanelScheduler
+from project.core.errors import PanelUnavailableError
+from project.db.models import ConfigurationPanelModel
+
+
+async def _panel(session, owner, name: str, max_volume: int = 100, used_volume: int = 0) -> ConfigurationPanelModel:
+    panel = ConfigurationPanelModel(
+        user_core=owner.id, name=name, url_address=f"http://{name}", username="admin", password="secret",
+        max_volume=max_volume, used_volume=used_volume, is_active=True,
+    )
+    session.add(panel)
+    await session.commit()
+    return panel
+
+
+async def _used_volumes(session_factory, *panels) -> list[int]:
+    async with session_factory() as session:
+        return [(await session.get(ConfigurationPanelModel, p.id)).used_volume for p in panels]
+
+
+def _scheduler() -> PanelScheduler:
+    return PanelScheduler(health=PanelHealthRegistry())
+
+
+def test_reserve_picks_the_owners_least_utilized_panel(run, session_factory, make_user):
+    async def scenario():
+        async with session_factory() as session:
+            owner = await make_user(session)
+            other = await make_user(session)
+            busy = await _panel(session, owner, "busy", used_volume=60)
+            idle = await _panel(session, owner, "idle", used_volume=10)
+            foreign = await _panel(session, other, "foreign")
+        scheduler = _scheduler()
+
+        assert (await scheduler.reserve(20, owner.id))["id"] == idle.id
+        assert (await scheduler.reserve(20, owner.id))["id"] == idle.id
+        # idle حالا ۵۰ درصد پر است و busy ۶۰ درصد
+        assert (await scheduler.reserve(20, owner.id))["id"] == idle.id
+        assert (await scheduler.reserve(20, owner.id))["id"] == busy.id
+        assert await _used_volumes(session_factory, busy, idle, foreign) == [80, 70, 0]
+
+        await scheduler.release(busy.id, 20)
+        assert await _used_volumes(session_factory, busy) == [60]
+        assert scheduler.get_panel(busy.id)["used_volume"] == 60
+
+    run(scenario())
+
+
+def test_concurrent_reservations_never_overfill_a_panel(run, session_factory, make_user):
+    async def scenario():
+        async with session_factory() as session:
+            owner = await make_user(session)
+            panel = await _panel(session, owner, "p1")
+        scheduler = _scheduler()
+
+        results = await asyncio.gather(*(scheduler.reserve(30, owner.id) for _ in range(5)), return_exceptions=True)
+
+        assert [r["id"] for r in results if isinstance(r, dict)] == [panel.id] * 3
+        assert all(isinstance(r, PanelUnavailableError) for r in results if not isinstance(r, dict))
+        assert await _used_volumes(session_factory, panel) == [90]
+
+    run(scenario())
+
+
+def test_panel_filled_elsewhere_falls_through_to_the_next_one(run, session_factory, make_user):
+    async def scenario():
+        async with session_factory() as session:
+            owner = await make_user(session)
+            first = await _panel(session, owner, "first", used_volume=0)
+            second = await _panel(session, owner, "second", used_volume=50)
+        scheduler = _scheduler()
+        await scheduler.ensure_loaded()
+
+        # پروسه دیگری first را پر کرده و حافظه این زمان‌بند هنوز آن را خالی می‌بیند
+        async with session_factory() as session:
+            await session.execute(
+                update(ConfigurationPanelModel).where(ConfigurationPanelModel.id == first.id).values(used_volume=95)
+            )
+            await session.commit()
+
+        assert (await scheduler.reserve(20, owner.id))["id"] == second.id
+        assert await _used_volumes(session_factory, first, second) == [95, 70]
+        assert not scheduler.is_fresh
+
+        with pytest.raises(PanelUnavailableError):
+            await scheduler.reserve(40, owner.id)
+
+    run(scenario())
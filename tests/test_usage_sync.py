@@ -0,0 +1,110 @@
+from sqlalchemy import select
+
+from project.core.app_marzban.bulk import provision_users
+from project.core.app_marzban.health import PanelHealthRegistry
+from project.core.app_marzban.panels import panel_from_model
+from project.core.app_marzban.scheduler import PanelScheduler
+from project.core.app_marzban.schema import ProvisionRequest, UserCreateRequest
+from project.core.services.usage_sync_service import GB, UsageSyncService
+from project.db.models import ConfigurationPanelModel, ConfigurationsModel
+
+
+async def _panel(session, owner, name: str) -> ConfigurationPanelModel:
+    panel = ConfigurationPanelModel(
+        user_core=owner.id, name=name, url_address=f"http://{name}", username="admin", password="secret",
+        max_volume=100, used_volume=0, is_active=True,
+    )
+    session.add(panel)
+    await session.commit()
+    return panel
+
+
+async def _config(session, owner, buyer, name: str, panel_id: int | None, ceiling: int = 50) -> ConfigurationsModel:
+    config = ConfigurationsModel(
+        buyer_user_id=buyer.id, seller_user_id=owner.id, panel_id=panel_id, name=name,
+        total_volume_gb=ceiling, volume_ceiling_gb=ceiling, consumed_volume_gb=0,
+    )
+    session.add(config)
+    await session.commit()
+    return config
+
+
+async def _configs(session_factory) -> dict[int, tuple[int | None, int]]:
+    async with session_factory() as session:
+        result = await session.execute(
+            select(ConfigurationsModel.id, ConfigurationsModel.panel_id, ConfigurationsModel.consumed_volume_gb)
+        )
+        return {config_id: (panel_id, consumed) for config_id, panel_id, consumed in result.all()}
+
+
+def test_sync_updates_consumed_volume_and_adopts_legacy_configs(run, session_factory, make_user, marzban):
+    async def scenario():
+        async with session_factory() as session:
+            owner = await make_user(session)
+            buyer = await make_user(session, owner)
+            panel = await _panel(session, owner, "p1")
+            other = await _panel(session, owner, "p2")
+            legacy = await _config(session, owner, buyer, "alice", None)
+            linked = await _config(session, owner, buyer, "bob", panel.id, ceiling=3)
+            elsewhere = await _config(session, owner, buyer, "carol", other.id)
+            # دو ردیف قدیمی هم‌نام؛ فقط قدیمی‌ترین به پنل نسبت داده می‌شود
+            dup_old = await _config(session, owner, buyer, "dave", None)
+            dup_new = await _config(session, owner, buyer, "dave", None)
+        marzban.users.update({"alice": 5 * GB, "bob": 10 * GB, "carol": 7 * GB, "dave": 1 * GB})
+
+        result = await UsageSyncService(pool=marzban.pool(), page_size=3).sync_panel(panel)
+
+        assert result.error is None
+        assert (result.users, result.updated) == (4, 3)
+        assert result.consumed_volume_gb == 23
+        configs = await _configs(session_factory)
+        assert configs[legacy.id] == (panel.id, 5)
+        # مصرف از سقف کانفیگ بیشتر نمی‌شود
+        assert configs[linked.id] == (panel.id, 3)
+        assert configs[elsewhere.id] == (other.id, 0)
+        assert configs[dup_old.id] == (panel.id, 1)
+        assert configs[dup_new.id] == (None, 0)
+        async with session_factory() as session:
+            assert (await session.get(ConfigurationPanelModel, panel.id)).consumed_volume == 23
+
+        # همگام‌سازی دوم همان ردیف‌ها را با (panel_id, name) پیدا می‌کند
+        marzban.users["alice"] = 8 * GB
+        assert (await UsageSyncService(pool=marzban.pool()).sync_panel(panel)).updated == 3
+        assert (await _configs(session_factory))[legacy.id] == (panel.id, 8)
+
+    run(scenario())
+
+
+def test_provisioned_configs_record_their_panel(run, session_factory, make_user, marzban):
+    async def scenario():
+        async with session_factory() as session:
+            owner = await make_user(session)
+            buyer = await make_user(session, owner)
+            panel = await _panel(session, owner, "p1")
+        marzban.fail_create.add("broken")
+        pool = marzban.pool()
+        items = [
+            ProvisionRequest(
+                panel=panel_from_model(panel), payload=UserCreateRequest(username=username),
+                owner_id=owner.id, volume=10, buyer_user_id=buyer.id,
+            )
+            for username in ("erin", "broken")
+        ]
+
+        results = await provision_users(
+            items, pool=pool, scheduler=PanelScheduler(health=PanelHealthRegistry()), session_factory=session_factory
+        )
+
+        assert [r.ok for r in results] == [True, False]
+        async with session_factory() as session:
+            configs = (await session.scalars(select(ConfigurationsModel))).all()
+            assert [(c.name, c.panel_id, c.seller_user_id, c.total_volume_gb) for c in configs] == [
+                ("erin", panel.id, owner.id, 10)
+            ]
+
+        marzban.users["erin"] = 4 * GB
+        result = await UsageSyncService(pool=pool).sync_panel(panel)
+        assert result.updated == 1
+        assert list((await _configs(session_factory)).values()) == [(panel.id, 4)]
+
+    run(scenario())
@@ -0,0 +1,166 @@
+import asyncio
+
+import pytest
+from fastapi.exceptions import HTTPException
+from sqlalchemy import select
+
+from project.core.repositories.ledger import WalletLedgerRepository
+from project.core.repositories.wallet import WALLET_INVOICE_REFERENCE, WalletBalanceRepository, WalletInvoiceRepository
+from project.db.models import (
+    UserCoreModel, WalletBalanceSnapshotModel, WalletInvoiceStatusChoices, WalletLedgerEntryModel,
+    WalletRechargeInvoiceModel,
+)
+
+
+async def _invoice(session, seller, buyer, amount: int) -> WalletRechargeInvoiceModel:
+    invoice = WalletRechargeInvoiceModel(seller_user_id=seller.id, buyer_user_id=buyer.id, charge_amount=amount)
+    session.add(invoice)
+    await session.commit()
+    return invoice
+
+
+async def _ledger(session, user_id: int) -> list[WalletLedgerEntryModel]:
+    result = await session.scalars(
+        select(WalletLedgerEntryModel).where(WalletLedgerEntryModel.user_id == user_id).order_by(WalletLedgerEntryModel.seq)
+    )
+    return result.all()
+
+
+def test_concurrent_accept_pays_once(run, session_factory, make_user):
+    async def accept(invoice_id: int):
+        async with session_factory() as session:
+            invoice = await session.get(WalletRechargeInvoiceModel, invoice_id)
+            # تراکنش خواندنی بسته می‌شود تا هر دو درخواست با UPDATE شرطی شروع شوند
+            await session.commit()
+            return await WalletInvoiceRepository(WalletRechargeInvoiceModel, session).adding_charge_to_wallet(invoice)
+
+    async def scenario():
+        async with session_factory() as session:
+            seller = await make_user(session, balance=1000)
+            buyer = await make_user(session, seller)
+            invoice = await _invoice(session, seller, buyer, 300)
+
+        results = await asyncio.gather(accept(invoice.id), accept(invoice.id), return_exceptions=True)
+        errors = [r for r in results if isinstance(r, Exception)]
+        assert len(errors) == 1
+        assert isinstance(errors[0], HTTPException) and errors[0].status_code == 409
+
+        async with session_factory() as session:
+            balances = WalletBalanceRepository(UserCoreModel, session)
+            assert await balances.get_balance(seller.id) == 700
+            assert await balances.get_balance(buyer.id) == 300
+            assert (await session.get(WalletRechargeInvoiceModel, invoice.id)).status == WalletInvoiceStatusChoices.PAY_WALLET
+            assert (await balances.ledger_repo.reconcile(seller.id))["ok"]
+            assert (await balances.ledger_repo.reconcile(buyer.id))["ok"]
+
+    run(scenario())
+
+
+def test_batch_accept_is_idempotent_and_ledgers_each_invoice(run, session_factory, make_user):
+    async def scenario():
+        async with session_factory() as session:
+            seller = await make_user(session, balance=1000)
+            buyer = await make_user(session, seller)
+            invoices = [await _invoice(session, seller, buyer, amount) for amount in (100, 200, 300)]
+            repo = WalletInvoiceRepository(WalletRechargeInvoiceModel, session)
+
+            assert await repo.accept_invoices(invoices, seller) == {wi.id for wi in invoices}
+            # تایید دوباره همان فاکتورها چیزی را تغییر نمی‌دهد
+            assert await repo.accept_invoices(invoices, seller) == set()
+
+            assert await repo.balance_repo.get_balance(seller.id) == 400
+            assert await repo.balance_repo.get_balance(buyer.id) == 600
+            debits = [entry for entry in await _ledger(session, seller.id) if entry.amount < 0]
+            assert [(e.amount, e.reference_type, e.reference_id) for e in debits] == [
+                (-wi.charge_amount, WALLET_INVOICE_REFERENCE, wi.id) for wi in invoices
+            ]
+            assert [e.balance_after for e in debits] == [900, 700, 400]
+            assert (await repo.balance_repo.ledger_repo.reconcile(seller.id))["ok"]
+            assert (await repo.rollup_repo.get_rollup(seller.id)).wallet_recharge_total == 600
+
+    run(scenario())
+
+
+def test_batch_accept_with_insufficient_funds_changes_nothing(run, session_factory, make_user):
+    async def scenario():
+        async with session_factory() as session:
+            seller = await make_user(session, balance=250)
+            buyer = await make_user(session, seller)
+            invoices = [await _invoice(session, seller, buyer, amount) for amount in (100, 200)]
+            repo = WalletInvoiceRepository(WalletRechargeInvoiceModel, session)
+            # rollback داخل accept_invoices ویژگی‌های اشیای session را منقضی می‌کند
+            seller_id = seller.id
+
+            with pytest.raises(HTTPException) as exc:
+                await repo.accept_invoices(invoices, seller)
+            assert exc.value.status_code == 406
+
+            assert await repo.balance_repo.get_balance(seller_id) == 250
+            statuses = await session.scalars(
+                select(WalletRechargeInvoiceModel.status).where(WalletRechargeInvoiceModel.seller_user_id == seller_id)
+            )
+            assert set(statuses.all()) == {WalletInvoiceStatusChoices.WAITING}
+
+    run(scenario())
+
+
+def test_concurrent_debits_never_overdraw(run, session_factory, make_user):
+    async def debit(user_id: int):
+        async with session_factory() as session:
+            balance = await WalletBalanceRepository(UserCoreModel, session).debit(user_id, 30)
+            await session.commit()
+            return balance
+
+    async def scenario():
+        async with session_factory() as session:
+            user = await make_user(session, balance=100)
+
+        results = await asyncio.gather(*(debit(user.id) for _ in range(5)))
+        assert sorted(r for r in results if r is not None) == [10, 40, 70]
+        assert results.count(None) == 2
+
+        async with session_factory() as session:
+            balances = WalletBalanceRepository(UserCoreModel, session)
+            assert await balances.get_balance(user.id) == 10
+            entries = await _ledger(session, user.id)
+            assert [e.seq for e in entries] == [1, 2, 3, 4]
+            assert (await balances.ledger_repo.reconcile(user.id))["ok"]
+
+    run(scenario())
+
+
+def test_guarded_debit_rejects_negative_amounts(run, session_factory, make_user):
+    async def scenario():
+        async with session_factory() as session:
+            user = await make_user(session, balance=10)
+            balances = WalletBalanceRepository(UserCoreModel, session)
+            with pytest.raises(ValueError):
+                await balances.debit(user.id, -5)
+            with pytest.raises(ValueError):
+                await balances.debit_many(user.id, [(5, None), (-1, None)])
+            assert await balances.debit(user.id, 11) is None
+            assert await balances.get_balance(user.id) == 10
+
+    run(scenario())
+
+
+def test_ledger_snapshots_and_balance_at(run, session_factory, make_user, monkeypatch):
+    monkeypatch.setattr(WalletLedgerRepository, "snapshot_every", 3)
+
+    async def scenario():
+        async with session_factory() as session:
+            user = await make_user(session)
+            balances = WalletBalanceRepository(UserCoreModel, session)
+            for amount in (50, 20, 30, 40, 10):
+                await balances.credit(user.id, amount)
+            await balances.debit(user.id, 25)
+            await session.commit()
+
+            snapshots = (await session.scalars(
+                select(WalletBalanceSnapshotModel).where(WalletBalanceSnapshotModel.user_id == user.id)
+            )).all()
+            assert [(s.seq, s.balance) for s in snapshots] == [(3, 100), (6, 125)]
+            assert await balances.ledger_repo.balance_at(user.id) == 125
+            assert (await balances.ledger_repo.reconcile(user.id))["ok"]
+
+    run(scenario())